@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+""" Benchmarks for parts of the import, run without elasticsearch e.g.
+
+    python dataload/benchmark.py dates
+    python dataload/benchmark.py pipeline --grants 100000 --min-docs-per-sec 1000
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+
+import dateutil.parser as date_parser
+import elasticsearch.serializer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from dataload import date_utils # noqa
+from dataload import json_utils # noqa
+from dataload import import_to_elasticsearch # noqa
+from dataload.synthetic_data import SyntheticData # noqa
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.realpath(__file__)), "test_data")
+
+
+def test_data_files():
+    return sorted(glob.glob(os.path.join(TEST_DATA, "*.json")))
+
+
+def test_data_grants_files():
+    """ The test data files that are 360Giving packages, and their grants """
+    for path in test_data_files():
+        with open(path) as fp:
+            data = json.load(fp)
+        if isinstance(data, dict) and "grants" in data:
+            yield path, data["grants"]
+
+
+def test_data_grants():
+    for path, grants in test_data_grants_files():
+        yield from grants
+
+
+def grant_date_strings(grants):
+    """ The date strings the import parses for each grant """
+    for grant in grants:
+        yield grant.get("awardDate")
+        for dates in grant.get("plannedDates", []) + grant.get("actualDates", []):
+            yield dates.get("startDate")
+            yield dates.get("endDate")
+        try:
+            yield grant["additional_data"]["recipientOrgInfos"][0]["dateRegistered"]
+        except (KeyError, IndexError, TypeError):
+            pass
+
+
+def timed(function, values, repeat):
+    errors = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for value in values:
+            try:
+                function(value)
+            except (ValueError, TypeError, OverflowError):
+                errors += 1
+    return time.perf_counter() - start, errors
+
+
+def benchmark_dates(args):
+    values = list(grant_date_strings(test_data_grants()))
+    calls = len(values) * args.repeat
+    print("{} date strings ({} distinct), {} repeats".format(len(values), len(set(values)), args.repeat))
+
+    def dateutil_date_only(value):
+        return date_parser.parse(value).date().isoformat()
+
+    for name, function in [("dateutil", dateutil_date_only), ("date_utils", date_utils.date_only)]:
+        date_utils.cached_parse_date.cache_clear()
+        date_utils.date_only.cache_clear()
+        seconds, errors = timed(function, values, args.repeat)
+        print("{:<12} {:8.3f}s {:8.2f} us/date ({} errors)".format(name, seconds, seconds / calls * 1000000, errors))
+
+
+def benchmark_json(args):
+    files = [path for path, grants in test_data_grants_files()]
+    grants = list(test_data_grants())
+    print("{} files, {} grants, {} repeats".format(len(files), len(grants), args.repeat))
+
+    for name in json_utils.IJSON_BACKENDS:
+        try:
+            backend = json_utils.get_ijson_backend(name)
+        except ImportError:
+            print("{:<20} not available".format(name))
+            continue
+
+        def parse(path):
+            with open(path, "rb") as fp:
+                for grant in backend.items(fp, "grants.item"):
+                    pass
+
+        seconds, errors = timed(parse, files, args.repeat)
+        print("{:<20} {:8.3f}s {:8.2f} us/grant".format(name, seconds, seconds / (len(grants) * args.repeat) * 1000000))
+
+    for serializer in [elasticsearch.serializer.JSONSerializer(), json_utils.get_serializer()]:
+        seconds, errors = timed(serializer.dumps, grants, args.repeat)
+        print("{:<20} {:8.3f}s {:8.2f} us/grant ({} errors)".format(
+            type(serializer).__name__, seconds, seconds / (len(grants) * args.repeat) * 1000000, errors))
+
+
+class BulkSink(object):
+    """ Stands in for elasticsearch in the pipeline benchmark, accepting every
+    document it is sent without doing anything with it """
+
+    def __init__(self):
+        self.transport = type("Transport", (), {"serializer": json_utils.get_serializer()})()
+        self.requests = 0
+        self.bytes = 0
+
+    def bulk(self, body, index=None):
+        self.requests += 1
+        self.bytes += len(body)
+        # An action line and a source line for each document
+        return {"items": [{"index": {"status": 201}}] * (body.count("\n") // 2)}
+
+    def index(self, index, id, body):
+        pass
+
+
+def synthetic_grants_file(args, tmp_dir):
+    """ Write a synthetic grants file, loading the synthetic orgs into the org
+    directory as the import does from --funders and --recipients """
+    data = SyntheticData(args.seed)
+    for org_type, count in [("funder", args.funders), ("recipient", args.recipients)]:
+        orgs_path = os.path.join(tmp_dir, "{}s.jl".format(org_type))
+        data.write_orgs_file(orgs_path, count, org_type)
+        for org in import_to_elasticsearch.org_generator(orgs_path, org_type):
+            pass
+
+    extension = ".jsonl" if getattr(args, "jsonl", False) else ".json"
+    grants_path = os.path.join(tmp_dir, "synthetic-{}{}".format(args.seed, extension))
+    data.write_grants_file(grants_path, args.grants, args.funders, args.recipients)
+    return grants_path
+
+
+def check_docs_per_sec(args, docs, seconds):
+    docs_per_sec = docs / seconds if seconds else 0
+    print("{} grants in {:.1f}s, {:.0f} docs/sec".format(docs, seconds, docs_per_sec))
+    if args.min_docs_per_sec and docs_per_sec < args.min_docs_per_sec:
+        print("Slower than --min-docs-per-sec {}".format(args.min_docs_per_sec))
+        sys.exit(1)
+
+
+def benchmark_enrichment(args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        grants_path = synthetic_grants_file(args, tmp_dir)
+
+        docs = 0
+        start = time.perf_counter()
+        for grant in import_to_elasticsearch.grant_generator(grants_path, "benchmark"):
+            docs += 1
+        check_docs_per_sec(args, docs, time.perf_counter() - start)
+
+
+def benchmark_pipeline(args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        grants_path = synthetic_grants_file(args, tmp_dir)
+
+        sink = BulkSink()
+        start = time.perf_counter()
+        results = import_to_elasticsearch.import_grants(sink, [grants_path], args.workers, index_name="benchmark",
+                                                        make_es=BulkSink)
+        seconds = time.perf_counter() - start
+        print("{} bulk requests, {:.1f}MB".format(sink.requests, sink.bytes / 1024 / 1024))
+        check_docs_per_sec(args, results[grants_path][0], seconds)
+
+
+def add_synthetic_arguments(subparser):
+    subparser.add_argument("--grants", type=int, default=10000, help="number of synthetic grants")
+    subparser.add_argument("--funders", type=int, default=10, help="number of synthetic funders")
+    subparser.add_argument("--recipients", type=int, default=1000, help="number of synthetic recipients")
+    subparser.add_argument("--seed", type=int, default=0)
+    subparser.add_argument("--min-docs-per-sec", type=float,
+                           help="exit with an error if the grants are processed slower than this")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark parts of the 360 import")
+    subparsers = parser.add_subparsers(dest="benchmark")
+    subparsers.required = True
+
+    dates_parser = subparsers.add_parser("dates", help="date parsing in grant enrichment")
+    dates_parser.add_argument("--repeat", type=int, default=5)
+    dates_parser.set_defaults(function=benchmark_dates)
+
+    json_parser = subparsers.add_parser("json", help="parsing grants files and serializing bulk requests")
+    json_parser.add_argument("--repeat", type=int, default=5)
+    json_parser.set_defaults(function=benchmark_json)
+
+    enrichment_parser = subparsers.add_parser("enrichment", help="parsing and enriching synthetic grants")
+    add_synthetic_arguments(enrichment_parser)
+    enrichment_parser.set_defaults(function=benchmark_enrichment)
+
+    pipeline_parser = subparsers.add_parser("pipeline", help="the whole import of synthetic grants, "
+                                            "sent to a stand-in for elasticsearch")
+    add_synthetic_arguments(pipeline_parser)
+    pipeline_parser.add_argument("--workers", type=int, default=1, help="number of worker processes, see --workers")
+    pipeline_parser.add_argument("--jsonl", action="store_true",
+                                 help="write the synthetic grants as JSON Lines, which workers can split")
+    pipeline_parser.set_defaults(function=benchmark_pipeline)
+
+    args = parser.parse_args()
+    args.function(args)
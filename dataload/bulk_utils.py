@@ -0,0 +1,166 @@
+import gzip
+import os
+import time
+
+import elasticsearch
+import elasticsearch.serializer
+
+# Batch sizes are in (approximately) bytes of bulk request body
+DEFAULT_BATCH_BYTES = 5 * 1024 * 1024
+MIN_BATCH_BYTES = 256 * 1024
+MAX_BATCH_BYTES = 50 * 1024 * 1024
+
+# Aim for bulk requests that take about this long
+TARGET_BATCH_SECONDS = 3
+
+# Document keys that go in the bulk action line rather than the document
+ACTION_METADATA = ("_index", "_id", "_routing")
+
+
+def action_lines(doc, dumps):
+    """ The bulk action and source lines for a document, like
+    elasticsearch.helpers.expand_action. Metadata that is None, e.g. an _index
+    that is given with the bulk request instead, is left out """
+    doc = doc.copy()
+    op_type = doc.pop("_op_type", "index")
+    metadata = {key: doc.pop(key) for key in ACTION_METADATA if key in doc}
+    metadata = {key: value for key, value in metadata.items() if value is not None}
+
+    if op_type == "delete":
+        return dumps({op_type: metadata}) + "\n"
+    return dumps({op_type: metadata}) + "\n" + dumps(doc) + "\n"
+
+
+def write_bulk_file(path, docs, dumps=elasticsearch.serializer.JSONSerializer().dumps):
+    """ Write the bulk action lines for docs to a gzipped NDJSON file, which can
+    be loaded later with read_bulk_file. Returns the number of documents """
+    count = 0
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as fp:
+        for doc in docs:
+            fp.write(action_lines(doc, dumps))
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+
+def read_bulk_file(path):
+    """ The bulk action lines for each document in a file from write_bulk_file,
+    ready for AdaptiveBulkSender.send_lines. Every document is an index
+    action, so each one is an action line followed by a source line """
+    with gzip.open(path, "rt", encoding="utf-8") as fp:
+        for action, source in zip(fp, fp):
+            yield action + source
+
+
+class AdaptiveBulkSender(object):
+    """ Sends documents to elasticsearch using the bulk API, in batches of a
+    number of bytes rather than a number of documents because grants vary
+    so much in size.
+
+    The batch size adapts: it shrinks when a bulk request is slower than
+    TARGET_BATCH_SECONDS or elasticsearch rejects documents (429 Too Many
+    Requests), and grows when requests are fast. Rejected documents are retried
+    up to max_retries times with an exponential backoff starting at
+    initial_backoff seconds, in the same way as elasticsearch.helpers.bulk.
+    """
+
+    def __init__(self, es, index_name=None, batch_bytes=DEFAULT_BATCH_BYTES, max_retries=10, initial_backoff=5,
+                 verbose=True):
+        self.es = es
+        self.index_name = index_name
+        self.batch_bytes = batch_bytes
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.rejections = 0
+        self.verbose = verbose
+
+    def send(self, docs, on_batch=None):
+        """ Send an iterable of documents.
+        Returns (number of successful documents, list of errors) like
+        elasticsearch.helpers.bulk(..., raise_on_error=False)
+
+        on_batch(docs, success, errors) is called after each bulk request with
+        the number of documents from the start of docs that have been sent.
+        """
+        dumps = self.es.transport.serializer.dumps
+        return self.send_lines((action_lines(doc, dumps) for doc in docs), on_batch)
+
+    def send_lines(self, lines, on_batch=None):
+        """ Send already serialized bulk action lines, see action_lines """
+        sent = 0
+        success = 0
+        errors = []
+        batch = []
+        batch_size = 0
+        start = time.perf_counter()
+
+        for line in lines:
+            batch.append(line)
+            batch_size += len(line)
+            if batch_size >= self.batch_bytes:
+                success += self.send_batch(batch, errors)
+                sent += len(batch)
+                if on_batch:
+                    on_batch(sent, success, errors)
+                batch = []
+                batch_size = 0
+        if batch:
+            success += self.send_batch(batch, errors)
+            sent += len(batch)
+            if on_batch:
+                on_batch(sent, success, errors)
+
+        seconds = time.perf_counter() - start
+        if self.verbose:
+            print("{} docs in {:.1f}s, {:.0f} docs/sec, {} rejections, batch size {}KB".format(
+                success, seconds, success / seconds if seconds else 0, self.rejections, self.batch_bytes // 1024
+            ))
+        return success, errors
+
+    def send_batch(self, batch, errors):
+        """ Send one bulk request, retrying rejected documents. Returns the
+        number of successful documents and appends any errors to errors """
+        success = 0
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.initial_backoff * 2 ** (attempt - 1))
+
+            start = time.perf_counter()
+            try:
+                response = self.es.bulk(body="".join(batch), index=self.index_name)
+            except elasticsearch.TransportError as e:
+                if e.status_code != 429 or attempt == self.max_retries:
+                    raise
+                # The whole request was rejected
+                self.rejections += len(batch)
+                self.adapt(time.perf_counter() - start, rejected=True)
+                continue
+
+            rejected = []
+            for line, item in zip(batch, response["items"]):
+                result = list(item.values())[0]
+                if 200 <= result["status"] < 300:
+                    success += 1
+                elif result["status"] == 429 and attempt < self.max_retries:
+                    rejected.append(line)
+                else:
+                    errors.append(item)
+
+            self.rejections += len(rejected)
+            self.adapt(time.perf_counter() - start, rejected=bool(rejected))
+
+            if not rejected:
+                break
+            batch = rejected
+
+        return success
+
+    def adapt(self, seconds, rejected=False):
+        if rejected:
+            self.batch_bytes = max(MIN_BATCH_BYTES, self.batch_bytes // 2)
+        elif seconds > TARGET_BATCH_SECONDS:
+            self.batch_bytes = max(MIN_BATCH_BYTES, int(self.batch_bytes * 0.75))
+        elif seconds < TARGET_BATCH_SECONDS / 2:
+            self.batch_bytes = min(MAX_BATCH_BYTES, int(self.batch_bytes * 1.25))
@@ -1,21 +1,69 @@
 #!/usr/bin/env python3
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import reindex
 
 import argparse
+import os
+import sys
+import time
 
-from import_to_elasticsearch import maybe_create_index
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 
+from dataload.import_to_elasticsearch import maybe_create_index, bulk_load_settings, store_index_generation, \
+    ELASTICSEARCH_HOST # noqa
 
-def copy_es_index(index_source, index_destination):
-    es = Elasticsearch()
+# Seconds between checks on the progress of the reindex
+POLL_INTERVAL = 10
 
+
+def copy_es_index(es, index_source, index_destination, requests_per_second=None):
+    """ Copy index_source to index_destination, replacing it. Raises an
+    Exception if the reindex task fails or the copy ends up missing
+    documents. The copy is then given a new generation, rather than
+    the source's generation document that the reindex copied. """
     # Delete and create target index
     es.indices.delete(index=index_destination, ignore=[404])
     maybe_create_index(index_destination)
 
-    reindex(es, source_index=index_source, target_index=index_destination,
-            chunk_size=500)
+    with bulk_load_settings(es, index_destination, full_load=True):
+        # The copy is done by elasticsearch, in parallel slices, as a task
+        task_id = es.reindex(body={"source": {"index": index_source}, "dest": {"index": index_destination}},
+                             wait_for_completion=False, slices="auto",
+                             requests_per_second=requests_per_second)["task"]
+        print("Reindex task {}".format(task_id))
+
+        task = wait_for_task(es, task_id)
+
+        # Checked before leaving bulk_load_settings, so that a failed copy
+        # isn't merged
+        response = task.get("response", {})
+        if task.get("error") or response.get("failures") or response.get("canceled"):
+            raise Exception("Reindex failed: {}".format(
+                task.get("error") or response.get("failures", [])[:10] or response["canceled"]))
+
+    source_docs = es.count(index=index_source)["count"]
+    destination_docs = es.count(index=index_destination)["count"]
+    # The reindex replaces the generation document maybe_create_index gave the
+    # copy with the source's, so the copy only has an extra document when the
+    # source was loaded before generations were stored
+    if destination_docs < source_docs:
+        raise Exception("Copied {} documents of {} from {} to {}".format(destination_docs, source_docs, index_source,
+                                                                     index_destination))
+    print("Copied {} documents in {:.0f}s".format(response.get("created", 0) + response.get("updated", 0),
+                                                 response.get("took", 0) / 1000))
+    store_index_generation(es, index_destination)
+
+
+def wait_for_task(es, task_id):
+    """ Wait for an elasticsearch task to finish, printing its progress """
+    while True:
+        task = es.tasks.get(task_id=task_id)
+        if task["completed"]:
+            return task
+
+        status = task["task"]["status"]
+        done = status["created"] + status["updated"] + status["deleted"]
+        print("{}/{} documents".format(done, status["total"]))
+        time.sleep(POLL_INTERVAL)
 
 
 if __name__ == "__main__":
@@ -24,7 +72,10 @@ if __name__ == "__main__":
 
     parser.add_argument("index_destination", type=str,
                         help="Destination index name")
+    parser.add_argument("--requests-per-second", type=float,
+                        help="Throttle the copy to this many documents a second")
 
     args = parser.parse_args()
 
-    copy_es_index(args.index_source.strip(), args.index_destination.strip())
+    es = Elasticsearch(hosts=[ELASTICSEARCH_HOST])
+    copy_es_index(es, args.index_source.strip(), args.index_destination.strip(), args.requests_per_second)
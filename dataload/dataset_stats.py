@@ -0,0 +1,74 @@
+import collections
+
+from dataload.date_utils import date_only
+
+# The number of funders kept, the same as the datasets page aggregation did
+TOP_FUNDERS = 10
+
+
+class DatasetStats(object):
+    """ Statistics about the grants in a file, collected as the grants are
+    imported and stored in a "dataset" document so that the datasets and
+    publisher pages don't need an aggregation per dataset """
+
+    def __init__(self):
+        self.grants = 0
+        self.funders = collections.Counter()
+        self.min_award_date = None
+        self.max_award_date = None
+        # currency -> total amountAwarded
+        self.amounts = collections.Counter()
+
+    def add(self, grant):
+        """ Add an enriched grant """
+        self.grants += 1
+        try:
+            self.funders[grant["fundingOrganization"][0]["id_and_name"]] += 1
+        except (KeyError, IndexError, TypeError):
+            pass
+
+        try:
+            award_date = date_only(grant["awardDate"])
+        except (KeyError, ValueError, TypeError, OverflowError):
+            award_date = None
+        if award_date:
+            if not self.min_award_date or award_date < self.min_award_date:
+                self.min_award_date = award_date
+            if not self.max_award_date or award_date > self.max_award_date:
+                self.max_award_date = award_date
+
+        try:
+            self.amounts[grant["currency"]] += float(grant["amountAwarded"])
+        except (KeyError, ValueError, TypeError):
+            pass
+
+    def merge(self, other):
+        self.grants += other.grants
+        self.funders.update(other.funders)
+        self.amounts.update(other.amounts)
+        for award_date in (other.min_award_date, other.max_award_date):
+            if award_date:
+                if not self.min_award_date or award_date < self.min_award_date:
+                    self.min_award_date = award_date
+                if not self.max_award_date or award_date > self.max_award_date:
+                    self.max_award_date = award_date
+
+    def top_funders(self):
+        """ The id_and_name of the funders with the most grants, ordered like
+        a terms aggregation """
+        funders = sorted(self.funders.items(), key=lambda item: (-item[1], item[0]))
+        return [id_and_name for id_and_name, count in funders[:TOP_FUNDERS]]
+
+    def document(self, filename):
+        return {
+            "dataType": "dataset",
+            "filename": filename,
+            # Not indexed, see the mapping in maybe_create_index
+            "datasetStats": {
+                "grants": self.grants,
+                "funders": self.top_funders(),
+                "minAwardDate": self.min_award_date,
+                "maxAwardDate": self.max_award_date,
+                "amountAwarded": dict(self.amounts),
+            },
+        }
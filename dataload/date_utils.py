@@ -0,0 +1,42 @@
+import datetime
+import functools
+
+import dateutil.parser as date_parser
+
+# Lots of grants share the same dates
+DATE_CACHE_SIZE = 65536
+
+
+def parse_iso_date(value):
+    """ Parse the ISO 8601 dates that almost all grants use, e.g. 2018-01-31 or
+    2018-01-31T00:00:00+00:00. Raises ValueError for anything else """
+    if len(value) < 10 or value[4] != "-" or value[7] != "-" or (len(value) > 10 and value[10] not in "T "):
+        raise ValueError("Not an ISO 8601 date")
+    if value[-1] == "Z":
+        value = value[:-1] + "+00:00"
+    return datetime.datetime.fromisoformat(value)
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def cached_parse_date(value):
+    try:
+        return parse_iso_date(value)
+    except ValueError:
+        return date_parser.parse(value)
+
+
+def parse_date(value, ignoretz=False):
+    """ Equivalent to dateutil.parser.parse, but ISO 8601 dates are parsed
+    quickly and results are cached. Raises ValueError (ParserError) or TypeError
+    in the same cases as dateutil.
+    """
+    datetime_ = cached_parse_date(value)
+    if ignoretz:
+        return datetime_.replace(tzinfo=None)
+    return datetime_
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def date_only(value):
+    """ The date part of a date string in ISO format e.g. 2018-01-31 """
+    return parse_date(value).date().isoformat()
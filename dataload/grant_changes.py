@@ -0,0 +1,64 @@
+import hashlib
+import itertools
+import json
+
+from dataload.bulk_utils import ACTION_METADATA
+
+# Number of grants whose stored hashes are fetched in one request
+HASH_BATCH_SIZE = 1000
+
+
+def content_hash(doc):
+    """ A hash of an enriched grant document that only changes when its content
+    does, whatever order its keys are in. The bulk metadata is left out. """
+    content = {key: value for key, value in doc.items() if key not in ACTION_METADATA and key != "contentHash"}
+    return hashlib.sha1(
+        json.dumps(content, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def stored_hashes(es, index_name, ids):
+    """ The contentHash of each of the documents with ids that are in the index """
+    response = es.mget(index=index_name, body={"ids": ids}, _source_includes=["contentHash"])
+    return {doc["_id"]: doc["_source"].get("contentHash") for doc in response["docs"] if doc.get("found")}
+
+
+class ChangedGrants(object):
+    """ Filters the grants being loaded into an existing index down to the ones
+    that are new or have changed since they were loaded, by comparing their
+    content hashes with the ones stored in the index, a batch at a time.
+
+    The ids of all the grants are kept so that grants that are no longer in
+    the file can be deleted afterwards.
+    """
+
+    def __init__(self, es, index_name, batch_size=HASH_BATCH_SIZE):
+        self.es = es
+        self.index_name = index_name
+        self.batch_size = batch_size
+        self.ids = set()
+        self.unchanged = 0
+        # The number of grants read up to each changed grant, see grants_read
+        self.positions = []
+
+    def filter(self, grants):
+        grants = iter(grants)
+        read = 0
+        while True:
+            batch = list(itertools.islice(grants, self.batch_size))
+            if not batch:
+                break
+            hashes = stored_hashes(self.es, self.index_name, [grant["_id"] for grant in batch])
+            for grant in batch:
+                read += 1
+                self.ids.add(grant["_id"])
+                if hashes.get(grant["_id"]) == grant["contentHash"]:
+                    self.unchanged += 1
+                else:
+                    self.positions.append(read)
+                    yield grant
+
+    def grants_read(self, sent):
+        """ How many grants had been read when the first sent changed grants
+        were, i.e. how far through the file is loaded """
+        return self.positions[sent - 1] if sent else 0
@@ -0,0 +1,57 @@
+import gzip
+import os
+
+from dataload.json_utils import ijson
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Grants files are 360Giving JSON packages ({"grants": [...]}) or JSON Lines
+# of grants, either of which can be compressed
+JSON_EXTENSIONS = (".json", ".jsonl")
+COMPRESSION_EXTENSIONS = ("", ".gz", ".zst")
+
+
+def split_grants_file_name(path):
+    """ Returns (identifier, JSON extension, compression extension) for a
+    grants file e.g. ("a002400000KeYdsAAF", ".json", ".gz"), or None if it
+    isn't a grants file """
+    name = os.path.basename(path)
+    for compression in COMPRESSION_EXTENSIONS:
+        for extension in JSON_EXTENSIONS:
+            if name.endswith(extension + compression):
+                return name[:-len(extension + compression)], extension, compression
+    return None
+
+
+def is_grants_file(path):
+    return split_grants_file_name(path) is not None
+
+
+def grants_file_name(path):
+    """ The name stored in the grants' filename field. This is always
+    <identifier>.json however the file is stored, so that it matches the
+    dataset identifiers in the provenance data """
+    return split_grants_file_name(path)[0] + ".json"
+
+
+def open_grants_file(path):
+    """ Open a grants file for reading, decompressing it as it is read """
+    identifier, extension, compression = split_grants_file_name(path)
+    if compression == ".gz":
+        return gzip.open(path, "rb")
+    if compression == ".zst":
+        if zstandard is None:
+            raise Exception("The zstandard package is needed to read {}".format(path))
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True)
+    return open(path, "rb")
+
+
+def iter_grants(fp, path):
+    """ The grants in an open grants file, streamed with ijson """
+    identifier, extension, compression = split_grants_file_name(path)
+    if extension == ".jsonl":
+        return ijson.items(fp, '', multiple_values=True)
+    return ijson.items(fp, 'grants.item')
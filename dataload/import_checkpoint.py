@@ -0,0 +1,41 @@
+import json
+import os
+
+# Progress of a file that hasn't been started
+NOT_STARTED = {"grants": 0, "success": 0, "errors": [], "done": False}
+
+
+class ImportCheckpoint(object):
+    """ Progress of an import, saved after every bulk request that elasticsearch
+    acknowledges, so that an import that died part way through can be resumed.
+
+    For each file it records how many grants from the start of the file have
+    been sent, the bulk success count and errors so far, and whether the file
+    is finished. Files are keyed on the grants' filename field.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as fp:
+                checkpoint = json.load(fp)
+        except FileNotFoundError:
+            checkpoint = {}
+        self.index = checkpoint.get("index")
+        self.files = checkpoint.get("files", {})
+
+    def reset(self, index_name):
+        self.index = index_name
+        self.files = {}
+
+    def progress(self, filename):
+        return self.files.get(filename, NOT_STARTED)
+
+    def update(self, filename, grants, success, errors, done=False):
+        self.files[filename] = {"grants": grants, "success": success, "errors": errors, "done": done}
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump({"index": self.index, "files": self.files}, fp)
+        os.replace(tmp_path, self.path)
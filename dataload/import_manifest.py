@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+
+from dataload.grants_files import grants_file_name
+
+
+def file_info(path):
+    """ Size and sha256 checksum of a file """
+    checksum = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(1024 * 1024), b""):
+            checksum.update(block)
+    return {"size": os.path.getsize(path), "sha256": checksum.hexdigest()}
+
+
+class ImportManifest(object):
+    """ Record of the files loaded into an index, so that the next import
+    only needs to process the files that were added, changed or removed.
+
+    Files are keyed on the grants' filename field, see grants_file_name.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as fp:
+                manifest = json.load(fp)
+        except FileNotFoundError:
+            manifest = {}
+        self.files = manifest.get("files", {})
+        self.orgs = manifest.get("orgs", {})
+
+    def reset(self):
+        self.files = {}
+        self.orgs = {}
+
+    def orgs_changed(self, org_files):
+        """ The canonical org names/ids in every grant come from the funders and
+        recipients files so if those change all the grants need re-processing """
+        org_files = {data_type: path for data_type, path in org_files.items() if path}
+        infos = {data_type: file_info(path) for data_type, path in org_files.items()}
+        changed = any(self.orgs.get(data_type) != info for data_type, info in infos.items())
+        self.orgs.update(infos)
+        return changed
+
+    def changes(self, paths):
+        """ Returns ([(path, info)] to import, [(path, info)] unchanged, [filename] removed) """
+        to_import = []
+        unchanged = []
+        seen = set()
+        for path in paths:
+            filename = grants_file_name(path)
+            seen.add(filename)
+            info = file_info(path)
+            previous = self.files.get(filename)
+            if previous and previous["size"] == info["size"] and previous["sha256"] == info["sha256"]:
+                unchanged.append((path, info))
+            else:
+                to_import.append((path, info))
+        removed = [filename for filename in self.files if filename not in seen]
+        return to_import, unchanged, removed
+
+    def record(self, path, info, grants):
+        self.files[grants_file_name(path)] = dict(info, grants=grants)
+
+    def remove(self, filename):
+        self.files.pop(filename, None)
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump({"files": self.files, "orgs": self.orgs}, fp, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
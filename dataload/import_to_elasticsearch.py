@@ -1,19 +1,23 @@
 #!/usr/bin/env python3
 import argparse
+import collections
+import contextlib
+import io
+import itertools
 import json
+import multiprocessing
 import shutil
 import uuid
 import tempfile
 import os
+import re
 from pprint import pprint
 import warnings
 import elasticsearch.helpers
 import time
-import ijson
 import dateutil.parser as date_parser
 import sys
 
-from django.core.cache import cache
 import django
 
 
@@ -23,11 +27,87 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 django.setup()
 
 from grantnav.frontend.org_utils import new_ordered_names, new_org_ids, get_org, OrgNotFoundError # noqai
+from grantnav.frontend.org_table import OrgTableWriter # noqa
+from grantnav.index import INDEX_GENERATION_ID, forget_index_generation # noqa
+from dataload.org_directory import OrgDirectory # noqa
+from dataload.import_manifest import ImportManifest # noqa
+from dataload.date_utils import parse_date, date_only # noqa
+from dataload.bulk_utils import AdaptiveBulkSender, write_bulk_file, ACTION_METADATA # noqa
+from dataload.import_checkpoint import ImportCheckpoint, NOT_STARTED # noqa
+from dataload.grants_files import is_grants_file, grants_file_name, open_grants_file, iter_grants, \
+    split_grants_file_name # noqa
+from dataload.json_utils import ijson, ijson_backend_name, get_serializer # noqa
+from dataload.dataset_stats import DatasetStats # noqa
+from dataload.grant_changes import ChangedGrants, content_hash # noqa
 
 
 ES_INDEX = os.environ.get("ES_INDEX", "threesixtygiving")
 ELASTICSEARCH_HOST = os.environ.get("ELASTICSEARCH_HOST", "localhost")
 
+# Namespace for the document ids. Ids are derived from the data so that
+# re-importing a grant or org overwrites the existing document.
+DOC_ID_NAMESPACE = uuid.UUID("282cc6dd-25a8-4dd3-97c5-ddac4157d168")
+
+# orgID -> canonical org lookup, filled from the --funders/--recipients files
+org_directory = OrgDirectory()
+
+# Number of index generations kept by --build, including the one just built
+DEFAULT_KEEP_GENERATIONS = 2
+
+BUILD_NEEDS_ORGS = "--build needs --funders and --recipients, the new index only has the orgs loaded into it"
+
+# A newly built index with fewer grants than this fraction of the live index
+# is assumed to be a broken load and is not switched to
+MIN_GRANTS_RATIO = 0.5
+
+# Index settings used while loading a new or unpublished index, see
+# bulk_load_settings
+BULK_LOAD_SETTINGS = {
+    "index.refresh_interval": "-1",
+    "index.number_of_replicas": "0",
+    "index.translog.durability": "async",
+}
+
+# Index settings used while loading into an index that may be live, which
+# keeps its replicas and durable translog
+LIVE_LOAD_SETTINGS = {
+    "index.refresh_interval": "-1",
+}
+
+# Merging a whole index can take a long time
+FORCEMERGE_TIMEOUT = 60 * 60
+
+# Number of grants from an uncompressed JSON Lines file read by a worker process at a time when importing with
+# --workers
+DEFAULT_CHUNK_SIZE = 1000
+
+# Fields of the funder -> recipient rollup documents, see build_rollups
+ROLLUP_MAPPING = {
+    "properties": {
+        "funderIdAndName": {"type": "keyword"},
+        "recipientIdAndName": {"type": "keyword"},
+        "recipientName": {"type": "text", "analyzer": "english_with_folding"},
+        "currency": {"type": "keyword"},
+        "fundingOrgIds": {"type": "keyword"},
+        "recipientOrgIds": {"type": "keyword"},
+        "count": {"type": "long"},
+        "sum": {"type": "double"},
+        "min": {"type": "double"},
+        "max": {"type": "double"},
+        "avg": {"type": "double"},
+        "minAwardDate": {"type": "keyword"},
+        "maxAwardDate": {"type": "keyword"},
+        "generation": {"type": "keyword"},
+    }
+}
+
+# Number of rollups fetched from the composite aggregation at a time
+ROLLUP_PAGE_SIZE = 1000
+
+# Id of the document holding the results of the empty search and the home
+# page totals, see store_search_summary
+SEARCH_SUMMARY_ID = "search-summary"
+
 
 def maybe_create_index(index_name=ES_INDEX):
     """ Creates a new ES index based on value of ES_INDEX
@@ -48,6 +128,12 @@ def maybe_create_index(index_name=ES_INDEX):
             "dataType": {"type": "keyword"},
             "id": {"type": "keyword"},
             "filename": {"type": "keyword"},
+            "contentHash": {"type": "keyword"},
+            # Statistics in the dataset documents, see dataset_stats.py
+            "datasetStats": {"type": "object", "enabled": False},
+            "rollup": ROLLUP_MAPPING,
+            # Precomputed results in the search summary document
+            "searchSummary": {"type": "object", "enabled": False},
             "title": {
                 "type": "text", "analyzer": "english_with_folding"
             },
@@ -304,6 +390,10 @@ def maybe_create_index(index_name=ES_INDEX):
             "orgIDs": {
                 "type": "keyword"
             },
+            # The org's position in its funders/recipients file, see org_generator
+            "orgOrder": {
+                "type": "integer"
+            },
             "aggregate": {
                 "properties": {
                     "grants": {"type": "double"},
@@ -377,6 +467,9 @@ def maybe_create_index(index_name=ES_INDEX):
             raise Exception("Creating index failed")
     else:
         pprint(result)
+        # So that GrantNav's caches can tell the new index apart from the one
+        # it replaces as soon as it is created
+        store_index_generation(es, index_name)
 
     # set cluster level settings
 
@@ -385,115 +478,765 @@ def maybe_create_index(index_name=ES_INDEX):
     }})
 
 
-def import_to_elasticsearch(files, clean, recipients=None, funders=None):
+def import_to_elasticsearch(files, clean, recipients=None, funders=None, workers=1, chunk_size=DEFAULT_CHUNK_SIZE,
+                            manifest_path=None, build=False, keep=DEFAULT_KEEP_GENERATIONS, bulk_settings=True,
+                            checkpoint_path=None, resume=False, org_table_path=None):
 
-    es = elasticsearch.Elasticsearch(hosts=[ELASTICSEARCH_HOST])
-    # Clear any query caches
-    print("clearing caches")
-    cache.clear()
+    if build and not (recipients and funders):
+        # The new index would have no orgs once it is published, and the
+        # grants' canonical orgs would come from the old index
+        raise Exception(BUILD_NEEDS_ORGS)
+
+    es = elasticsearch.Elasticsearch(hosts=[ELASTICSEARCH_HOST], serializer=get_serializer())
+    print("Parsing with the ijson {} backend, serializing with {}".format(
+        ijson_backend_name(ijson), type(es.transport.serializer).__name__))
+
+    if build:
+        # Load into a new index, ES_INDEX becomes an alias that is switched
+        # over to it once it is loaded.
+        index_name = "{}_{}".format(ES_INDEX, time.strftime("%Y%m%d%H%M%S"))
+        print("Building index {}".format(index_name))
+    else:
+        index_name = ES_INDEX
+
+    checkpoint = None
+    if checkpoint_path:
+        checkpoint = ImportCheckpoint(checkpoint_path)
+        if resume and checkpoint.index:
+            # Carry on loading into the same index, e.g. the one being built
+            index_name = checkpoint.index
+            print("Resuming import into {}".format(index_name))
+        else:
+            resume = False
+            checkpoint.reset(index_name)
+            checkpoint.save()
 
     # Delete the index
-    if clean:
-        result = es.indices.delete(index=ES_INDEX, ignore=[404])
+    if clean and not build and not resume:
+        result = es.indices.delete(index=index_name, ignore=[404])
         pprint(result)
 
-    maybe_create_index()
+    maybe_create_index(index_name)
     # Allow the server to settle
     time.sleep(1)
 
-    # Load the organisations data
-    def org_generator(filename, data_type):
-        with open(filename) as f:
-            for obj in ijson.items(f, '', multiple_values=True):
-                obj['dataType'] = data_type
-                obj['_id'] = str(uuid.uuid4())
-                obj['_index'] = ES_INDEX
-                obj['currency'] = list(obj["aggregate"]["currencies"].keys())
-                obj['organizationName'] = " ".join(new_ordered_names(obj))
-                obj['orgIDs'] = new_org_ids(obj)
-                yield obj
-
-    if recipients:
-        result = elasticsearch.helpers.bulk(es, org_generator(recipients, 'recipient'), raise_on_error=False, max_retries=10, initial_backoff=5)
-        print(result)
-    if funders:
-        result = elasticsearch.helpers.bulk(es, org_generator(funders, 'funder'), raise_on_error=False, max_retries=10, initial_backoff=5)
+    with bulk_load_settings(es, index_name, bulk_settings, full_load=clean or build):
+        org_table = OrgTableWriter() if org_table_path and (recipients or funders) else None
+        import_orgs(es, recipients, funders, index_name, org_table)
+
+        files = list(importable_files(files))
+
+        manifest = None
+        if manifest_path:
+            manifest = ImportManifest(manifest_path)
+            # Grants from files that were started before resuming were already
+            # deleted by the previous run
+            started = set(checkpoint.files) if resume else set()
+            files, file_infos = select_manifest_files(es, manifest, files, clean or build, recipients, funders, index_name,
+                                                      started)
+
+        # Load the grants data
+        results = import_grants(es, files, workers, chunk_size, index_name, checkpoint,
+                                incremental=not (clean or build))
+
+        build_rollups(es, index_name)
+        store_search_summary(es, index_name)
+        store_index_generation(es, index_name)
+
+        if manifest:
+            for grants_file_path, (success, errors) in results.items():
+                # Files with errors are left out so that they are tried again
+                if not errors:
+                    manifest.record(grants_file_path, file_infos[grants_file_path], success)
+            manifest.save()
+
+    if build:
+        publish_index(es, ES_INDEX, index_name, results, keep)
+
+    # Written once the orgs are live
+    if org_table:
+        print("Wrote {} org ids to the org table {}".format(org_table.write(org_table_path), org_table_path))
+
+
+def org_generator(filename, data_type, index_name=ES_INDEX):
+    """ The org documents from a funders or recipients file, adding each org to
+    the org directory used to find canonical orgs for the grants. Each org
+    stores its position in the file (orgOrder) so that searches for an org id
+    can pick the same org as the org directory: the first one loaded. """
+    org_directory.mark_loaded(data_type)
+    with open(filename, 'rb') as f:
+        for position, obj in enumerate(ijson.items(f, '', multiple_values=True)):
+            org_directory.add(obj, data_type)
+            obj['orgOrder'] = position
+            obj['dataType'] = data_type
+            obj['_id'] = org_doc_id(obj['id'], data_type)
+            obj['_index'] = index_name
+            obj['currency'] = list(obj["aggregate"]["currencies"].keys())
+            obj['organizationName'] = " ".join(new_ordered_names(obj))
+            obj['orgIDs'] = new_org_ids(obj)
+            yield obj
+
+
+def import_orgs(es, recipients, funders, index_name=ES_INDEX, org_table=None):
+    """ Load the organisations data, also adding the orgs to org_table (an
+    OrgTableWriter) if given """
+    sender = AdaptiveBulkSender(es)
+    for filename, data_type in [(recipients, 'recipient'), (funders, 'funder')]:
+        if not filename:
+            continue
+        orgs = org_generator(filename, data_type, index_name)
+        if org_table:
+            orgs = org_table_generator(orgs, data_type, org_table)
+        result = sender.send(orgs)
         print(result)
+    if recipients or funders:
+        print("{} org ids in the org directory".format(len(org_directory)))
+        # Make the orgs searchable for get_org even when refreshes are off
+        es.indices.refresh(index=index_name)
+
+
+def org_table_generator(orgs, data_type, org_table):
+    """ Add the org documents to the org table as they are loaded """
+    for org in orgs:
+        org_table.add({key: value for key, value in org.items() if key not in ACTION_METADATA}, data_type)
+        yield org
+
+
+def write_bulk_files(files, bulk_dir, recipients=None, funders=None):
+    """ Write the enriched orgs and grants to gzipped NDJSON bulk files in
+    bulk_dir, one per input file, for ingest_bulk_files.py to load later.
+    The documents have no _index, it is chosen when they are loaded. """
+    os.makedirs(bulk_dir, exist_ok=True)
+    dumps = get_serializer().dumps
+
+    for data_type, filename in (('recipient', recipients), ('funder', funders)):
+        if filename:
+            bulk_path = os.path.join(bulk_dir, "orgs-{}s.ndjson.gz".format(data_type))
+            print("{} {} docs".format(bulk_path, write_bulk_file(bulk_path, org_generator(filename, data_type, None), dumps)))
+
+    for grants_file_path in importable_files(files):
+        filename = os.path.splitext(grants_file_name(grants_file_path))[0]
+        bulk_path = os.path.join(bulk_dir, "{}.ndjson.gz".format(filename))
+        dataset_stats = DatasetStats()
+
+        def dataset_document():
+            # After all the grants have been through dataset_stats
+            yield dict(dataset_stats.document(grants_file_name(grants_file_path)),
+                       _id=dataset_doc_id(grants_file_name(grants_file_path)))
+
+        docs = itertools.chain(grant_generator(grants_file_path, None, dataset_stats=dataset_stats), dataset_document())
+        print("{} {} docs".format(bulk_path, write_bulk_file(bulk_path, docs, dumps)))
+
+
+def select_manifest_files(es, manifest, files, full_load, recipients, funders, index_name=ES_INDEX, started=()):
+    """ Use the manifest to find which files need importing, deleting the grants
+    from removed files. Returns the files and a dict of their info """
+    if full_load:
+        manifest.reset()
+    to_import, unchanged, removed = manifest.changes(files)
+    if manifest.orgs_changed({"funder": funders, "recipient": recipients}):
+        print("Org data changed, all grants files will be imported")
+        to_import, unchanged = to_import + unchanged, []
+    print("{} new or changed files, {} unchanged files, {} removed files".format(len(to_import), len(unchanged), len(removed)))
+
+    # Remove the grants from files that are gone. Grants that have gone from
+    # changed files are deleted once the file is imported, see
+    # delete_vanished_grants
+    for filename in removed:
+        if not full_load and filename not in started:
+            delete_file_grants(es, filename, index_name)
+        manifest.remove(filename)
+    for path, info in to_import:
+        manifest.remove(grants_file_name(path))
+    manifest.save()
+
+    return [path for path, info in to_import], dict(to_import)
+
+
+@contextlib.contextmanager
+def bulk_load_settings(es, index_name, enabled=True, full_load=False):
+    """ Switch the index to settings suited to bulk loading for the duration of
+    the load. A full load (a new index, or one being built that isn't
+    published yet) has no refreshes, no replicas and an async translog. Other
+    loads may be into the live index, so they only turn off refreshes.
+    Afterwards the previous settings are restored, even if the load failed,
+    and the index is merged and refreshed.
+    """
+    if not enabled:
+        yield
+        return
+
+    load_settings = BULK_LOAD_SETTINGS if full_load else LIVE_LOAD_SETTINGS
+    result = es.indices.get_settings(index=index_name, name=",".join(load_settings), flat_settings=True)
+    # Settings left at their defaults aren't returned, restoring them to None
+    # resets them.
+    previous_settings = {name: None for name in load_settings}
+    for index_settings in result.values():
+        previous_settings.update(index_settings["settings"])
 
-    # Load the grants data
+    print("Using bulk load settings")
+    es.indices.put_settings(index=index_name, body=load_settings)
+    try:
+        yield
+    finally:
+        print("Restoring index settings")
+        pprint(previous_settings)
+        es.indices.put_settings(index=index_name, body=previous_settings)
+
+    if full_load:
+        # Nothing else will be written to a fully loaded index for a while
+        es.indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=FORCEMERGE_TIMEOUT)
+    else:
+        es.indices.forcemerge(index=index_name, only_expunge_deletes=True, request_timeout=FORCEMERGE_TIMEOUT)
+    es.indices.refresh(index=index_name)
+
+
+def publish_index(es, alias, index_name, results, keep=DEFAULT_KEEP_GENERATIONS):
+    """ Check a newly built index, then atomically point the alias at it and
+    delete the old generations """
+    es.indices.refresh(index=index_name)
+
+    grants_query = {"query": {"term": {"dataType": "grant"}}}
+    grants = es.count(index=index_name, body=grants_query)["count"]
+    live_grants = es.count(index=alias, body=grants_query, ignore=[404]).get("count", 0)
+    errors = sum(len(file_errors) for success, file_errors in results.values())
+    print("{} grants in {}, {} grants in {}, {} errors".format(grants, index_name, live_grants, alias, errors))
+
+    if errors or not grants or grants < live_grants * MIN_GRANTS_RATIO:
+        raise Exception("Not switching {} to {}, check the load".format(alias, index_name))
+
+    actions = [{"add": {"index": index_name, "alias": alias}}]
+    if es.indices.exists_alias(name=alias):
+        for old_index_name in es.indices.get_alias(name=alias):
+            actions.insert(0, {"remove": {"index": old_index_name, "alias": alias}})
+    elif es.indices.exists(index=alias):
+        # Replace an index loaded before we used aliases
+        actions.append({"remove_index": {"index": alias}})
+
+    result = es.indices.update_aliases(body={"actions": actions})
+    pprint(result)
+
+    # The newly live index is one of the generations kept, and is never deleted
+    generation = re.compile(re.escape(alias) + r"_\d{14}$")
+    old_generations = sorted(name for name in es.indices.get(index=alias + "_*")
+                             if generation.match(name) and name != index_name)
+    for old_index_name in old_generations[:max(len(old_generations) - (keep - 1), 0)]:
+        print("Deleting old index {}".format(old_index_name))
+        es.indices.delete(index=old_index_name, ignore=[404])
+
+
+def import_grants(es, files, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, index_name=ES_INDEX, checkpoint=None,
+                  incremental=False, make_es=None):
+    """ Load the grants files, returning the bulk (success, errors) for each file.
+    With a checkpoint, progress is saved after every bulk request and grants
+    already sent according to the checkpoint are skipped.
+
+    incremental is for loading into an index that already has the grants:
+    only grants that are new or have changed are sent, and grants that are no
+    longer in their file are deleted. Unchanged grants count as successes.
+
+    With more than one worker, make_es makes the workers' elasticsearch
+    clients, see import_grants_parallel. """
+    if workers > 1:
+        return import_grants_parallel(es, files, workers, chunk_size, index_name, checkpoint, incremental, make_es)
+
+    results = collections.OrderedDict()
+    # One sender for all the files so the batch size carries on adapting
+    sender = AdaptiveBulkSender(es)
     for grants_file_path in files:
+        filename = grants_file_name(grants_file_path)
+        progress = checkpoint.progress(filename) if checkpoint else NOT_STARTED
+        pprint(grants_file_path)
+        if progress["done"]:
+            print("Already imported, skipping")
+            results[grants_file_path] = (progress["success"], progress["errors"])
+            continue
+        if progress["grants"]:
+            print("Resuming from grant {}".format(progress["grants"]))
+
+        changes = ChangedGrants(es, index_name) if incremental else None
+
+        def save_progress(sent, success, errors, done=False):
+            # Unchanged grants before the last grant sent are done too
+            grants = changes.grants_read(sent) if changes else sent
+            checkpoint.update(filename, progress["grants"] + grants, progress["success"] + success + grants - sent,
+                              progress["errors"] + errors, done)
+            checkpoint.save()
+
         tmp_dir = tempfile.mkdtemp()
 
-        file_type = grants_file_path.split('.')[-1]
+        # The statistics cover the whole file, including the grants sent before resuming
+        dataset_stats = read_dataset_stats(grants_file_path, progress["grants"], index_name)
+        grants = grant_generator(grants_file_path, index_name, progress["grants"], dataset_stats)
+        if changes:
+            grants = changes.filter(grants)
+        success, errors = sender.send(grants, on_batch=save_progress if checkpoint else None)
+        if changes:
+            print("{} unchanged grants skipped".format(changes.unchanged))
+            success += changes.unchanged
+            # The ids of the grants from before resuming aren't known
+            if not progress["grants"]:
+                delete_vanished_grants(es, filename, changes.ids, index_name)
+        index_dataset_stats(es, grants_file_path, dataset_stats, index_name)
+        result = (progress["success"] + success, progress["errors"] + errors)
+        if checkpoint:
+            checkpoint.update(filename, checkpoint.progress(filename)["grants"], *result, done=True)
+            checkpoint.save()
+        pprint(result)
+        results[grants_file_path] = result
+
+        shutil.rmtree(tmp_dir)
+    return results
+
+
+def read_dataset_stats(grants_file_path, count, index_name=ES_INDEX):
+    """ The DatasetStats of the first count grants of a file, e.g. the grants
+    sent before an import was resumed, so that the file's dataset document
+    covers all of its grants rather than keeping the last import's """
+    dataset_stats = DatasetStats()
+    if count:
+        print("Reading the first {} grants of {} for its dataset statistics".format(count, grants_file_path))
+        with open_grants_file(grants_file_path) as fp:
+            for grant in itertools.islice(iter_grants(fp, grants_file_path), count):
+                dataset_stats.add(prepare_grant(grant, grants_file_path, index_name))
+    return dataset_stats
+
+
+def index_dataset_stats(es, grants_file_path, dataset_stats, index_name=ES_INDEX):
+    """ Store the statistics for a grants file in its dataset document """
+    es.index(index=index_name, id=dataset_doc_id(grants_file_name(grants_file_path)),
+             body=dataset_stats.document(grants_file_name(grants_file_path)))
+
+
+def build_rollups(es, index_name=ES_INDEX):
+    """ Summarise the grants from each funder to each recipient in each
+    currency in "rollup" documents, so that the org pages can page and sort
+    through a funder's recipients (and a recipient's funders) without
+    aggregating all of their grants. Rollups from previous loads are deleted. """
+    # Indexes created before rollups need the mapping adding
+    es.indices.put_mapping(index=index_name, body={"properties": {"rollup": ROLLUP_MAPPING}})
+    es.indices.refresh(index=index_name)
+
+    print("Building rollups")
+    generation = time.strftime("%Y%m%d%H%M%S")
+    result = AdaptiveBulkSender(es).send(rollup_generator(es, index_name, generation))
+    pprint(result)
+
+    result = es.delete_by_query(index=index_name, body={"query": {"bool": {
+        "filter": [{"term": {"dataType": "rollup"}}],
+        "must_not": [{"term": {"rollup.generation": generation}}],
+    }}}, conflicts="proceed", refresh=True)
+    print("Deleted {} old rollups".format(result["deleted"]))
+
+
+def rollup_generator(es, index_name, generation):
+    """ A rollup document for each bucket of a composite aggregation by the
+    canonical funder, canonical recipient and currency of the grants """
+    query = {
+        "size": 0,
+        "query": {"term": {"dataType": "grant"}},
+        "aggs": {"rollups": {
+            "composite": {"size": ROLLUP_PAGE_SIZE, "sources": [
+                {"funder": {"terms": {"field": "fundingOrganization.id_and_name"}}},
+                {"recipient": {"terms": {"field": "recipientOrganization.id_and_name"}}},
+                {"currency": {"terms": {"field": "currency"}}},
+            ]},
+            "aggs": {
+                "amounts": {"stats": {"field": "amountAwarded"}},
+                "min_date": {"min": {"field": "awardDate"}},
+                "max_date": {"max": {"field": "awardDate"}},
+                "funder_ids": {"terms": {"field": "fundingOrganization.id", "size": 100}},
+                "recipient_ids": {"terms": {"field": "recipientOrganization.id", "size": 100}},
+            },
+        }},
+    }
+
+    while True:
+        rollups = es.search(index=index_name, body=query)["aggregations"]["rollups"]
+        for bucket in rollups["buckets"]:
+            key = bucket["key"]
+            yield {
+                "_id": str(uuid.uuid5(DOC_ID_NAMESPACE, "rollup/{funder}/{recipient}/{currency}".format(**key))),
+                "_index": index_name,
+                "dataType": "rollup",
+                "rollup": dict(
+                    bucket["amounts"],
+                    funderIdAndName=key["funder"],
+                    recipientIdAndName=key["recipient"],
+                    recipientName=json.loads(key["recipient"])[0],
+                    currency=key["currency"],
+                    fundingOrgIds=[id_bucket["key"] for id_bucket in bucket["funder_ids"]["buckets"]],
+                    recipientOrgIds=[id_bucket["key"] for id_bucket in bucket["recipient_ids"]["buckets"]],
+                    minAwardDate=bucket["min_date"].get("value_as_string"),
+                    maxAwardDate=bucket["max_date"].get("value_as_string"),
+                    generation=generation,
+                ),
+            }
+
+        if "after_key" not in rollups or not rollups["buckets"]:
+            break
+        query["aggs"]["rollups"]["composite"]["after"] = rollups["after_key"]
+
+
+def store_search_summary(es, index_name=ES_INDEX):
+    """ Store the results of the search page with no query, i.e. the facets and
+    summary aggregations over all the grants, and the home page totals so that
+    they aren't computed from all of the grants for every visit. """
+    # The views import this module
+    from grantnav.frontend.views import search_summary
+
+    es.indices.put_mapping(index=index_name, body={"properties": {"searchSummary": {"type": "object", "enabled": False}}})
+    es.indices.refresh(index=index_name)
+
+    print("Storing search summary")
+    es.index(index=index_name, id=SEARCH_SUMMARY_ID,
+             body={"dataType": "summary", "searchSummary": search_summary(index_name)}, refresh=True)
+
+
+def store_index_generation(es, index_name=ES_INDEX):
+    """ Give the index a new generation, which tells GrantNav to drop what it
+    has cached from the index, see grantnav.index.get_index_generation """
+    es.index(index=index_name, id=INDEX_GENERATION_ID,
+             body={"dataType": "generation", "generation": uuid.uuid4().hex}, refresh=True)
+    forget_index_generation()
+
+
+def delete_file_grants(es, filename, index_name=ES_INDEX):
+    """ Delete all the documents that were loaded from a grants file """
+    print("Deleting documents from {}".format(filename))
+    result = es.delete_by_query(index=index_name, body={"query": {"term": {"filename": filename}}},
+                                conflicts="proceed", refresh=True)
+    pprint(result)
+
+
+def delete_vanished_grants(es, filename, ids, index_name=ES_INDEX):
+    """ Delete the grants loaded from a grants file before that aren't in it
+    any more, i.e. whose ids aren't in ids """
+    query = {"query": {"bool": {"filter": [{"term": {"dataType": "grant"}}, {"term": {"filename": filename}}]}},
+             "_source": False}
+    vanished = (
+        {"_op_type": "delete", "_index": index_name, "_id": hit["_id"]}
+        for hit in elasticsearch.helpers.scan(es, index=index_name, query=query)
+        if hit["_id"] not in ids
+    )
+    success, errors = AdaptiveBulkSender(es, verbose=False).send(vanished)
+    print("Deleted {} grants no longer in {}".format(success, filename))
+    if errors:
+        pprint(errors)
 
-        if file_type != 'json':
+
+def grant_doc_id(filename, grant_id):
+    """ The same grant id from the same file always gets the same _id """
+    if not grant_id:
+        return str(uuid.uuid4())
+    return str(uuid.uuid5(DOC_ID_NAMESPACE, "grant/{}/{}".format(filename, grant_id)))
+
+
+def org_doc_id(org_id, data_type):
+    return str(uuid.uuid5(DOC_ID_NAMESPACE, "{}/{}".format(data_type, org_id)))
+
+
+def dataset_doc_id(filename):
+    return str(uuid.uuid5(DOC_ID_NAMESPACE, "dataset/{}".format(filename)))
+
+
+def importable_files(files):
+    for grants_file_path in files:
+        if not is_grants_file(grants_file_path):
             print('unimportable file {} (bad) file type'.format(grants_file_path))
             continue
 
-        def grant_generator():
-            """ Add / Update GrantNav specific optimisation fields """
+        yield grants_file_path
+
+
+def grant_generator(grants_file_path, index_name=ES_INDEX, skip=0, dataset_stats=None):
+    with open_grants_file(grants_file_path) as fp:
+        stream = iter_grants(fp, grants_file_path)
+        # Grants already sent by an import being resumed
+        if skip:
+            stream = itertools.islice(stream, skip, None)
+        stats = EnrichmentStats()
+        for grant in stream:
+            grant = prepare_grant(grant, grants_file_path, index_name, stats)
+            if dataset_stats:
+                dataset_stats.add(grant)
+            yield grant
+        print("Enrichment stages for {}:".format(grants_file_path))
+        stats.report()
+
+
+def prepare_grant(grant, grants_file_path, index_name=ES_INDEX, stats=None):
+    """ Add / Update GrantNav specific optimisation fields, by running the
+    grant through the enrichment_stages. Each stage's time and errors are
+    added to stats, an EnrichmentStats. A failed required stage stops the
+    import, other failed stages are warned about. """
+
+    grant['filename'] = grants_file_name(grants_file_path)
+    grant['_id'] = grant_doc_id(grant['filename'], grant.get('id'))
+    grant['_index'] = index_name
+    grant['dataType'] = 'grant'
+
+    # We use additional_data extensively in GN if it is missing things
+    # might not work as expected
+    try:
+        if not isinstance(grant["additional_data"], dict):
+            raise TypeError("additional_data not a dictionary")
+    except (TypeError, KeyError):
+        warnings.warn("No additional_data block for grant: %s" % grant["id"])
+        # initialise the dictionary for our own additional data
+        grant["additional_data"] = {}
+
+    for stage in enrichment_stages:
+        start = time.perf_counter()
+        errors = 0
+        try:
+            stage.function(grant)
+        except Exception as e:
+            if stage.required:
+                # The grant would be loaded without the fields that find it,
+                # so stop, as a resumed import can carry on from here
+                message = "{} failed for grant {} in {}".format(stage.name, grant.get("id"), grants_file_path)
+                raise Exception(message) from e
+            # Load the grant without this stage's fields rather than stopping
+            # the import, the errors are counted in the stats for the file
+            warnings.warn("{} failed for grant {}: {!r}".format(stage.name, grant.get("id"), e))
+            errors = 1
+        if stats:
+            stats.add(stage.name, time.perf_counter() - start, errors)
+
+    # Used to skip re-sending grants that haven't changed, see ChangedGrants
+    grant['contentHash'] = content_hash(grant)
+    return grant
+
+
+class EnrichmentStats(object):
+    """ Cumulative wall time and number of errors of each enrichment stage """
+
+    def __init__(self, stages=None):
+        # stage name -> [seconds, errors]
+        self.stages = collections.OrderedDict(stages or {})
+
+    def add(self, name, seconds, errors=0):
+        stage = self.stages.setdefault(name, [0, 0])
+        stage[0] += seconds
+        stage[1] += errors
+
+    def merge(self, stages):
+        for name, (seconds, errors) in stages.items():
+            self.add(name, seconds, errors)
+
+    def report(self):
+        total = sum(seconds for seconds, errors in self.stages.values())
+        for name, (seconds, errors) in self.stages.items():
+            print("  {:<30} {:8.2f}s {:5.1f}% {} errors".format(name, seconds, seconds / total * 100 if total else 0, errors))
+
+
+def is_splittable(grants_file_path):
+    """ Uncompressed JSON Lines files can be split into chunks by byte range
+    without parsing them """
+    identifier, extension, compression = split_grants_file_name(grants_file_path)
+    return extension == ".jsonl" and not compression
+
+
+def grant_chunks(files, chunk_size, skip=None):
+    """ Split the grants files into the chunks that the workers read, parse,
+    enrich and send. Yields the file, the position of the chunk's first grant
+    in the file, and the (offset, length) byte range of the chunk, or None for
+    the rest of the file from that grant.
+
+    Uncompressed JSON Lines files are split into byte ranges of chunk_size
+    grants (lines) so that large files are spread over several workers; this
+    only reads the lines, it doesn't parse them. Other files are a chunk each.
+    skip is a dict of the number of grants to skip at the start of each file """
+    for grants_file_path in files:
+        start = (skip or {}).get(grants_file_path, 0)
+        if not is_splittable(grants_file_path):
+            yield grants_file_path, start, None
+            continue
+
+        with open(grants_file_path, "rb") as fp:
+            grants = 0
+            offset = end = 0
+            for line in fp:
+                if grants < start:
+                    offset += len(line)
+                    end = offset
+                    grants += bool(line.strip())
+                    continue
+                end += len(line)
+                if line.strip():
+                    grants += 1
+                    if grants - start == chunk_size:
+                        yield grants_file_path, start, (offset, end - offset)
+                        start = grants
+                        offset = end
+            if grants > start:
+                yield grants_file_path, start, (offset, end - offset)
+
+
+def read_grant_chunk(grants_file_path, start, byte_range):
+    """ The raw grants of a chunk from grant_chunks """
+    if byte_range is None:
+        with open_grants_file(grants_file_path) as fp:
+            yield from itertools.islice(iter_grants(fp, grants_file_path), start, None)
+    else:
+        offset, length = byte_range
+        with open(grants_file_path, "rb") as fp:
+            fp.seek(offset)
+            data = fp.read(length)
+        yield from iter_grants(io.BytesIO(data), grants_file_path)
 
-            with open(grants_file_path) as fp:
-                stream = ijson.items(fp, 'grants.item')
-                for grant in stream:
-                    grant['filename'] = os.path.basename(grants_file_path)
-                    grant['_id'] = str(uuid.uuid4())
-                    grant['_index'] = ES_INDEX
-                    grant['dataType'] = 'grant'
 
-                    # We use additional_data extensively in GN if it is missing things
-                    # might not work as expected
-                    try:
-                        if not isinstance(grant["additional_data"], dict):
-                            raise TypeError("additional_data not a dictionary")
-                    except (TypeError, KeyError):
-                        warnings.warn("No additional_data block for grant: %s" % grant["id"])
-                        # initialise the dictionary for our own additional data
-                        grant["additional_data"] = {}
-
-                    # Search helper fields:
-
-                    # grant.fundingOrganization.id_and_name
-                    # grant.recipientOrganization.id_and_name
-                    # grant.additional_data.GNCanonicalRecipientOrgName
-                    # grant.additional_data.GNCanonicalFundingOrgName
-                    update_doc_with_canonical_orgs(grant)
-                    # grant.title_and_description
-                    update_doc_with_title_and_description(grant)
-                    # grant.grantProgramme.title_keyword
-                    update_doc_with_grantprogramme_title_keyword(grant)
-                    # grant.actualDates.N.[start,end]DateDateOnly
-                    # grant.plannedDates.N.[start,end]DateDateOnly
-                    update_doc_with_dateonly_fields(grant)
-                    # grant.currency
-                    update_doc_with_currency_upper_case(grant)
-                    # grant.simple_grant_type
-                    update_doc_with_simple_grant_type(grant)
-                    # grant.additional_data.GNRecipientOrgInfo0
-                    update_doc_with_first_recipient_org_info(grant)
-                    # Convenience geo fields:
-                    #
-                    # grant.additional_data.GNBeneficiaryRegionName (rgnnm)
-                    # grant.additional_data.GNRecipientOrgRegionName (rgnnm)
-                    #
-                    # grant.additional_data.GNRecipientOrgDistrictName (ladnm)
-                    # grant.additional_data.GNBeneficiaryDistrictName (ladnm)
-                    # grant.additional_data.GNBestCountyName (utlanm)
-                    # grant.additional_data.GNBeneficiaryCountyName (utlanm)
-                    # grant.additional_data.GNRecipientOrgCountyName (utlanm)
-                    update_doc_with_other_locations(grant)
-                    # update_doc_with_undetermined needs to go last
-                    update_doc_with_undetermined(grant)
-                    yield grant
+def new_elasticsearch():
+    return elasticsearch.Elasticsearch(hosts=[ELASTICSEARCH_HOST], serializer=get_serializer())
 
-        pprint(grants_file_path)
-        result = elasticsearch.helpers.bulk(es, grant_generator(), raise_on_error=False, max_retries=10, initial_backoff=5)
-        pprint(result)
 
-        shutil.rmtree(tmp_dir)
+# Each worker process keeps its own connection to elasticsearch, and its own
+# adaptive batch size
+worker_sender = None
+
+
+def init_worker(disabled_stages=(), make_es=new_elasticsearch):
+    global worker_sender
+    disable_stages(disabled_stages)
+    worker_sender = AdaptiveBulkSender(make_es(), verbose=False)
 
-    # Clear any query caches
-    cache.clear()
+
+def import_grant_chunk(grants_file_path, start, byte_range, index_name=ES_INDEX, incremental=False):
+    """ Runs in a worker process: read, enrich and bulk send a chunk of grants,
+    only sending the new and changed ones if incremental """
+    stats = EnrichmentStats()
+    dataset_stats = DatasetStats()
+    count = 0
+
+    def prepared_grants():
+        nonlocal count
+        for grant in read_grant_chunk(grants_file_path, start, byte_range):
+            count += 1
+            grant = prepare_grant(grant, grants_file_path, index_name, stats)
+            dataset_stats.add(grant)
+            yield grant
+
+    if incremental:
+        changes = ChangedGrants(worker_sender.es, index_name)
+        success, errors = worker_sender.send(changes.filter(prepared_grants()))
+        result = (success + changes.unchanged, errors)
+        ids = changes.ids
+    else:
+        result = worker_sender.send(prepared_grants())
+        ids = set()
+    return grants_file_path, start, count, result, stats.stages, dataset_stats, ids
+
+
+def import_grants_parallel(es, files, workers, chunk_size=DEFAULT_CHUNK_SIZE, index_name=ES_INDEX, checkpoint=None,
+                           incremental=False, make_es=None):
+    """ Load grants using a pool of worker processes, each of which reads,
+    parses, enriches and bulk sends its own chunks of the files, see
+    grant_chunks. make_es makes each worker's elasticsearch client, by default
+    with new_elasticsearch. """
+    results = collections.OrderedDict()
+    pending = collections.deque()
+    start_times = {}
+    end_times = {}
+    # Enrichment stats, dataset stats and grant ids for each file
+    stats = {}
+    dataset_stats = {}
+    ids = {}
+
+    # Carry on from the checkpoint
+    skip = {}
+    to_import = []
+    for grants_file_path in files:
+        progress = checkpoint.progress(grants_file_name(grants_file_path)) if checkpoint else NOT_STARTED
+        if progress["grants"] or progress["done"]:
+            results[grants_file_path] = [progress["success"], list(progress["errors"])]
+            skip[grants_file_path] = progress["grants"]
+        if progress["done"]:
+            print("Already imported {}, skipping".format(grants_file_path))
+        else:
+            to_import.append(grants_file_path)
+
+    def save_progress(grants_file_path, grants, done=False):
+        checkpoint.update(grants_file_name(grants_file_path), grants, *results[grants_file_path], done=done)
+        checkpoint.save()
+
+    # The dataset stats of the grants sent before resuming, read by a worker,
+    # see read_dataset_stats
+    resumed_dataset_stats = {}
+
+    # The file and position of the last chunk collected
+    collected = []
+    finished = set()
+
+    def finish_file(grants_file_path, grants):
+        # Store the file's dataset stats then record it as done
+        file_dataset_stats = dataset_stats.setdefault(grants_file_path, DatasetStats())
+        if grants_file_path in resumed_dataset_stats:
+            file_dataset_stats.merge(resumed_dataset_stats.pop(grants_file_path).get())
+        index_dataset_stats(es, grants_file_path, file_dataset_stats, index_name)
+        if checkpoint:
+            results.setdefault(grants_file_path, [0, []])
+            save_progress(grants_file_path, grants, done=True)
+        finished.add(grants_file_path)
+
+    def collect(async_result):
+        # Chunks are collected in the order they were read, so everything
+        # before this chunk in the file has been sent
+        grants_file_path, start, count, (success, errors), stages, chunk_dataset_stats, chunk_ids = async_result.get()
+        stats.setdefault(grants_file_path, EnrichmentStats()).merge(stages)
+        dataset_stats.setdefault(grants_file_path, DatasetStats()).merge(chunk_dataset_stats)
+        ids.setdefault(grants_file_path, set()).update(chunk_ids)
+        file_result = results.setdefault(grants_file_path, [0, []])
+        file_result[0] += success
+        file_result[1].extend(errors)
+        end_times[grants_file_path] = time.perf_counter()
+        if collected and collected[-1][0] != grants_file_path:
+            finish_file(*collected[-1])
+        if checkpoint:
+            save_progress(grants_file_path, start + count)
+        collected[:] = [(grants_file_path, start + count)]
+
+    disabled_stages = [stage.name for stage in ENRICHMENT_STAGES if stage not in enrichment_stages]
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(disabled_stages, make_es or new_elasticsearch)) as pool:
+        for grants_file_path in to_import:
+            if skip.get(grants_file_path):
+                resumed_dataset_stats[grants_file_path] = pool.apply_async(
+                    read_dataset_stats, (grants_file_path, skip[grants_file_path], index_name))
+        for grants_file_path, start, byte_range in grant_chunks(to_import, chunk_size, skip):
+            # Limit the chunks waiting in the pool so that the progress saved
+            # in the checkpoint doesn't fall far behind
+            if len(pending) >= workers * 2:
+                collect(pending.popleft())
+            start_times.setdefault(grants_file_path, time.perf_counter())
+            pending.append(pool.apply_async(import_grant_chunk,
+                                            (grants_file_path, start, byte_range, index_name, incremental)))
+        while pending:
+            collect(pending.popleft())
+        if collected:
+            finish_file(*collected[-1])
+        # Files with no grants left to send
+        for grants_file_path in to_import:
+            if grants_file_path not in finished:
+                finish_file(grants_file_path, skip.get(grants_file_path, 0))
+
+    if incremental:
+        for grants_file_path in to_import:
+            # The ids of the grants from before resuming aren't known
+            if not skip.get(grants_file_path):
+                delete_vanished_grants(es, grants_file_name(grants_file_path), ids.get(grants_file_path, set()),
+                                       index_name)
+
+    for grants_file_path, (success, errors) in results.items():
+        pprint(grants_file_path)
+        if grants_file_path in start_times:
+            seconds = end_times[grants_file_path] - start_times[grants_file_path]
+            print("{} docs in {:.1f}s, {:.0f} docs/sec".format(success, seconds, success / seconds if seconds else 0))
+        if grants_file_path in stats:
+            print("Enrichment stages:")
+            stats[grants_file_path].report()
+        pprint((success, errors))
+        results[grants_file_path] = (success, errors)
+    return results
 
 
 # From 360Insights v2
@@ -629,7 +1372,7 @@ def update_doc_with_first_recipient_org_info(grant):
         pass
 
     try:
-        days_old = (date_parser.parse(grant["awardDate"], ignoretz=True) - date_parser.parse(grant["additional_data"]["recipientOrgInfos"][0]["dateRegistered"], ignoretz=True)).days
+        days_old = (parse_date(grant["awardDate"], ignoretz=True) - parse_date(grant["additional_data"]["recipientOrgInfos"][0]["dateRegistered"], ignoretz=True)).days
         # We encode the label values in the index e.g. "Under 1 year" because these are for view purposes only
         # and pre-computing them into buckets is more efficient rather than when at the retrieving the results time.
         grant["additional_data"]["GNRecipientOrgInfo0"]["ageWhenAwarded"] = to_band(days_old, AGE_BINS, AGE_BIN_LABELS)
@@ -637,14 +1380,27 @@ def update_doc_with_first_recipient_org_info(grant):
         pass
 
 
+def get_canonical_org(org_id, org_type):
+    """ Returns the (name, id) of the canonical org for org_id. Uses the org
+    directory if we were given the orgs file for this org_type, otherwise
+    searches the orgs already in elasticsearch.
+    Raises OrgNotFoundError"""
+    if org_directory.is_loaded(org_type):
+        return org_directory.get(org_id, org_type)
+
+    # The orgs may have just been loaded, so the search isn't cached
+    org = get_org(org_id, org_type, use_cache=False)
+    return new_ordered_names(org)[0], new_org_ids(org)[0]
+
+
 def update_doc_with_canonical_orgs(grant):
     """ Uses our org data from the datastore to add canonical org data to additional_data"""
     # RecipientOrganisation
     if grant_recipient_org := grant.get("recipientOrganization", [""])[0]:
         try:
-            recipient_org = get_org(grant_recipient_org["id"], "recipient")
-            grant["additional_data"]["GNCanonicalRecipientOrgName"] = new_ordered_names(recipient_org)[0]
-            grant["additional_data"]["GNCanonicalRecipientOrgId"] = new_org_ids(recipient_org)[0]
+            name, org_id = get_canonical_org(grant_recipient_org["id"], "recipient")
+            grant["additional_data"]["GNCanonicalRecipientOrgName"] = name
+            grant["additional_data"]["GNCanonicalRecipientOrgId"] = org_id
         except OrgNotFoundError:
             grant["additional_data"]["GNCanonicalRecipientOrgName"] = grant["recipientOrganization"][0]["name"]
             grant["additional_data"]["GNCanonicalRecipientOrgId"] = grant["recipientOrganization"][0]["id"]
@@ -657,9 +1413,9 @@ def update_doc_with_canonical_orgs(grant):
 
     # FundingOrganisation
     try:
-        funding_org = get_org(grant["fundingOrganization"][0]["id"], "funder")
-        grant["additional_data"]["GNCanonicalFundingOrgName"] = new_ordered_names(funding_org)[0]
-        grant["additional_data"]["GNCanonicalFundingOrgId"] = new_org_ids(funding_org)[0]
+        name, org_id = get_canonical_org(grant["fundingOrganization"][0]["id"], "funder")
+        grant["additional_data"]["GNCanonicalFundingOrgName"] = name
+        grant["additional_data"]["GNCanonicalFundingOrgId"] = org_id
     except OrgNotFoundError:
         grant["additional_data"]["GNCanonicalFundingOrgName"] = grant["fundingOrganization"][0]["name"]
         grant["additional_data"]["GNCanonicalFundingOrgId"] = grant["fundingOrganization"][0]["id"]
@@ -703,8 +1459,7 @@ def update_doc_with_dateonly_fields(grant):
     """
     def add_dateonly(parent, key):
         try:
-            datetime = date_parser.parse(parent.get(key))
-            parent[key + 'DateOnly'] = datetime.date().isoformat()
+            parent[key + 'DateOnly'] = date_only(parent.get(key))
         except (ValueError, TypeError):
             parent[key + 'DateOnly'] = parent.get(key)
 
@@ -715,12 +1470,90 @@ def update_doc_with_dateonly_fields(grant):
         add_dateonly(dates, 'endDate')
 
 
+# A grant that a required stage fails for isn't loaded, see prepare_grant
+EnrichmentStage = collections.namedtuple("EnrichmentStage", "name function required", defaults=[False])
+
+# The enrichment run on each grant by prepare_grant, in order
+ENRICHMENT_STAGES = [
+    # Search helper fields:
+
+    # grant.fundingOrganization.id_and_name
+    # grant.recipientOrganization.id_and_name
+    # grant.additional_data.GNCanonicalRecipientOrgName
+    # grant.additional_data.GNCanonicalFundingOrgName
+    # Required as searching, filtering and the org pages use the id_and_names
+    EnrichmentStage("canonical_orgs", update_doc_with_canonical_orgs, required=True),
+    # grant.title_and_description
+    EnrichmentStage("title_and_description", update_doc_with_title_and_description),
+    # grant.grantProgramme.title_keyword
+    EnrichmentStage("grantprogramme_title_keyword", update_doc_with_grantprogramme_title_keyword),
+    # grant.actualDates.N.[start,end]DateDateOnly
+    # grant.plannedDates.N.[start,end]DateDateOnly
+    EnrichmentStage("dateonly_fields", update_doc_with_dateonly_fields),
+    # grant.currency
+    EnrichmentStage("currency_upper_case", update_doc_with_currency_upper_case),
+    # grant.simple_grant_type
+    EnrichmentStage("simple_grant_type", update_doc_with_simple_grant_type),
+    # grant.additional_data.GNRecipientOrgInfo0
+    EnrichmentStage("first_recipient_org_info", update_doc_with_first_recipient_org_info),
+    # Convenience geo fields:
+    #
+    # grant.additional_data.GNBeneficiaryRegionName (rgnnm)
+    # grant.additional_data.GNRecipientOrgRegionName (rgnnm)
+    #
+    # grant.additional_data.GNRecipientOrgDistrictName (ladnm)
+    # grant.additional_data.GNBeneficiaryDistrictName (ladnm)
+    # grant.additional_data.GNBestCountyName (utlanm)
+    # grant.additional_data.GNBeneficiaryCountyName (utlanm)
+    # grant.additional_data.GNRecipientOrgCountyName (utlanm)
+    EnrichmentStage("other_locations", update_doc_with_other_locations),
+    # undetermined needs to go last
+    EnrichmentStage("undetermined", update_doc_with_undetermined),
+]
+
+# The stages prepare_grant runs, see disable_stages
+enrichment_stages = ENRICHMENT_STAGES
+
+
+def disable_stages(names):
+    """ Stop prepare_grant running the named enrichment stages, for experiments """
+    global enrichment_stages
+    unknown = set(names) - {stage.name for stage in ENRICHMENT_STAGES}
+    if unknown:
+        raise Exception("Unknown enrichment stages {}".format(", ".join(sorted(unknown))))
+    enrichment_stages = [stage for stage in ENRICHMENT_STAGES if stage.name not in names]
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Import 360 files in a directory to elasticsearch')
     parser.add_argument('--clean', help='Delete existing data before import', action='store_true')
     parser.add_argument('--recipients', help='recipients file')
     parser.add_argument('--funders', help='funders file')
+    parser.add_argument('--workers', help='number of worker processes to enrich and load grants with', type=int, default=1)
+    parser.add_argument('--chunk-size', help='number of grants in each chunk of an uncompressed JSON Lines file given to a worker', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--manifest', help='manifest file of previously imported files, only new, changed and removed files are processed')
+    parser.add_argument('--build', help='load into a new index then switch the ES_INDEX alias to it', action='store_true')
+    parser.add_argument('--keep', help='number of index generations to keep with --build', type=int, default=DEFAULT_KEEP_GENERATIONS)
+    parser.add_argument('--no-bulk-settings', help="don't switch the index to bulk load settings while loading", action='store_true')
+    parser.add_argument('--checkpoint', help='file to save the import progress to after every bulk request')
+    parser.add_argument('--resume', help='carry on from the --checkpoint of an import that stopped part way', action='store_true')
+    parser.add_argument('--org-table', help='write the --funders and --recipients orgs to this org table file for '
+                        'GrantNav to look orgs up in, see ORG_TABLE_PATH')
+    parser.add_argument('--bulk-dir', help='write enriched bulk files to this directory instead of loading them, see ingest_bulk_files.py')
+    parser.add_argument('--disable-stage', help='enrichment stage to leave out, can be given more than once: {}'.format(
+        ', '.join(stage.name for stage in ENRICHMENT_STAGES)), action='append', default=[])
     parser.add_argument('files', help='files to import', nargs='*')
     args = parser.parse_args()
-
-    import_to_elasticsearch(args.files, args.clean, args.recipients, args.funders)
+    disable_stages(args.disable_stage)
+    if args.resume and not args.checkpoint:
+        parser.error("--resume needs a --checkpoint file")
+    if args.build and not (args.recipients and args.funders):
+        parser.error(BUILD_NEEDS_ORGS)
+
+    if args.bulk_dir:
+        write_bulk_files(args.files, args.bulk_dir, args.recipients, args.funders)
+        sys.exit()
+
+    import_to_elasticsearch(args.files, args.clean, args.recipients, args.funders, args.workers, args.chunk_size,
+                            args.manifest, args.build, args.keep, not args.no_bulk_settings,
+                            args.checkpoint, args.resume, args.org_table)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+""" Load the bulk files written by import_to_elasticsearch.py --bulk-dir into
+elasticsearch. The grants are already enriched so this is only I/O, and several
+copies can be run at once (on different machines) on different bulk files. """
+import argparse
+import os
+import sys
+from pprint import pprint
+
+import elasticsearch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from dataload.import_to_elasticsearch import ES_INDEX, ELASTICSEARCH_HOST, maybe_create_index, bulk_load_settings, \
+    build_rollups, store_search_summary, store_index_generation # noqa
+from dataload.bulk_utils import AdaptiveBulkSender, read_bulk_file # noqa
+
+
+def ingest_bulk_files(es, bulk_files, index_name=ES_INDEX, clean=False, bulk_settings=True, rollups=True):
+    if clean:
+        result = es.indices.delete(index=index_name, ignore=[404])
+        pprint(result)
+    maybe_create_index(index_name)
+
+    with bulk_load_settings(es, index_name, bulk_settings, full_load=clean):
+        sender = AdaptiveBulkSender(es, index_name)
+        for bulk_file in bulk_files:
+            pprint(bulk_file)
+            result = sender.send_lines(read_bulk_file(bulk_file))
+            pprint(result)
+
+        if rollups:
+            build_rollups(es, index_name)
+            store_search_summary(es, index_name)
+            # A new generation only once the index is complete, ingests run
+            # with --no-rollups leave it to the last ingest into the index
+            store_index_generation(es, index_name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load bulk files from import_to_elasticsearch.py --bulk-dir into elasticsearch")
+    parser.add_argument("--index", help="index to load into", default=ES_INDEX)
+    parser.add_argument("--clean", help="Delete existing data before loading", action="store_true")
+    parser.add_argument("--no-bulk-settings", help="don't switch the index to bulk load settings while loading, "
+                        "e.g. when other ingests are loading into the same index", action="store_true")
+    parser.add_argument("--no-rollups", help="don't build the funder -> recipient rollups and search summary after loading, "
+                        "e.g. when other ingests are still loading into the same index", action="store_true")
+    parser.add_argument("bulk_files", help="*.ndjson.gz files to load", nargs="+")
+    args = parser.parse_args()
+
+    es = elasticsearch.Elasticsearch(hosts=[ELASTICSEARCH_HOST])
+    ingest_bulk_files(es, args.bulk_files, args.index, args.clean, not args.no_bulk_settings, not args.no_rollups)
@@ -0,0 +1,58 @@
+import importlib
+import os
+
+import elasticsearch.serializer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ijson backends, fastest first. The yajl ones need the yajl C library (and
+# yajl2_c needs ijson to have been built against it).
+IJSON_BACKENDS = ("yajl2_c", "yajl2_cffi", "yajl2", "python")
+
+
+def get_ijson_backend(name=None):
+    """ The named ijson backend, or the fastest one that is available. The
+    IJSON_BACKEND environment variable can be used to choose one too """
+    name = name or os.environ.get("IJSON_BACKEND")
+    if name:
+        return importlib.import_module("ijson.backends." + name)
+    for name in IJSON_BACKENDS:
+        try:
+            return importlib.import_module("ijson.backends." + name)
+        except ImportError:
+            continue
+    raise Exception("No ijson backends available")
+
+
+def ijson_backend_name(backend):
+    return backend.__name__.split(".")[-1]
+
+
+# All the parsing of grants and orgs files uses this backend. The yajl
+# backends need files to be opened in binary mode.
+ijson = get_ijson_backend()
+
+
+class FastJSONSerializer(elasticsearch.serializer.JSONSerializer):
+    """ Serializes with orjson, which is several times faster than json for
+    grants. Values orjson can't serialize itself (Decimals from ijson) are
+    converted the same way as JSONSerializer, and anything else orjson
+    refuses (e.g. integers over 64 bits) falls back to JSONSerializer """
+
+    def dumps(self, data):
+        if isinstance(data, str):
+            return data
+        try:
+            return orjson.dumps(data, default=self.default).decode("utf-8")
+        except TypeError:
+            return super().dumps(data)
+
+
+def get_serializer():
+    """ The fastest available serializer for the elasticsearch client """
+    if orjson is None:
+        return elasticsearch.serializer.JSONSerializer()
+    return FastJSONSerializer()
@@ -0,0 +1,42 @@
+import sys
+
+from grantnav.frontend.org_utils import new_ordered_names, new_org_ids, OrgNotFoundError
+
+
+class OrgDirectory(object):
+    """ In memory lookup of every orgID to its organisation's canonical
+    (name, id), built from the datastore funders.jl/recipients.jl data as it is
+    loaded. This avoids a search per grant while enriching grants with
+    canonical org data.
+    """
+
+    def __init__(self):
+        # org_type: {org_id: (canonical name, canonical id)}
+        self.orgs = {}
+
+    def add(self, org, org_type):
+        lookup = self.orgs.setdefault(org_type, {})
+        org_ids = new_org_ids(org)
+        # Lots of orgs share the same names and ids so intern them to keep
+        # the directory compact.
+        canonical = (sys.intern(new_ordered_names(org)[0]), sys.intern(org_ids[0]))
+        for org_id in org_ids:
+            # Same as searching on orgIDs: the first org loaded wins
+            lookup.setdefault(sys.intern(org_id), canonical)
+
+    def mark_loaded(self, org_type):
+        """ An org type with no orgs in its file is still loaded """
+        self.orgs.setdefault(org_type, {})
+
+    def is_loaded(self, org_type):
+        return org_type in self.orgs
+
+    def get(self, org_id, org_type):
+        """ Returns (canonical name, canonical id) or raises OrgNotFoundError """
+        try:
+            return self.orgs[org_type][org_id]
+        except KeyError:
+            raise OrgNotFoundError
+
+    def __len__(self):
+        return sum(len(lookup) for lookup in self.orgs.values())
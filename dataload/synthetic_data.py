@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+""" Synthetic 360Giving grants and orgs, in the shapes of the grants and orgs
+in dataload/test_data, for benchmarking the import with any number of grants.
+
+    python dataload/synthetic_data.py --grants 100000 path/to/output
+
+writes a grants file and funders.jl and recipients.jl files that can be loaded
+with import_to_elasticsearch.py.
+"""
+import argparse
+import copy
+import datetime
+import glob
+import json
+import os
+import random
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.realpath(__file__)), "test_data")
+
+FIRST_AWARD_DATE = datetime.date(2010, 1, 1)
+AWARD_DATE_DAYS = 15 * 365
+
+
+def like_date(template, date):
+    """ date formatted in the same way as the template date string """
+    template = str(template)
+    if "/" in template:
+        return date.strftime("%d/%m/%Y")
+    if template.endswith(".000Z"):
+        return date.strftime("%Y-%m-%dT00:00:00.000Z")
+    if "T" in template:
+        return date.strftime("%Y-%m-%dT00:00:00+00:00")
+    return date.isoformat()
+
+
+class SyntheticData(object):
+    """ Makes grants and orgs by copying grants and orgs from the test data and
+    changing their ids, names, amounts and dates. The additional_data blocks
+    (locationLookup, recipientOrgInfos etc.) are taken from the test grants
+    that have them, so every synthetic grant has one. The same seed always
+    makes the same data. """
+
+    def __init__(self, seed=0, test_data=TEST_DATA):
+        self.random = random.Random(seed)
+        self.grants_templates = []
+        for path in sorted(glob.glob(os.path.join(test_data, "*.json"))):
+            with open(path) as fp:
+                data = json.load(fp)
+            if isinstance(data, dict) and "grants" in data:
+                self.grants_templates.append(data["grants"])
+
+        grants = [grant for grants in self.grants_templates for grant in grants]
+        self.additional_data = [grant["additional_data"] for grant in grants
+                                if isinstance(grant.get("additional_data"), dict)]
+        self.location_lookups = [data["locationLookup"] for data in self.additional_data if data.get("locationLookup")]
+        self.recipient_org_infos = [info for data in self.additional_data for info in data.get("recipientOrgInfos", [])]
+
+        with open(os.path.join(test_data, "funders.jl")) as fp:
+            self.org_templates = [json.loads(line) for line in fp if line.strip()]
+
+    def org_id(self, index, org_type):
+        return "GB-SYN-{}-{}".format(org_type.upper(), index)
+
+    def org_name(self, index, org_type):
+        return "Synthetic {} {}".format(org_type.title(), index)
+
+    def orgs(self, count, org_type):
+        """ count funder or recipient orgs, in the shape of the datastore's
+        funders.jl / recipients.jl """
+        for index in range(count):
+            org = copy.deepcopy(self.random.choice(self.org_templates))
+            org_id = self.org_id(index, org_type)
+            org["id"] = org_id
+            org["name"] = self.org_name(index, org_type)
+            org["publisherName"] = org["name"] if org_type == "funder" else None
+            org["publisherPrefix"] = "360G-SYN-{}".format(index) if org_type == "funder" else None
+            if org.get("ftcData"):
+                # A second id to look the org up by
+                org["ftcData"] = dict(org["ftcData"], id=org_id, name=org["name"],
+                                      orgIDs=[org_id, "GB-COH-SYN{}{}".format(org_type[0].upper(), index)])
+            yield org
+
+    def grants(self, count, funders=10, recipients=1000):
+        """ count grants from the funders to the recipients made by orgs() """
+        for index in range(count):
+            template_grants = self.random.choice(self.grants_templates)
+            grant = copy.deepcopy(self.random.choice(template_grants))
+
+            funder = self.random.randrange(funders)
+            recipient = self.random.randrange(recipients)
+            recipient_id = self.org_id(recipient, "recipient")
+
+            grant["id"] = "360G-SYN-{}".format(index)
+            grant["title"] = "Synthetic grant {}".format(index)
+            grant["fundingOrganization"] = [{"id": self.org_id(funder, "funder"),
+                                             "name": self.org_name(funder, "funder")}]
+            grant["recipientOrganization"] = [dict(
+                grant.get("recipientOrganization", [{}])[0], id=recipient_id,
+                name=self.org_name(recipient, "recipient"),
+            )]
+            # Mostly thousands of pounds, with a long tail of large grants
+            grant["amountAwarded"] = round(self.random.lognormvariate(9, 1.5))
+            award_date = FIRST_AWARD_DATE + datetime.timedelta(days=self.random.randrange(AWARD_DATE_DAYS))
+            grant["awardDate"] = like_date(grant.get("awardDate"), award_date)
+
+            additional_data = grant.get("additional_data")
+            if not isinstance(additional_data, dict):
+                additional_data = copy.deepcopy(self.random.choice(self.additional_data))
+            additional_data["locationLookup"] = copy.deepcopy(self.random.choice(self.location_lookups))
+            org_info = copy.deepcopy(self.random.choice(self.recipient_org_infos))
+            org_info.update(id=recipient_id, name=grant["recipientOrganization"][0]["name"], orgIDs=[recipient_id])
+            additional_data["recipientOrgInfos"] = [org_info]
+            grant["additional_data"] = additional_data
+            yield grant
+
+    def write_grants_file(self, path, count, funders=10, recipients=1000):
+        # Written a grant at a time so that large files don't need to fit in memory
+        if path.endswith(".jsonl"):
+            with open(path, "w") as fp:
+                for grant in self.grants(count, funders, recipients):
+                    fp.write(json.dumps(grant) + "\n")
+            return
+
+        with open(path, "w") as fp:
+            fp.write('{"grants": [')
+            for index, grant in enumerate(self.grants(count, funders, recipients)):
+                if index:
+                    fp.write(",\n")
+                fp.write(json.dumps(grant))
+            fp.write("]}\n")
+
+    def write_orgs_file(self, path, count, org_type):
+        with open(path, "w") as fp:
+            for org in self.orgs(count, org_type):
+                fp.write(json.dumps(org) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic 360Giving grants and orgs files")
+    parser.add_argument("--grants", type=int, default=10000, help="number of grants")
+    parser.add_argument("--funders", type=int, default=10, help="number of funders")
+    parser.add_argument("--recipients", type=int, default=1000, help="number of recipients")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("output_dir")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    data = SyntheticData(args.seed)
+    data.write_orgs_file(os.path.join(args.output_dir, "funders.jl"), args.funders, "funder")
+    data.write_orgs_file(os.path.join(args.output_dir, "recipients.jl"), args.recipients, "recipient")
+    data.write_grants_file(os.path.join(args.output_dir, "synthetic-{}.json".format(args.seed)), args.grants,
+                           args.funders, args.recipients)
@@ -0,0 +1,691 @@
+import datetime
+import decimal
+import functools
+import gzip
+import json
+import os
+
+import dateutil.parser as date_parser
+import elasticsearch.serializer
+import ijson
+import pytest
+
+from dataload import bulk_utils, copy_es_index, ingest_bulk_files
+from dataload.bulk_utils import AdaptiveBulkSender, read_bulk_file, write_bulk_file
+from dataload import import_to_elasticsearch
+from dataload.benchmark import BulkSink
+from dataload.import_to_elasticsearch import grant_doc_id, org_doc_id, prepare_grant, EnrichmentStats, grant_chunks, \
+    read_grant_chunk
+from dataload.date_utils import parse_date, date_only
+from dataload.dataset_stats import DatasetStats
+from dataload.grant_changes import ChangedGrants, content_hash
+from dataload.grants_files import grants_file_name, is_grants_file, iter_grants, open_grants_file
+from dataload.import_checkpoint import ImportCheckpoint
+from dataload.json_utils import FastJSONSerializer, get_ijson_backend
+from dataload.import_manifest import ImportManifest
+from dataload.org_directory import OrgDirectory
+from dataload.synthetic_data import SyntheticData
+from grantnav.frontend.org_utils import OrgNotFoundError
+
+
+prefix = f"{os.path.dirname(__file__)}/test_data/"
+
+
+def test_org_directory():
+    org_directory = OrgDirectory()
+    assert not org_directory.is_loaded("funder")
+
+    with open(os.path.join(prefix, "funders.jl")) as f:
+        for org in ijson.items(f, '', multiple_values=True):
+            org_directory.add(org, "funder")
+
+    assert org_directory.is_loaded("funder")
+    assert not org_directory.is_loaded("recipient")
+    assert org_directory.get("GB-CHC-1000147", "funder") == ("A B Charitable Trust", "GB-CHC-1000147")
+    assert org_directory.get("360G-WilliamGrantFdn", "funder") == ("William Grant Foundation", "360G-WilliamGrantFdn")
+
+    with pytest.raises(OrgNotFoundError):
+        org_directory.get("GB-CHC-1000147", "recipient")
+    with pytest.raises(OrgNotFoundError):
+        org_directory.get("XX-NOT-AN-ORG", "funder")
+
+
+def test_doc_ids_are_deterministic():
+    assert grant_doc_id("a002400000KeYdsAAF.json", "360G-1") == grant_doc_id("a002400000KeYdsAAF.json", "360G-1")
+    assert grant_doc_id("a002400000KeYdsAAF.json", "360G-1") != grant_doc_id("a002400000KeYdsAAF.json", "360G-2")
+    assert grant_doc_id("a002400000KeYdsAAF.json", "360G-1") != grant_doc_id("a002400000nO46WAAS.json", "360G-1")
+    assert org_doc_id("GB-CHC-1000147", "funder") != org_doc_id("GB-CHC-1000147", "recipient")
+
+
+def test_import_manifest_changes(tmpdir):
+    unchanged = tmpdir.join("unchanged.json")
+    unchanged.write('{"grants": []}')
+    changed = tmpdir.join("changed.json")
+    changed.write('{"grants": []}')
+    removed = tmpdir.join("removed.json")
+    removed.write('{"grants": []}')
+
+    manifest = ImportManifest(str(tmpdir.join("manifest.json")))
+    to_import, _, _ = manifest.changes([str(unchanged), str(changed), str(removed)])
+    for path, info in to_import:
+        manifest.record(path, info, 0)
+    manifest.save()
+
+    changed.write('{"grants": [{"id": "360G-1"}]}')
+    added = tmpdir.join("added.json")
+    added.write('{"grants": []}')
+
+    manifest = ImportManifest(str(tmpdir.join("manifest.json")))
+    to_import, not_changed, removed_filenames = manifest.changes([str(unchanged), str(changed), str(added)])
+    assert [path for path, info in to_import] == [str(changed), str(added)]
+    assert [path for path, info in not_changed] == [str(unchanged)]
+    assert removed_filenames == ["removed.json"]
+
+
+@pytest.mark.parametrize("value", [
+    "2017-11-21",
+    "2017-11-21T00:00:00.000Z",
+    "2017-11-21T23:30:00+05:00",
+    "2017-11-21 10:15:00",
+    "2020-05-03 00:32:19.416435",
+    "21/11/2017",
+    "November 2017",
+    "2017-11-21 ",
+])
+def test_parse_date_matches_dateutil(value):
+    assert parse_date(value) == date_parser.parse(value)
+    assert parse_date(value, ignoretz=True) == date_parser.parse(value, ignoretz=True)
+    assert date_only(value) == date_parser.parse(value).date().isoformat()
+
+
+@pytest.mark.parametrize(("value", "exception"), [
+    ("2017-02-30", ValueError),
+    ("not a date", ValueError),
+    ("", ValueError),
+    (None, TypeError),
+])
+def test_parse_date_errors_match_dateutil(value, exception):
+    with pytest.raises(exception):
+        date_parser.parse(value)
+    with pytest.raises(exception):
+        parse_date(value)
+
+
+class FakeBulkES(object):
+    """ Just enough of the elasticsearch client for AdaptiveBulkSender,
+    rejecting the first attempt at each document in reject_ids """
+
+    def __init__(self, reject_ids=()):
+        self.transport = type("Transport", (), {"serializer": elasticsearch.serializer.JSONSerializer()})()
+        self.reject_ids = set(reject_ids)
+        self.requests = []
+
+    def bulk(self, body, index=None):
+        lines = body.splitlines()
+        self.requests.append(lines)
+        items = []
+        for action_line in lines[::2]:
+            _id = self.transport.serializer.loads(action_line)["index"]["_id"]
+            if _id in self.reject_ids:
+                self.reject_ids.remove(_id)
+                items.append({"index": {"_id": _id, "status": 429}})
+            else:
+                items.append({"index": {"_id": _id, "status": 201}})
+        return {"items": items}
+
+
+def test_adaptive_bulk_sender(monkeypatch):
+    monkeypatch.setattr(bulk_utils, "MIN_BATCH_BYTES", 1)
+    es = FakeBulkES(reject_ids=["3"])
+    docs = [{"_id": str(i), "_index": "threesixtygiving", "title": "x" * 100} for i in range(10)]
+
+    sender = AdaptiveBulkSender(es, batch_bytes=500, initial_backoff=0, verbose=False)
+    assert sender.send(docs) == (10, [])
+
+    # Batches are split by size, not number of documents
+    assert all(len(lines) < 20 for lines in es.requests)
+    # The rejected document was retried on its own
+    assert es.requests[1] == [
+        '{"index":{"_index":"threesixtygiving","_id":"3"}}',
+        '{"title":"%s"}' % ("x" * 100),
+    ]
+    assert sender.rejections == 1
+
+    # Rejections and slow requests shrink the batch size, fast requests grow it
+    sender.batch_bytes = 1000
+    sender.adapt(0.1, rejected=True)
+    assert sender.batch_bytes == 500
+    sender.adapt(bulk_utils.TARGET_BATCH_SECONDS * 2)
+    assert sender.batch_bytes == 375
+    sender.adapt(0.1)
+    assert sender.batch_bytes > 375
+
+
+class FakeIndicesES(object):
+    """ Just enough of the elasticsearch client for bulk_load_settings """
+
+    def __init__(self, index_settings):
+        self.index_settings = index_settings
+        self.indices = self
+        self.calls = []
+
+    def get_settings(self, index, name, flat_settings):
+        names = name.split(",")
+        return {index: {"settings": {key: value for key, value in self.index_settings.items() if key in names}}}
+
+    def put_settings(self, index, body):
+        self.calls.append(("put_settings", body))
+        for key, value in body.items():
+            if value is None:
+                self.index_settings.pop(key, None)
+            else:
+                self.index_settings[key] = value
+
+    def forcemerge(self, index, request_timeout, **kwargs):
+        self.calls.append(("forcemerge", kwargs))
+
+    def refresh(self, index):
+        self.calls.append(("refresh", {}))
+
+
+def test_bulk_load_settings():
+    live_settings = {"index.refresh_interval": "30s", "index.number_of_replicas": "1"}
+
+    # A new index gets the full bulk load profile
+    es = FakeIndicesES(dict(live_settings))
+    with import_to_elasticsearch.bulk_load_settings(es, "test", full_load=True):
+        assert es.index_settings == import_to_elasticsearch.BULK_LOAD_SETTINGS
+    assert es.index_settings == live_settings
+    assert es.calls[-2:] == [("forcemerge", {"max_num_segments": 1}), ("refresh", {})]
+
+    # Loading into the live index only turns off refreshes
+    es = FakeIndicesES(dict(live_settings))
+    with import_to_elasticsearch.bulk_load_settings(es, "test"):
+        assert es.index_settings == dict(live_settings, **{"index.refresh_interval": "-1"})
+    assert es.index_settings == live_settings
+    assert es.calls[-2:] == [("forcemerge", {"only_expunge_deletes": True}), ("refresh", {})]
+
+    # The previous settings are restored when the load fails, without merging
+    es = FakeIndicesES(dict(live_settings))
+    with pytest.raises(ValueError):
+        with import_to_elasticsearch.bulk_load_settings(es, "test", full_load=True):
+            raise ValueError
+    assert es.index_settings == live_settings
+    assert [call for call, body in es.calls] == ["put_settings", "put_settings"]
+
+    es = FakeIndicesES(dict(live_settings))
+    with import_to_elasticsearch.bulk_load_settings(es, "test", enabled=False):
+        pass
+    assert es.calls == []
+
+
+class FakeReindexES(FakeIndicesES):
+    """ Just enough of the elasticsearch client for copy_es_index, whose
+    reindex task finishes with response and leaves copied documents in the
+    destination """
+
+    def __init__(self, response, docs=10, copied=10, error=None):
+        super().__init__({})
+        self.tasks = self
+        self.polls = [{"completed": False, "task": {"status": {"created": 5, "updated": 0, "deleted": 0, "total": docs}}},
+                      {"completed": True, "response": response, "error": error}]
+        self.docs = {"source": docs, "copy": copied}
+
+    def delete(self, index, ignore=()):
+        self.calls.append(("delete", {}))
+
+    def reindex(self, body, **kwargs):
+        self.calls.append(("reindex", body))
+        return {"task": "node:1"}
+
+    def get(self, task_id):
+        return self.polls.pop(0)
+
+    def count(self, index):
+        return {"count": self.docs[index]}
+
+    def index(self, index, id, body, refresh):
+        self.calls.append(("index", dict(body, index=index)))
+
+
+def test_copy_es_index(monkeypatch):
+    monkeypatch.setattr(copy_es_index, "POLL_INTERVAL", 0)
+    monkeypatch.setattr(copy_es_index, "maybe_create_index", lambda index_name: None)
+
+    es = FakeReindexES({"created": 10, "updated": 0, "took": 1000, "failures": []})
+    copy_es_index.copy_es_index(es, "source", "copy")
+    assert ("reindex", {"source": {"index": "source"}, "dest": {"index": "copy"}}) in es.calls
+    assert es.calls[-3][0] == "forcemerge"
+    # The copy gets its own generation, replacing the one copied from the source
+    call, body = es.calls[-1]
+    assert (call, body["index"], body["dataType"]) == ("index", "copy", "generation")
+
+    # Failures, errors and a copy that is missing documents are reported, and a failed copy isn't merged
+    for es in [FakeReindexES({"created": 9, "failures": [{"cause": "mapping"}]}),
+               FakeReindexES({}, error={"type": "search_context_missing_exception"}),
+               FakeReindexES({"created": 9, "canceled": "by user request"})]:
+        with pytest.raises(Exception, match="Reindex failed"):
+            copy_es_index.copy_es_index(es, "source", "copy")
+        assert "forcemerge" not in [call for call, body in es.calls]
+        assert "index" not in [call for call, body in es.calls]
+        assert es.index_settings == {}
+
+    with pytest.raises(Exception, match="Copied 9 documents of 10"):
+        copy_es_index.copy_es_index(FakeReindexES({"created": 9, "failures": []}, copied=9), "source", "copy")
+
+    # A source without a generation document leaves the copy's in place
+    copy_es_index.copy_es_index(FakeReindexES({"created": 10, "failures": []}, copied=11), "source", "copy")
+
+
+class FakeAliasES(object):
+    """ Just enough of the elasticsearch client for publish_index: indexes
+    with a number of grants, and aliases """
+
+    def __init__(self, indexes, aliases=None):
+        self.indexes = dict(indexes)
+        self.aliases = {alias: set(names) for alias, names in (aliases or {}).items()}
+        self.indices = self
+        self.actions = []
+
+    def resolve(self, name):
+        return self.aliases.get(name) or ({name} if name in self.indexes else set())
+
+    def count(self, index, body, ignore=()):
+        names = self.resolve(index)
+        if not names:
+            assert 404 in ignore
+            return {"status": 404}
+        return {"count": sum(self.indexes[name] for name in names)}
+
+    def refresh(self, index):
+        pass
+
+    def exists_alias(self, name):
+        return bool(self.aliases.get(name))
+
+    def get_alias(self, name):
+        return {index_name: {"aliases": {name: {}}} for index_name in self.aliases[name]}
+
+    def exists(self, index):
+        return index in self.indexes
+
+    def update_aliases(self, body):
+        self.actions.append(body["actions"])
+        for action in body["actions"]:
+            (kind, arguments), = action.items()
+            if kind == "add":
+                self.aliases.setdefault(arguments["alias"], set()).add(arguments["index"])
+            elif kind == "remove":
+                self.aliases[arguments["alias"]].remove(arguments["index"])
+            else:
+                del self.indexes[arguments["index"]]
+        return {"acknowledged": True}
+
+    def get(self, index):
+        prefix = index.rstrip("*")
+        return {name: {} for name in self.indexes if name.startswith(prefix)}
+
+    def delete(self, index, ignore=()):
+        del self.indexes[index]
+
+
+def test_build_needs_orgs():
+    # Checked before anything is loaded
+    with pytest.raises(Exception, match="--build needs --funders and --recipients"):
+        import_to_elasticsearch.import_to_elasticsearch([], False, recipients="recipients.jl", build=True)
+    with pytest.raises(Exception, match="--build needs --funders and --recipients"):
+        import_to_elasticsearch.import_to_elasticsearch([], False, funders="funders.jl", build=True)
+
+
+def test_publish_index():
+    publish_index = import_to_elasticsearch.publish_index
+    results = {"grants.json": (10, [])}
+
+    # The first publish, with no alias or index yet
+    es = FakeAliasES({"gn_20240101000000": 10})
+    publish_index(es, "gn", "gn_20240101000000", results)
+    assert es.aliases == {"gn": {"gn_20240101000000"}}
+
+    # The alias moves from the old generation to the new one in one update
+    es.indexes["gn_20240102000000"] = 10
+    publish_index(es, "gn", "gn_20240102000000", results)
+    assert es.aliases == {"gn": {"gn_20240102000000"}}
+    assert es.actions[-1] == [{"remove": {"index": "gn_20240101000000", "alias": "gn"}},
+                              {"add": {"index": "gn_20240102000000", "alias": "gn"}}]
+
+    # Only the newest generations are kept, and never the new live index even
+    # when an older-named one is newer
+    es.indexes.update({"gn_20240103000000": 10, "gn_20231231000000": 10, "gn_other": 10})
+    publish_index(es, "gn", "gn_20231231000000", results, keep=2)
+    assert es.aliases == {"gn": {"gn_20231231000000"}}
+    assert set(es.indexes) == {"gn_20231231000000", "gn_20240103000000", "gn_other"}
+    publish_index(es, "gn", "gn_20231231000000", results, keep=1)
+    assert set(es.indexes) == {"gn_20231231000000", "gn_other"}
+
+    # An index loaded before aliases were used is replaced by the alias
+    es = FakeAliasES({"gn": 10, "gn_20240101000000": 10})
+    publish_index(es, "gn", "gn_20240101000000", results)
+    assert es.aliases == {"gn": {"gn_20240101000000"}}
+    assert set(es.indexes) == {"gn_20240101000000"}
+    assert es.actions == [[{"add": {"index": "gn_20240101000000", "alias": "gn"}}, {"remove_index": {"index": "gn"}}]]
+
+    # A load with errors, or far fewer grants than the live index, isn't published
+    es.indexes["gn_20240102000000"] = 4
+    with pytest.raises(Exception, match="Not switching"):
+        publish_index(es, "gn", "gn_20240102000000", results)
+    es.indexes["gn_20240102000000"] = 10
+    with pytest.raises(Exception, match="Not switching"):
+        publish_index(es, "gn", "gn_20240102000000", {"grants.json": (9, [{"index": {}}])})
+    assert es.aliases == {"gn": {"gn_20240101000000"}}
+
+
+def test_import_checkpoint(tmpdir):
+    es = FakeBulkES()
+    docs = [{"_id": str(i), "_index": "threesixtygiving", "title": "x" * 100} for i in range(10)]
+    checkpoint = ImportCheckpoint(str(tmpdir.join("checkpoint.json")))
+    checkpoint.reset("threesixtygiving")
+
+    def save_progress(grants, success, errors):
+        checkpoint.update("grants.json", grants, success, errors)
+        checkpoint.save()
+        # Nothing is recorded as sent before elasticsearch has acknowledged it
+        assert grants == sum(len(lines) // 2 for lines in es.requests)
+
+    AdaptiveBulkSender(es, batch_bytes=500, verbose=False).send(docs, on_batch=save_progress)
+
+    checkpoint = ImportCheckpoint(str(tmpdir.join("checkpoint.json")))
+    assert checkpoint.index == "threesixtygiving"
+    assert checkpoint.progress("grants.json") == {"grants": 10, "success": 10, "errors": [], "done": False}
+    assert checkpoint.progress("other.json")["grants"] == 0
+
+
+def test_bulk_files(tmpdir):
+    docs = [{"_id": str(i), "_index": None, "title": "Grant \u00a3{}".format(i)} for i in range(3)]
+    bulk_path = str(tmpdir.join("grants.ndjson.gz"))
+    assert write_bulk_file(bulk_path, docs) == 3
+
+    lines = list(read_bulk_file(bulk_path))
+    assert lines[0] == '{"index":{"_id":"0"}}\n{"title":"Grant \u00a30"}\n'
+
+    es = FakeBulkES()
+    assert AdaptiveBulkSender(es, index_name="threesixtygiving", verbose=False).send_lines(lines) == (3, [])
+    assert len(es.requests[0]) == 6
+
+
+class FakeIngestES(FakeBulkES, FakeIndicesES):
+    """ Just enough of the elasticsearch client for ingest_bulk_files """
+
+    def __init__(self):
+        FakeBulkES.__init__(self)
+        FakeIndicesES.__init__(self, {})
+
+    def delete(self, index, ignore=()):
+        self.calls.append(("delete", {}))
+
+
+def test_ingest_bulk_files(tmpdir, monkeypatch):
+    docs = [{"_id": str(i), "_index": None, "title": "Grant {}".format(i)} for i in range(5)]
+    bulk_paths = [str(tmpdir.join("grants-a.ndjson.gz")), str(tmpdir.join("grants-b.ndjson.gz"))]
+    write_bulk_file(bulk_paths[0], docs[:3])
+    write_bulk_file(bulk_paths[1], docs[3:])
+
+    stored = []
+    monkeypatch.setattr(ingest_bulk_files, "maybe_create_index", lambda index_name: stored.append("index"))
+    for name in ["build_rollups", "store_search_summary", "store_index_generation"]:
+        monkeypatch.setattr(ingest_bulk_files, name, functools.partial(lambda name, es, index_name: stored.append(name), name))
+
+    # Ingests into an index that others are still loading into only send the grants
+    es = FakeIngestES()
+    ingest_bulk_files.ingest_bulk_files(es, bulk_paths, "test", bulk_settings=False, rollups=False)
+    sent_ids = [json.loads(action)["index"]["_id"] for lines in es.requests for action in lines[::2]]
+    assert sent_ids == ["0", "1", "2", "3", "4"]
+    assert stored == ["index"]
+    assert es.calls == []
+
+    # The last one also stores the rollups, search summary and a new generation
+    stored.clear()
+    es = FakeIngestES()
+    ingest_bulk_files.ingest_bulk_files(es, bulk_paths, "test", clean=True)
+    assert sum(len(lines) for lines in es.requests) == 10
+    assert stored == ["index", "build_rollups", "store_search_summary", "store_index_generation"]
+    assert es.calls[0] == ("delete", {})
+    assert es.calls[-2:] == [("forcemerge", {"max_num_segments": 1}), ("refresh", {})]
+
+
+def test_grants_file_formats(tmpdir):
+    with open(os.path.join(prefix, "a002400000KeYdsAAF.json")) as fp:
+        grants = json.load(fp)["grants"]
+
+    gzipped = str(tmpdir.join("a002400000KeYdsAAF.json.gz"))
+    with gzip.open(gzipped, "wt") as fp:
+        json.dump({"grants": grants}, fp)
+    json_lines = str(tmpdir.join("a002400000KeYdsAAF.jsonl"))
+    with open(json_lines, "w") as fp:
+        for grant in grants:
+            fp.write(json.dumps(grant) + "\n")
+
+    for path in [os.path.join(prefix, "a002400000KeYdsAAF.json"), gzipped, json_lines]:
+        assert is_grants_file(path)
+        assert grants_file_name(path) == "a002400000KeYdsAAF.json"
+        with open_grants_file(path) as fp:
+            assert [grant["id"] for grant in iter_grants(fp, path)] == [grant["id"] for grant in grants]
+
+    assert not is_grants_file("grants.csv")
+    assert not is_grants_file("grants.json.bz2")
+
+
+def test_fast_serializer_matches_json_serializer():
+    pytest.importorskip("orjson")
+    with open(os.path.join(prefix, "a002400000KeYdsAAF.json"), "rb") as fp:
+        grants = list(get_ijson_backend("python").items(fp, "grants.item"))
+    grants[0]["extra"] = {"date": datetime.date(2018, 1, 31), "amount": decimal.Decimal("10.5"), "big": 2 ** 70}
+
+    for grant in grants:
+        assert FastJSONSerializer().dumps(grant) == elasticsearch.serializer.JSONSerializer().dumps(grant)
+
+
+def test_enrichment_stages(monkeypatch):
+    # The canonical orgs stage needs the orgs in elasticsearch
+    monkeypatch.setattr(import_to_elasticsearch, "enrichment_stages", import_to_elasticsearch.enrichment_stages)
+    import_to_elasticsearch.disable_stages(["canonical_orgs"])
+    with pytest.raises(Exception):
+        import_to_elasticsearch.disable_stages(["not_a_stage"])
+
+    with open(os.path.join(prefix, "a002400000KeYdsAAF.json")) as fp:
+        grants = json.load(fp)["grants"]
+    grants[1]["plannedDates"] = None
+
+    stats = EnrichmentStats()
+    with pytest.warns(UserWarning, match="dateonly_fields failed"):
+        for grant in grants:
+            prepare_grant(grant, "a002400000KeYdsAAF.json", "threesixtygiving", stats)
+
+    assert list(stats.stages) == [stage.name for stage in import_to_elasticsearch.ENRICHMENT_STAGES[1:]]
+    assert [errors for seconds, errors in stats.stages.values()] == [0, 0, 1, 0, 0, 0, 0, 0]
+    assert grants[0]["additional_data"]["GNBestCountyName"]
+    assert grants[1]["additional_data"]["GNBestCountyName"]
+
+    # A required stage failing stops the import rather than loading the grant without its fields
+    monkeypatch.setattr(import_to_elasticsearch, "enrichment_stages", import_to_elasticsearch.ENRICHMENT_STAGES)
+    monkeypatch.setattr(import_to_elasticsearch, "org_directory", OrgDirectory())
+    for org_type in ["funder", "recipient"]:
+        import_to_elasticsearch.org_directory.mark_loaded(org_type)
+    del grants[0]["fundingOrganization"]
+    with pytest.raises(Exception, match="canonical_orgs failed"):
+        prepare_grant(grants[0], "a002400000KeYdsAAF.json", "threesixtygiving")
+
+
+def test_dataset_stats():
+    grants = [
+        {"fundingOrganization": [{"id_and_name": '["Funder A", "GB-A"]'}], "awardDate": "2018-03-01",
+         "currency": "GBP", "amountAwarded": 100},
+        {"fundingOrganization": [{"id_and_name": '["Funder B", "GB-B"]'}], "awardDate": "2017-01-31T00:00:00Z",
+         "currency": "GBP", "amountAwarded": 50.5},
+        {"fundingOrganization": [{"id_and_name": '["Funder B", "GB-B"]'}], "awardDate": "not a date",
+         "currency": "USD", "amountAwarded": 10},
+    ]
+    stats = DatasetStats()
+    stats.add(grants[0])
+    # Chunks from the workers are merged
+    chunk_stats = DatasetStats()
+    for grant in grants[1:]:
+        chunk_stats.add(grant)
+    stats.merge(chunk_stats)
+
+    assert stats.document("a002400000KeYdsAAF.json") == {
+        "dataType": "dataset",
+        "filename": "a002400000KeYdsAAF.json",
+        "datasetStats": {
+            "grants": 3,
+            "funders": ['["Funder B", "GB-B"]', '["Funder A", "GB-A"]'],
+            "minAwardDate": "2017-01-31",
+            "maxAwardDate": "2018-03-01",
+            "amountAwarded": {"GBP": 150.5, "USD": 10},
+        },
+    }
+
+
+class FakeHashES(object):
+    """ Just enough of the elasticsearch client for ChangedGrants """
+
+    def __init__(self, hashes):
+        self.hashes = hashes
+        self.requests = []
+
+    def mget(self, index, body, _source_includes):
+        self.requests.append(body["ids"])
+        return {"docs": [
+            {"_id": _id, "found": True, "_source": {"contentHash": self.hashes[_id]}} if _id in self.hashes
+            else {"_id": _id, "found": False}
+            for _id in body["ids"]
+        ]}
+
+
+def test_changed_grants():
+    grants = [{"_id": str(i), "_index": "threesixtygiving", "title": "Grant {}".format(i)} for i in range(5)]
+    for grant in grants:
+        grant["contentHash"] = content_hash(grant)
+
+    # The hash doesn't depend on key order or the bulk metadata
+    assert content_hash(dict(reversed(list(grants[0].items())))) == grants[0]["contentHash"]
+    assert content_hash(dict(grants[0], _index="threesixtygiving_20240101120000")) == grants[0]["contentHash"]
+    assert content_hash(dict(grants[0], title="Changed")) != grants[0]["contentHash"]
+
+    # Grant 1 has changed, grant 4 is new
+    es = FakeHashES({"0": grants[0]["contentHash"], "1": "old", "2": grants[2]["contentHash"],
+                     "3": grants[3]["contentHash"]})
+    changes = ChangedGrants(es, "threesixtygiving", batch_size=2)
+    assert [grant["_id"] for grant in changes.filter(grants)] == ["1", "4"]
+    assert es.requests == [["0", "1"], ["2", "3"], ["4"]]
+    assert changes.unchanged == 3
+    assert changes.ids == {"0", "1", "2", "3", "4"}
+    assert [changes.grants_read(sent) for sent in range(3)] == [0, 2, 5]
+
+
+def test_synthetic_data(tmpdir):
+    grants_path = str(tmpdir.join("synthetic-0.json"))
+    SyntheticData(seed=0).write_grants_file(grants_path, 50, funders=3, recipients=20)
+    with open_grants_file(grants_path) as fp:
+        grants = list(iter_grants(fp, grants_path))
+
+    # The same seed makes the same grants
+    assert list(SyntheticData(seed=0).grants(50, 3, 20)) == list(SyntheticData(seed=0).grants(50, 3, 20))
+    assert [grant["awardDate"] for grant in grants] == [
+        grant["awardDate"] for grant in SyntheticData(seed=0).grants(50, 3, 20)]
+    assert len({grant["id"] for grant in grants}) == 50
+    for grant in grants:
+        assert grant["additional_data"]["locationLookup"]
+        assert grant["additional_data"]["recipientOrgInfos"][0]["id"] == grant["recipientOrganization"][0]["id"]
+        assert parse_date(grant["awardDate"])
+
+    org_directory = OrgDirectory()
+    for org in SyntheticData(seed=0).orgs(20, "recipient"):
+        org_directory.add(org, "recipient")
+    assert org_directory.get("GB-SYN-RECIPIENT-19", "recipient") == ("Synthetic Recipient 19", "GB-SYN-RECIPIENT-19")
+
+
+class RecordingSink(BulkSink):
+    """ A BulkSink that appends the bulk requests to a file for each process,
+    so that the requests sent by worker processes can be read back """
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        self.indexed = {}
+
+    def bulk(self, body, index=None):
+        with open(os.path.join(self.directory, "{}.ndjson".format(os.getpid())), "a") as fp:
+            fp.write(body)
+        return super().bulk(body, index)
+
+    def index(self, index, id, body):
+        self.indexed[id] = body
+
+
+def sent_documents(directory):
+    docs = {}
+    for path in directory.listdir("*.ndjson"):
+        lines = path.read().splitlines()
+        for action, source in zip(lines[::2], lines[1::2]):
+            docs[json.loads(action)["index"]["_id"]] = json.loads(source)
+    return docs
+
+
+def test_import_grants_parallel(tmpdir, monkeypatch):
+    data = SyntheticData(seed=1)
+    org_directory = OrgDirectory()
+    for org_type, count in [("funder", 3), ("recipient", 20)]:
+        for org in data.orgs(count, org_type):
+            org_directory.add(org, org_type)
+    monkeypatch.setattr(import_to_elasticsearch, "org_directory", org_directory)
+
+    files = [str(tmpdir.join("synthetic-1.jsonl")), str(tmpdir.join("synthetic-2.json"))]
+    SyntheticData(seed=1).write_grants_file(files[0], 25, funders=3, recipients=20)
+    SyntheticData(seed=2).write_grants_file(files[1], 10, funders=3, recipients=20)
+    with open(files[0], "a") as fp:
+        fp.write("\n")
+    with open_grants_file(files[0]) as fp:
+        jsonl_grants = list(iter_grants(fp, files[0]))
+
+    # JSON Lines files are split into byte ranges of chunk_size grants, other files aren't split
+    chunks = list(grant_chunks(files, 10))
+    assert [(path, start) for path, start, byte_range in chunks] == [(files[0], 0), (files[0], 10), (files[0], 20),
+                                                                     (files[1], 0)]
+    assert chunks[3][2] is None
+    assert [grant for chunk in chunks[:3] for grant in read_grant_chunk(*chunk)] == jsonl_grants
+    assert [len(list(read_grant_chunk(*chunk))) for chunk in chunks] == [10, 10, 5, 10]
+    # Resuming skips the grants already sent
+    chunks = list(grant_chunks(files, 10, {files[0]: 15, files[1]: 4}))
+    assert [(path, start) for path, start, byte_range in chunks] == [(files[0], 15), (files[1], 4)]
+    assert list(read_grant_chunk(*chunks[0])) == jsonl_grants[15:]
+    assert len(list(read_grant_chunk(*chunks[1]))) == 6
+
+    # The workers send the same documents and store the same dataset statistics and progress as one process
+    loads = []
+    for workers in [1, 3]:
+        load_dir = tmpdir.mkdir("workers-{}".format(workers))
+        sink = RecordingSink(str(load_dir))
+        checkpoint = ImportCheckpoint(str(load_dir.join("checkpoint.json")))
+        results = import_to_elasticsearch.import_grants(sink, files, workers, chunk_size=10, index_name="test",
+                                                        checkpoint=checkpoint,
+                                                        make_es=functools.partial(RecordingSink, str(load_dir)))
+        loads.append((dict(results), sent_documents(load_dir), sink.indexed, checkpoint.files))
+
+    assert loads[0][0] == {files[0]: (25, []), files[1]: (10, [])}
+    assert len(loads[0][1]) == 35
+    assert len(loads[0][2]) == 2
+    assert loads[0][3][grants_file_name(files[0])] == {"grants": 25, "success": 25, "errors": [], "done": True}
+    assert loads[0] == loads[1]
+
+    # A resumed import's dataset documents still cover all of the files' grants
+    for workers in [1, 3]:
+        load_dir = tmpdir.mkdir("resumed-{}".format(workers))
+        sink = RecordingSink(str(load_dir))
+        checkpoint = ImportCheckpoint(str(load_dir.join("checkpoint.json")))
+        checkpoint.update(grants_file_name(files[0]), 15, 15, [])
+        import_to_elasticsearch.import_grants(sink, files, workers, chunk_size=10, index_name="test",
+                                              checkpoint=checkpoint,
+                                              make_es=functools.partial(RecordingSink, str(load_dir)))
+        assert len(sent_documents(load_dir)) == 20
+        assert sink.indexed == loads[0][2]
+        assert checkpoint.files == loads[0][3]
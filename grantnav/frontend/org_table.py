@@ -0,0 +1,83 @@
+import json
+import mmap
+import os
+
+# The org table is a read-only file of every org, for get_org to look orgs up
+# in without searching elasticsearch. It has a line for each org id:
+#
+#   <org type> <org id>\t<org JSON>\n
+#
+# sorted by the part before the tab, so that an org can be found with a binary
+# search. The file is memory mapped, so all the web worker processes on a
+# server share one copy of it in the page cache.
+
+
+def org_table_key(org_id, org_type):
+    return "{} {}".format(org_type, org_id).encode("utf-8")
+
+
+class OrgTableWriter(object):
+    """ Collects the org documents (as they are stored in elasticsearch) and
+    writes them out as an org table """
+
+    def __init__(self):
+        # key -> org JSON
+        self.lines = {}
+
+    def add(self, org, org_type):
+        org_json = json.dumps(org, separators=(",", ":"), default=str).encode("utf-8")
+        for org_id in org["orgIDs"]:
+            if "\t" in org_id or "\n" in org_id:
+                continue
+            # Same as searching on orgIDs: the first org loaded wins
+            self.lines.setdefault(org_table_key(org_id, org_type), org_json)
+
+    def write(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as fp:
+            for key in sorted(self.lines):
+                fp.write(key + b"\t" + self.lines[key] + b"\n")
+        # Web workers with the old table open keep using it until they
+        # notice that it has been replaced
+        os.replace(tmp_path, path)
+        return len(self.lines)
+
+
+class OrgTable(object):
+    """ Looks up orgs in an org table file """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fp:
+            self.stat = os.fstat(fp.fileno())
+            # mmap can't map an empty file
+            self.table = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) if self.stat.st_size else b""
+
+    def is_current(self):
+        """ False if the file has been replaced since it was opened """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns) == (self.stat.st_ino, self.stat.st_mtime_ns)
+
+    def get(self, org_id, org_type):
+        """ The org with org_id as one of its orgIDs, or None """
+        key = org_table_key(org_id, org_type)
+        table = self.table
+        low, high = 0, len(table)
+        # low is always the start of a line
+        while low < high:
+            middle = (low + high) // 2
+            newline = table.rfind(b"\n", low, middle)
+            start = newline + 1 if newline != -1 else low
+            end = table.find(b"\n", start)
+            tab = table.find(b"\t", start, end)
+            line_key = table[start:tab]
+            if line_key == key:
+                return json.loads(table[tab + 1:end])
+            elif line_key < key:
+                low = end + 1
+            else:
+                high = start
+        return None
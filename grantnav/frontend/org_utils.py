@@ -1,4 +1,21 @@
+import collections
+import json
+import threading
+import time
+
+from django.conf import settings
+
+from grantnav.frontend.org_table import OrgTable
 from grantnav.frontend.search_helpers import get_results
+from grantnav.index import get_index_generation
+
+# The org type of each of the grants' org fields
+ORG_TYPES = {"fundingOrganization": "funder", "recipientOrganization": "recipient"}
+
+# Orgs in the order the importer loaded them, as the first org loaded with an
+# org id is the one the importer gave that org id's grants. Indexes loaded
+# before orgOrder was stored have no order.
+ORG_ORDER_SORT = [{"orgOrder": {"order": "asc", "unmapped_type": "integer"}}]
 
 
 def new_stats_by_currency(org_result):
@@ -52,22 +69,116 @@ class OrgNotFoundError(Exception):
     pass
 
 
-orgs_cache = {"funder": {}, "recipient": {}}
+class LRUCache(object):
+    """ A cache of at most max_size items that drops the least recently used
+    item when it is full, and counts its hits and misses """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def stats(self):
+        return {"size": len(self.items), "max_size": self.max_size, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions}
+
+
+orgs_cache = {"funder": LRUCache(settings.ORG_CACHE_SIZE), "recipient": LRUCache(settings.ORG_CACHE_SIZE)}
+
+# (org field, org id) -> the id_and_names of the org's grants, see get_id_and_names
+id_and_names_cache = LRUCache(settings.ORG_CACHE_SIZE)
+
+# The index generation that the orgs and id_and_names were cached from
+orgs_cache_generation = None
+
+# The org table from settings.ORG_TABLE_PATH (None if there is no file there),
+# the path it was opened from and the time.monotonic() it was last checked
+org_table = None
+org_table_path = None
+org_table_checked = 0
+
+
+def get_org_table():
+    """ The org table, if there is one. Every INDEX_GENERATION_TTL seconds it is
+    checked for having been replaced by the importer, or for having been
+    written if it was missing. When a new table is opened the orgs cached from
+    the old one are dropped. """
+    global org_table, org_table_path, org_table_checked
+    if not settings.ORG_TABLE_PATH:
+        return None
+
+    now = time.monotonic()
+    if org_table_path == settings.ORG_TABLE_PATH and now - org_table_checked < settings.INDEX_GENERATION_TTL:
+        return org_table
+    org_table_checked = now
+
+    if org_table_path != settings.ORG_TABLE_PATH or org_table is None or not org_table.is_current():
+        org_table_path = settings.ORG_TABLE_PATH
+        try:
+            org_table = OrgTable(org_table_path)
+        except FileNotFoundError:
+            org_table = None
+        else:
+            for cache in orgs_cache.values():
+                cache.clear()
+    return org_table
+
 
+def check_orgs_cache_generation():
+    """ Drop the cached orgs and id_and_names when the index has a new
+    generation, as they may have changed in the import """
+    global orgs_cache_generation
+    generation = get_index_generation()
+    if generation != orgs_cache_generation:
+        for cache in orgs_cache.values():
+            cache.clear()
+        id_and_names_cache.clear()
+        orgs_cache_generation = generation
 
-def get_org(org_id, org_type):
+
+def get_org(org_id, org_type, use_cache=True):
     """ org_type: recipient, funder
     returns an organisation match
+    use_cache: see get_results
     """
-    # Don't allow the memory cache to grow infinitely
-    if len(orgs_cache[org_type].keys()) > 300000:
-        orgs_cache[org_type] = {}
+    check_orgs_cache_generation()
+    table = get_org_table()
 
-    try:
-        org = orgs_cache[org_type][org_id]
+    org = orgs_cache[org_type].get(org_id)
+    if org is not None:
         return org
-    except KeyError:
-        pass
+
+    if table:
+        org = table.get(org_id, org_type)
+        if org is not None:
+            orgs_cache[org_type].put(org_id, org)
+            return org
 
     query = {
         "query": {
@@ -76,14 +187,112 @@ def get_org(org_id, org_type):
                     {"term": {"orgIDs": org_id}}
                 ]
             }
-        }
+        },
+        "sort": ORG_ORDER_SORT,
     }
 
     try:
-        org = get_results(query, data_type=org_type)["hits"]["hits"][0]["_source"]
+        org = get_results(query, data_type=org_type, use_cache=use_cache)["hits"]["hits"][0]["_source"]
         # Save the org to the cache
-        orgs_cache[org_type][org_id] = org
+        orgs_cache[org_type].put(org_id, org)
         return org
     except (IndexError, KeyError):
         # Failed to find org
         raise OrgNotFoundError
+
+
+def get_orgs(org_ids, org_type):
+    """ The orgs of each of org_ids that has one, like get_org, as a dict of
+    org id -> org. The org ids that aren't cached or in the org table are
+    searched for in one query, and the orgs found are cached. """
+    check_orgs_cache_generation()
+    table = get_org_table()
+
+    orgs = {}
+    missing = []
+    for org_id in org_ids:
+        org = orgs_cache[org_type].get(org_id)
+        if org is None and table:
+            org = table.get(org_id, org_type)
+            if org is not None:
+                orgs_cache[org_type].put(org_id, org)
+        if org is not None:
+            orgs[org_id] = org
+        else:
+            missing.append(org_id)
+
+    if missing:
+        query = {
+            "query": {"bool": {"filter": [{"terms": {"orgIDs": missing}}]}},
+            "aggs": {
+                "org_ids": {
+                    "terms": {"field": "orgIDs", "include": missing, "size": len(missing)},
+                    "aggs": {"first_org": {"top_hits": {"size": 1, "sort": ORG_ORDER_SORT}}},
+                }
+            },
+        }
+        buckets = get_results(query, 0, data_type=org_type)["aggregations"]["org_ids"]["buckets"]
+        for bucket in buckets:
+            org = bucket["first_org"]["hits"]["hits"][0]["_source"]
+            orgs[bucket["key"]] = org
+            orgs_cache[org_type].put(bucket["key"], org)
+
+    return orgs
+
+
+def get_id_and_names(org_ids, org_field):
+    """ The id_and_names (JSON [name, id] of the canonical org) of the grants
+    whose org_field (fundingOrganization or recipientOrganization) org has one
+    of org_ids, for filtering the grants by org.
+
+    An org id that has an org document has that org's id_and_name, the same
+    as the importer gives its grants. The orgs are found with get_orgs, and the
+    id_and_names of the grants of the other org ids are aggregated, so there
+    are at most two queries. The id_and_names of each org id are cached until
+    the index has a new generation. """
+    if not org_ids:
+        return []
+
+    check_orgs_cache_generation()
+
+    found = {}
+    uncached = []
+    for org_id in org_ids:
+        id_and_names = id_and_names_cache.get((org_field, org_id))
+        if id_and_names is not None:
+            found[org_id] = id_and_names
+        else:
+            uncached.append(org_id)
+
+    not_found = []
+    orgs = get_orgs(uncached, ORG_TYPES[org_field]) if uncached else {}
+    for org_id in uncached:
+        org = orgs.get(org_id)
+        if org is None:
+            not_found.append(org_id)
+            continue
+        found[org_id] = [json.dumps([new_ordered_names(org)[0], new_org_ids(org)[0]])]
+        id_and_names_cache.put((org_field, org_id), found[org_id])
+
+    if not_found:
+        query = {
+            "query": {"bool": {"filter": [{"terms": {org_field + ".id": not_found}}]}},
+            "aggs": {
+                "org_ids": {
+                    "terms": {"field": org_field + ".id", "size": len(not_found)},
+                    "aggs": {"id_and_names": {"terms": {"field": org_field + ".id_and_name"}}},
+                }
+            },
+        }
+        buckets = get_results(query, 0)["aggregations"]["org_ids"]["buckets"]
+        aggregated = {bucket["key"]: [name["key"] for name in bucket["id_and_names"]["buckets"]] for bucket in buckets}
+        for org_id in not_found:
+            found[org_id] = aggregated.get(org_id, [])
+            id_and_names_cache.put((org_field, org_id), found[org_id])
+
+    id_and_names = []
+    for org_id in org_ids:
+        for id_and_name in found[org_id]:
+            if id_and_name not in id_and_names:
+                id_and_names.append(id_and_name)
+    return id_and_names
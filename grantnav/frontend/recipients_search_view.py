@@ -1,5 +1,4 @@
 import collections
-import copy
 import json
 
 import elasticsearch.exceptions
@@ -11,13 +10,17 @@ from grantnav.frontend.search_helpers import get_results, get_request_type_and_s
 from grantnav.frontend.funders_search_view import get_dropdown_filters
 import grantnav.frontend.search_helpers as helpers
 
-BASIC_FILTER = [
-    {"bool": {"should": []}},  # currency
-]
+# The filters of BASIC_FILTER by name, the param_name of a terms facet's filter
+SEARCH_FILTERS = {
+    "currency": {"bool": {"should": []}},
+}
+
+BASIC_FILTER = list(SEARCH_FILTERS.values())
+FILTER_POSITIONS = helpers.filter_positions(SEARCH_FILTERS)
 
 TermFacet = collections.namedtuple("TermFacet", "field_name param_name filter_index display_name is_json facet_size")
 
-TERM_FACETS = [TermFacet("currency", "currency", 0, "Currency", False, 5000)]
+TERM_FACETS = [TermFacet("currency", "currency", FILTER_POSITIONS["currency"], "Currency", False, 5000)]
 
 
 BASIC_QUERY = {
@@ -35,9 +38,9 @@ for term_facet in TERM_FACETS:
 def create_json_query_from_parameters(request):
     """Transforms the URL GET parameters of the request into an object (json_query) that is to be used by elasticsearch"""
 
-    json_query = copy.deepcopy(BASIC_QUERY)
-    json_query["query"]["bool"]["must"]["query_string"]["query"] = request.GET.get("query", "*")
-    json_query["query"]["bool"]["must"]["query_string"]["default_field"] = request.GET.get("default_field", "*")
+    json_query = helpers.replace_query_string(
+        BASIC_QUERY, query=request.GET.get("query", "*"), default_field=request.GET.get("default_field", "*")
+    )
 
     sort_order = request.GET.get("sort", "").split()
     if sort_order and len(sort_order) == 2:
@@ -45,7 +48,7 @@ def create_json_query_from_parameters(request):
         json_query["sort"] = sort
 
     for term_facet in TERM_FACETS:
-        helpers.term_facet_from_parameters(
+        json_query = helpers.term_facet_from_parameters(
             request,
             json_query,
             term_facet.field_name,
@@ -115,13 +118,12 @@ def search(request):
         if not text_query:
             text_query = "*"
         try:
-            json_query["query"]["bool"]["must"]["query_string"]["query"] = text_query
+            json_query = helpers.replace_query_string(json_query, query=text_query)
         except KeyError:
-            json_query = copy.deepcopy(BASIC_QUERY)
-            json_query["query"]["bool"]["must"]["query_string"]["query"] = text_query
+            json_query = helpers.replace_query_string(BASIC_QUERY, query=text_query)
 
         if default_field:
-            json_query["query"]["bool"]["must"]["query_string"]["default_field"] = default_field
+            json_query = helpers.replace_query_string(json_query, default_field=default_field)
         return redirect(request.path + "?" + create_parameters_from_json_query(json_query))
 
     sort_order = request.GET.get("sort", "").split()
@@ -145,11 +147,10 @@ def search(request):
             context["text_query"] = json_query["query"]["bool"]["must"]["query_string"]["query"]
             default_field = json_query["query"]["bool"]["must"]["query_string"]["default_field"]
         except KeyError:
-            json_query = copy.deepcopy(BASIC_QUERY)
-            json_query["query"]["bool"]["must"]["query_string"]["query"] = ""
+            json_query = helpers.replace_query_string(BASIC_QUERY, query="")
             context["text_query"] = ""
             if default_field:
-                json_query["query"]["bool"]["must"]["query_string"]["default_field"] = default_field
+                json_query = helpers.replace_query_string(json_query, default_field=default_field)
             default_field = json_query["query"]["bool"]["must"]["query_string"]["default_field"]
         # same as grant ends
 
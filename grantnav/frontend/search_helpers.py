@@ -1,16 +1,31 @@
-import copy
+import hashlib
 import math
 import re
 import json
 
+import elasticsearch.exceptions
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import urlencode
+from prometheus_client import Counter
 from retry import retry
 
 from grantnav.search import get_es
-from grantnav.index import get_index
+from grantnav.index import get_index, get_index_generation
 
 SIZE = 20
 
+# Results with more hits than this, e.g. downloads, aren't cached
+RESULTS_CACHE_MAX_SIZE = 100
+
+RESULTS_CACHE = Counter(
+    "results_cache", "Search results looked up in this process's results cache, by whether they were found", ["result"]
+)
+
+# A facet value that marks where a facet's values go in the URL parameters,
+# see FacetURLBuilder
+FACET_PLACEHOLDER = "GNFacetValuePlaceholder"
+
 
 def clean_object(obj):
     for key, value in list(obj.items()):
@@ -40,12 +55,62 @@ def clean_for_es(json_query):
     return json_query
 
 
-@retry(tries=5, delay=0.5, backoff=2, max_delay=20)
-def get_results(json_query, size=10, from_=0, data_type="grant"):
-    es = get_es()
-    extra_context = json_query.pop("extra_context", None)
-
-    new_json_query = clean_for_es(copy.deepcopy(json_query))
+def cleaned(value):
+    """ A cleaned copy of value, the same as clean_for_es(copy.deepcopy(value))
+    but made in one pass. Only the dicts and lists are copied. """
+    if isinstance(value, dict):
+        new_dict = {}
+        for key, item in value.items():
+            item = cleaned(item)
+            if isinstance(item, (dict, list)) and not item:
+                continue
+            new_dict[key] = item
+        return new_dict
+    elif isinstance(value, list):
+        return [item for item in map(cleaned, value) if isinstance(item, (dict, list, str)) and item]
+    return value
+
+
+def replace_filters(json_query, changes):
+    """ A copy of json_query with clauses of some of its filters' bools
+    replaced, changes being e.g. {bool_index: {"should": []}}, a clause of None
+    is removed. Only the dicts and lists on the way to the changed filters are
+    copied, everything else is shared with json_query, so neither should be
+    changed in place afterwards. """
+    query_bool = dict(json_query["query"]["bool"])
+    filters = list(query_bool["filter"])
+    for bool_index, clauses in changes.items():
+        filter_bool = dict(filters[bool_index]["bool"], **clauses)
+        filters[bool_index] = dict(filters[bool_index], bool={
+            condition: clause for condition, clause in filter_bool.items() if clause is not None
+        })
+    query_bool["filter"] = filters
+    return dict(json_query, query=dict(json_query["query"], bool=query_bool))
+
+
+def replace_filter(json_query, bool_index, **clauses):
+    return replace_filters(json_query, {bool_index: clauses})
+
+
+def replace_query_string(json_query, **parameters):
+    """ A copy of json_query with parameters of its query_string replaced,
+    e.g. query="*", sharing the rest of json_query like replace_filters """
+    query_bool = json_query["query"]["bool"]
+    must = dict(query_bool["must"], query_string=dict(query_bool["must"]["query_string"], **parameters))
+    return dict(json_query, query=dict(json_query["query"], bool=dict(query_bool, must=must)))
+
+
+def filter_positions(search_filters):
+    """ The position of each filter in a search view's BASIC_FILTER, which is
+    made from search_filters, its filters by name """
+    return {name: position for position, name in enumerate(search_filters)}
+
+
+def es_query(json_query, data_type="grant"):
+    """ The elasticsearch query for a json_query: a copy without the empty
+    filters and extra_context, that only matches documents of data_type """
+    new_json_query = cleaned(json_query)
+    new_json_query.pop("extra_context", None)
 
     if "query" not in new_json_query:
         new_json_query["query"] = {}
@@ -66,17 +131,105 @@ def get_results(json_query, size=10, from_=0, data_type="grant"):
         query["bool"]["filter"] = [single_term_query]
 
     query["bool"]["filter"].append({"term": {"dataType": {"value": data_type}}})
+    return new_json_query
+
+
+def results_cache_key(body, **parameters):
+    """ The cache key for the results of the search of the live index with the
+    elasticsearch request body and parameters. Queries that are the same once
+    cleaned by es_query have the same key. The key includes the index's
+    generation, so that results cached before an import aren't used after it. """
+    fingerprint = json.dumps([get_index(), get_index_generation(), body, parameters],
+                             sort_keys=True, separators=(",", ":"), default=str)
+    return "results:" + hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()
+
+
+def cache_results(size):
+    """ Whether to cache the results of a search of the live index for size
+    hits. Indexes loaded before generations were stored all have the
+    generation "", so their results can't be told apart and aren't cached. """
+    return bool(settings.RESULTS_CACHE_TIMEOUT) and 0 <= size <= RESULTS_CACHE_MAX_SIZE and \
+        get_index_generation() != ""
+
+
+def get_cached_results(cache_keys):
+    """ The cached results for each of cache_keys, or None for the ones that
+    aren't cached """
+    cached = cache.get_many(cache_keys)
+    RESULTS_CACHE.labels("hit").inc(len(cached))
+    RESULTS_CACHE.labels("miss").inc(len(cache_keys) - len(cached))
+    return [cached.get(cache_key) for cache_key in cache_keys]
+
+
+@retry(tries=5, delay=0.5, backoff=2, max_delay=20)
+def get_results(json_query, size=10, from_=0, data_type="grant", index=None, use_cache=True):
+    """ Search for json_query. The results of searches of the live index
+    (when index isn't given) are cached unless use_cache is False, e.g. for
+    the importer, which searches an index that it is changing. See
+    results_cache_key """
+    es = get_es()
+
+    new_json_query = es_query(json_query, data_type)
+
+    cache_key = None
+    if index is None:
+        index = get_index()
+        if use_cache and cache_results(size):
+            cache_key = results_cache_key(new_json_query, size=size, from_=from_)
+            results, = get_cached_results([cache_key])
+            if results is not None:
+                return results
 
     if from_ == -1:
-        results = es.search(body=new_json_query, index=get_index(), track_total_hits=True)
+        results = es.search(body=new_json_query, index=index, track_total_hits=True)
     else:
-        results = es.search(body=new_json_query, size=size, from_=from_, index=get_index(), track_total_hits=True)
+        results = es.search(body=new_json_query, size=size, from_=from_, index=index, track_total_hits=True)
+
+    if cache_key:
+        cache.set(cache_key, results, settings.RESULTS_CACHE_TIMEOUT)
 
-    if extra_context is not None:
-        json_query["extra_context"] = extra_context
     return results
 
 
+@retry(tries=5, delay=0.5, backoff=2, max_delay=20)
+def get_multiple_results(json_queries, size=10, data_type="grant"):
+    """ The results of several json_queries, like get_results, from one
+    msearch request rather than a search each """
+    if not json_queries:
+        return []
+
+    queries = [es_query(json_query, data_type) for json_query in json_queries]
+
+    if cache_results(size):
+        # The same keys as get_results
+        cache_keys = [results_cache_key(query, size=size, from_=0) for query in queries]
+        responses = get_cached_results(cache_keys)
+    else:
+        cache_keys = None
+        responses = [None] * len(queries)
+
+    # Only search for the results that weren't cached
+    missing = [position for position, response in enumerate(responses) if response is None]
+    if not missing:
+        return responses
+
+    body = []
+    for position in missing:
+        body.append({})
+        body.append(dict(queries[position], size=size, track_total_hits=True))
+
+    for position, response in zip(missing, get_es().msearch(body=body, index=get_index())["responses"]):
+        if "error" in response:
+            # Raised in the same way as a failed search
+            raise elasticsearch.exceptions.RequestError(response.get("status", 400), response["error"]["type"], response)
+        responses[position] = response
+
+    if cache_keys:
+        cache.set_many({cache_keys[position]: responses[position] for position in missing}, settings.RESULTS_CACHE_TIMEOUT)
+
+    return responses
+
+
 def get_request_type_and_size(request):
     results_size = SIZE
 
@@ -111,14 +264,71 @@ def get_data_from_path(path, data):
         return current_pos
 
 
+class FacetURLBuilder(object):
+    """ Makes the URL parameters for json_query with a terms facet's filter
+    changed, the same as create_parameters_from_json_query does, for the URL of
+    each of the facet's buckets. The rest of the query is only encoded once:
+    the parameters are made with a placeholder value for the facet, and each
+    URL replaces the placeholder with the facet's values. """
+
+    def __init__(self, json_query, field, param_name, bool_index, bool_condition, create_parameters_from_json_query,
+                 is_json=False):
+        self.json_query = json_query
+        self.field = field
+        self.param_name = param_name
+        self.bool_index = bool_index
+        self.bool_condition = bool_condition
+        self.create_parameters_from_json_query = create_parameters_from_json_query
+        self.is_json = is_json
+
+        placeholder = json.dumps(["", FACET_PLACEHOLDER]) if is_json else FACET_PLACEHOLDER
+        parameters = self.slow_parameters([{"term": {field: placeholder}}])
+        marker = urlencode([(param_name, FACET_PLACEHOLDER)])
+        if parameters.count(FACET_PLACEHOLDER) == 1 and marker in parameters:
+            self.prefix, self.suffix = parameters.split(marker)
+        else:
+            # e.g. the placeholder is in the text query
+            self.prefix = self.suffix = None
+
+    def slow_parameters(self, filters):
+        return self.create_parameters_from_json_query(
+            replace_filter(self.json_query, self.bool_index, **{self.bool_condition: filters})
+        )
+
+    def parameters(self, filters):
+        """ The URL parameters for json_query with the facet's filter set to filters """
+        if self.prefix is None:
+            return self.slow_parameters(filters)
+
+        values = [filter["term"][self.field] for filter in filters]
+        if self.is_json:
+            values = [json.loads(value)[1] for value in values]
+        facet_parameters = urlencode([(self.param_name, value) for value in values])
+
+        if facet_parameters:
+            return self.prefix + facet_parameters + self.suffix
+        # Drop the & that joined the facet's parameters to the others
+        if self.prefix:
+            return self.prefix[:-1] + self.suffix
+        return self.suffix[1:]
+
+
 def get_pagination(request, context, page, create_parameters_from_json_query):
     total_pages = math.ceil(context["results"]["hits"]["total"]["value"] / SIZE)
     context["total_pages"] = total_pages
     context["pages"] = []
+
+    # The same as create_parameters_from_json_query(context["query"], page=...)
+    # without encoding the query for every page
+    parameters = create_parameters_from_json_query(context["query"])
+
+    def page_parameters(page):
+        return "&".join(part for part in [parameters, urlencode([("page", page)])] if part)
+
     if page != 1 and total_pages > 5:
         context["pages"].append(
             {
-                "url": request.path + "?" + create_parameters_from_json_query(context["query"], page=1),
+                "url": request.path + "?" + page_parameters(1),
                 "type": "first",
                 "label": "First",
             }
@@ -127,7 +337,7 @@ def get_pagination(request, context, page, create_parameters_from_json_query):
     if page != 1 and total_pages > 1:
         context["pages"].append(
             {
-                "url": request.path + "?" + create_parameters_from_json_query(context["query"], page=page - 1),
+                "url": request.path + "?" + page_parameters(page - 1),
                 "type": "prev",
                 "label": "Previous",
             }
@@ -139,7 +349,7 @@ def get_pagination(request, context, page, create_parameters_from_json_query):
     if total_pages > 1 and page > 2:
         context["pages"].append(
             {
-                "url": request.path + "?" + create_parameters_from_json_query(context["query"], page=page - 2),
+                "url": request.path + "?" + page_parameters(page - 2),
                 "type": "number",
                 "label": str(page - 2),
             }
@@ -147,7 +357,7 @@ def get_pagination(request, context, page, create_parameters_from_json_query):
     if total_pages > 1 and page > 1:
         context["pages"].append(
             {
-                "url": request.path + "?" + create_parameters_from_json_query(context["query"], page=page - 1),
+                "url": request.path + "?" + page_parameters(page - 1),
                 "type": "number",
                 "label": str(page - 1),
             }
@@ -155,7 +365,7 @@ def get_pagination(request, context, page, create_parameters_from_json_query):
 
     context["pages"].append(
         {
-            "url": request.path + "?" + create_parameters_from_json_query(context["query"], page=page),
+            "url": request.path + "?" + page_parameters(page),
             "type": "number",
             "label": str(page),
             "active": True,
@@ -165,7 +375,7 @@ def get_pagination(request, context, page, create_parameters_from_json_query):
     if page <= total_pages - 1:
         context["pages"].append(
             {
-                "url": request.path + "?" + create_parameters_from_json_query(context["query"], page=page + 1),
+                "url": request.path + "?" + page_parameters(page + 1),
                 "type": "number",
                 "label": str(page + 1),
             }
@@ -173,7 +383,7 @@ def get_pagination(request, context, page, create_parameters_from_json_query):
     if page <= total_pages - 2:
         context["pages"].append(
             {
-                "url": request.path + "?" + create_parameters_from_json_query(context["query"], page=page + 2),
+                "url": request.path + "?" + page_parameters(page + 2),
                 "type": "number",
                 "label": str(page + 2),
             }
@@ -185,7 +395,7 @@ def get_pagination(request, context, page, create_parameters_from_json_query):
     if page < total_pages:
         context["pages"].append(
             {
-                "url": request.path + "?" + create_parameters_from_json_query(context["query"], page=page + 1),
+                "url": request.path + "?" + page_parameters(page + 1),
                 "type": "next",
                 "label": "Next",
             }
@@ -194,7 +404,7 @@ def get_pagination(request, context, page, create_parameters_from_json_query):
     if page < total_pages and total_pages > 5:
         context["pages"].append(
             {
-                "url": request.path + "?" + create_parameters_from_json_query(context["query"], page=total_pages),
+                "url": request.path + "?" + page_parameters(total_pages),
                 "type": "last",
                 "label": "Last",
             }
@@ -202,15 +412,9 @@ def get_pagination(request, context, page, create_parameters_from_json_query):
 
 
 def get_clear_all(request, context, json_query, basic_filter, create_parameters_from_json_query):
-    json_query = copy.deepcopy(json_query)
-    try:
-        current_filter = json_query["query"]["bool"]["filter"]
-    except KeyError:
-        json_query["query"]["bool"]["filter"] = copy.deepcopy(basic_filter)
-        current_filter = json_query["query"]["bool"]["filter"]
-
-    if current_filter != basic_filter:
-        json_query["query"]["bool"]["filter"] = copy.deepcopy(basic_filter)
+    if json_query["query"]["bool"].get("filter", basic_filter) != basic_filter:
+        query_bool = dict(json_query["query"]["bool"], filter=basic_filter)
+        json_query = dict(json_query, query=dict(json_query["query"], bool=query_bool))
         context["results"]["clear_all_facet_url"] = request.path + "?" + create_parameters_from_json_query(json_query)
 
 
@@ -226,28 +430,26 @@ def get_terms_facets(
     create_parameters_from_json_query,
     is_json=False,
     path=None,
-    data_type="grant"
+    data_type="grant",
+    results=None,
 ):
+    """ Add a terms facet to the context. When the facet has a filter, its
+    counts come from a query without that filter: pass the results of
+    get_terms_facet_query as results to use ones that have already been
+    fetched, otherwise the query is made here """
 
     if not path:
         path = request.path
 
-    json_query = copy.deepcopy(json_query)
-    try:
-        if "must_not" in json_query["query"]["bool"]["filter"][bool_index]["bool"]:
-            bool_condition = "must_not"
-        else:
-            bool_condition = "should"
-
-        current_filter = json_query["query"]["bool"]["filter"][bool_index]["bool"].get(bool_condition, [])
-    except KeyError:
-        json_query["query"]["bool"]["filter"] = copy.deepcopy()
-        current_filter = json_query["query"]["bool"]["filter"][bool_index]["bool"].get(bool_condition, [])
+    facet_bool = json_query["query"]["bool"]["filter"][bool_index]["bool"]
+    bool_condition = "must_not" if "must_not" in facet_bool else "should"
+    current_filter = facet_bool.get(bool_condition, [])
 
     main_results = context["results"]
     if current_filter:
-        json_query["query"]["bool"]["filter"][bool_index]["bool"][bool_condition] = []
-        results = get_results(json_query, data_type=data_type)
+        json_query = replace_filter(json_query, bool_index, **{bool_condition: []})
+        if results is None:
+            results = get_results(json_query, data_type=data_type)
     else:
         results = context["results"]
 
@@ -255,16 +457,18 @@ def get_terms_facets(
         # This string is used in the django filter template for ajax based select2 in "search-box"
         display_name = "Excluded " + display_name
 
+    urls = FacetURLBuilder(json_query, field, param_name, bool_index, bool_condition, create_parameters_from_json_query,
+                           is_json)
+
     for filter in current_filter:
         new_filter = [x for x in current_filter if x != filter]
-        json_query["query"]["bool"]["filter"][bool_index]["bool"][bool_condition] = new_filter
         display_value = filter["term"][field]
         if is_json:
             display_value = json.loads(display_value)[0]
 
         context["selected_facets"][display_name].append(
             {
-                "url": path + "?" + create_parameters_from_json_query(json_query),
+                "url": path + "?" + urls.parameters(new_filter),
                 "display_value": display_value,
                 "param_name": param_name,
                 "display_name": display_name,
@@ -281,48 +485,44 @@ def get_terms_facets(
             filter_values.append(facet_value)
 
         new_filter = [{"term": {field: value}} for value in filter_values]
-        json_query["query"]["bool"]["filter"][bool_index]["bool"][bool_condition] = new_filter
-        bucket["url"] = path + "?" + create_parameters_from_json_query(json_query)
+        bucket["url"] = path + "?" + urls.parameters(new_filter)
     if current_filter:
-        json_query["query"]["bool"]["filter"][bool_index]["bool"][bool_condition] = []
-        results["aggregations"][param_name]["clear_url"] = path + "?" + create_parameters_from_json_query(json_query)
+        results["aggregations"][param_name]["clear_url"] = path + "?" + urls.parameters([])
         results["aggregations"][param_name]["exclude"] = True if bool_condition == "must_not" else False
 
     main_results["aggregations"][param_name] = results["aggregations"][param_name]
 
 
+def get_terms_facet_query(json_query, bool_index):
+    """ The query get_terms_facets makes for a facet's counts, json_query
+    without the facet's own filter, or None if the facet has no filter """
+    facet_bool = json_query["query"]["bool"]["filter"][bool_index]["bool"]
+    bool_condition = "must_not" if "must_not" in facet_bool else "should"
+    if not facet_bool.get(bool_condition):
+        return None
+
+    return replace_filter(json_query, bool_index, **{bool_condition: []})
+
+
 def term_facet_from_parameters(request, json_query, field_name, param_name, bool_index, field, is_json=False, data_type="grant"):
+    """ A copy of json_query with the facet's filter set from the request's
+    parameters, made with replace_filter """
     new_filter = []
 
     if is_json:
-        query_filter = []
-        for value in request.GET.getlist(param_name):
-            query_filter.append({"term": {param_name + '.id': value}})
-
-        if query_filter:
-            query = {
-                "query": {
-                    "bool": {"filter": [{"bool": {"should": query_filter}}]}
-                },
-                "aggs": {
-                    param_name: {"terms": {"field": field_name, "size": len(query_filter)}}
-                }
-            }
-
-            results = get_results(query, 1, data_type=data_type)
+        # org_utils imports this module
+        from grantnav.frontend.org_utils import get_id_and_names
 
-            for bucket in results['aggregations'][param_name]['buckets']:
-                new_filter.append({"term": {field_name: bucket['key']}})
+        for id_and_name in get_id_and_names(request.GET.getlist(param_name), param_name):
+            new_filter.append({"term": {field_name: id_and_name}})
 
     else:
         for value in request.GET.getlist(param_name):
             new_filter.append({"term": {field_name: value}})
 
     if request.GET.get("exclude_" + param_name):
-        json_query["query"]["bool"]["filter"][bool_index]["bool"].pop("should", None)
-        json_query["query"]["bool"]["filter"][bool_index]["bool"]["must_not"] = new_filter
-    else:
-        json_query["query"]["bool"]["filter"][bool_index]["bool"]["should"] = new_filter
+        return replace_filter(json_query, bool_index, should=None, must_not=new_filter)
+    return replace_filter(json_query, bool_index, should=new_filter)
 
 
 def term_parameters_from_json_query(parameters, json_query, field_name, param_name, bool_index, field, is_json=False):
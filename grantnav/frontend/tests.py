@@ -1,12 +1,22 @@
+import copy
 import json
 import time
 
+import elasticsearch.exceptions
 import pytest
+from prometheus_client import REGISTRY
 import os
 
 from dataload.import_to_elasticsearch import import_to_elasticsearch
-from grantnav.frontend.search_helpers import get_pagination
-from grantnav.frontend.views import BASIC_QUERY, create_parameters_from_json_query
+import grantnav.index
+from grantnav.frontend import org_utils
+from grantnav.frontend.org_table import OrgTable, OrgTableWriter
+from grantnav.frontend.org_utils import LRUCache, get_org, get_id_and_names
+from grantnav.frontend.search_helpers import get_pagination, FacetURLBuilder, FACET_PLACEHOLDER
+from grantnav.frontend import search_helpers, views, funders_search_view, recipients_search_view
+from grantnav.frontend.views import BASIC_QUERY, create_parameters_from_json_query, get_recipient_funders_from_rollups, \
+    empty_search_query, get_search_summary, search_summary, totals_query, create_json_query_from_parameters, \
+    get_facet_results, TERM_FACETS, get_recipient_funders, funder_recipients_datatables
 from django.test.client import RequestFactory
 from django.urls import reverse_lazy
 
@@ -65,6 +75,17 @@ def test_search_query(provenance_dataload, client, search_query, expected_grants
     assert r.context['results']['hits']['total']['value'] == expected_grants
 
 
+def test_search_summary(provenance_dataload, client):
+    # The stored summary is only used for the query it was made with
+    assert get_search_summary("results", BASIC_QUERY) is None
+    stored = get_search_summary("results", empty_search_query())
+    assert stored["aggregations"] == search_summary()["results"]["aggregations"]
+    assert get_search_summary("totals") == totals_query()
+
+    r = client.get("/search")
+    assert r.context['results']['hits']['total']['value'] == 1254
+
+
 def test_json_download(provenance_dataload, client):
     initial_response = client.get('/search.json?text_query=gardens')
     assert initial_response.status_code == 302
@@ -102,6 +123,476 @@ def test_datasets_page(provenance_dataload, client):
     assert client.get("/datasets/").status_code == 200
 
 
+def test_get_recipient_funders_from_rollups():
+    def rollup(funder, currency, count, total, smallest, largest):
+        return {"funderIdAndName": json.dumps(funder), "currency": currency,
+                "count": count, "sum": total, "min": smallest, "max": largest, "avg": total / count}
+
+    rollups = [
+        rollup(["Funder A", "GB-A"], "USD", 1, 10, 10, 10),
+        rollup(["Funder A", "GB-A"], "GBP", 2, 300, 100, 200),
+        rollup(["Funder B", "GB-B"], "GBP", 1, 50, 50, 50),
+        # The same funder to another of the recipient's org ids
+        rollup(["Funder B", "GB-B"], "GBP", 2, 150, 25, 125),
+        # Grants without amounts have no min/max/avg, like a stats aggregation
+        {"funderIdAndName": json.dumps(["Funder C", "GB-C"]), "currency": "GBP",
+         "count": 0, "sum": 0, "min": None, "max": None, "avg": None},
+        {"funderIdAndName": json.dumps(["Funder C", "GB-C"]), "currency": "GBP",
+         "count": 0, "sum": 0, "min": None, "max": None, "avg": None},
+        {"funderIdAndName": json.dumps(["Funder A", "GB-A"]), "currency": "USD",
+         "count": 0, "sum": 0, "min": None, "max": None, "avg": None},
+    ]
+
+    assert get_recipient_funders_from_rollups(rollups) == {
+        "GBP": [
+            {"name": "Funder B", "org_id": "GB-B", "count": 3, "sum": 200, "min": 25, "max": 125, "avg": 200 / 3},
+            {"name": "Funder A", "org_id": "GB-A", "count": 2, "sum": 300, "min": 100, "max": 200, "avg": 150},
+            {"name": "Funder C", "org_id": "GB-C", "count": 0, "sum": 0, "min": None, "max": None, "avg": None},
+        ],
+        "USD": [
+            {"name": "Funder A", "org_id": "GB-A", "count": 1, "sum": 10, "min": 10, "max": 10, "avg": 10},
+        ],
+    }
+    assert list(get_recipient_funders_from_rollups(rollups)) == ["GBP", "USD"]
+
+
+def test_has_rollups(monkeypatch):
+    monkeypatch.setattr(views, "rollups_generation", (None, None, False))
+    monkeypatch.setattr(views, "get_index", lambda: "index")
+    generation = ["a"]
+    monkeypatch.setattr(views, "get_index_generation", lambda: generation[0])
+    rollups = []
+    searches = []
+
+    def get_results(query, size=10, from_=0, data_type="grant"):
+        searches.append((data_type, query))
+        if data_type == "funder":
+            return {"hits": {"total": {"value": 1}}}
+        if data_type == "grant":
+            return {"aggregations": {"currency": {"buckets": []}}}
+        hits = [{"_source": {"rollup": rollup}} for rollup in rollups]
+        funders = sorted({rollup["funderIdAndName"] for rollup in rollups})
+        return {"hits": {"total": {"value": len(hits)}, "hits": hits[from_:from_ + size]},
+                "aggregations": {"funders": {"buckets": [{"key": key} for key in funders[:2]]}}}
+
+    monkeypatch.setattr(views, "get_results", get_results)
+
+    # An index without rollups aggregates the grants instead
+    assert get_recipient_funders(["GB-NONE"]) == {}
+    assert [data_type for data_type, query in searches] == ["rollup", "funder", "grant"]
+
+    # An index with rollups, checked once per generation, uses them even when none match
+    generation[0] = "b"
+    rollups.append({"funderIdAndName": "x"})
+    del searches[:]
+    assert views.has_rollups()
+    rollups.clear()
+    assert get_recipient_funders(["GB-NONE"]) == {}
+    assert [data_type for data_type, query in searches] == ["rollup", "rollup"]
+
+    request = RequestFactory().get("/funder_recipients_datatables", {
+        "funder_id": '["GB-NONE"]', "start": 0, "length": 10, "draw": 1,
+        "order[0][column]": 1, "order[0][dir]": "desc", "search[value]": ""})
+    response = json.loads(funder_recipients_datatables(request).content)
+    assert response["data"] == [] and response["recordsTotal"] == 0
+    assert [data_type for data_type, query in searches] == ["rollup", "rollup", "rollup", "rollup"]
+
+
+def test_funder_recipients_from_rollups(monkeypatch):
+    monkeypatch.setattr(views, "has_rollups", lambda: True)
+
+    def rollup(funder, recipient, count, total, smallest, largest):
+        return {"funderIdAndName": json.dumps(funder), "recipientIdAndName": json.dumps(recipient), "currency": "GBP",
+                "count": count, "sum": total, "min": smallest, "max": largest,
+                "avg": total / count if count else None}
+
+    # The funder's grants from an org id without an org have their own id_and_name
+    rollups = [
+        rollup(["Funder", "GB-F-1"], ["Charity", "GB-CHC-1"], 2, 300, 100, 200),
+        rollup(["Funder", "GB-F-1"], ["Trust", "GB-CHC-2"], 1, 250, 250, 250),
+        rollup(["Funder Ltd", "GB-F-2"], ["Charity", "GB-CHC-1"], 1, 50, 50, 50),
+        rollup(["Funder Ltd", "GB-F-2"], ["School", "GB-EDU-1"], 0, 0, None, None),
+    ]
+
+    def get_results(query, size=10, from_=0, data_type="grant"):
+        funders = sorted({rollup["funderIdAndName"] for rollup in rollups})
+        return {"aggregations": {"funders": {"buckets": [{"key": key} for key in funders[:2]]}}}
+
+    monkeypatch.setattr(views, "get_results", get_results)
+    monkeypatch.setattr(views, "get_es", lambda: None)
+    monkeypatch.setattr(views, "scan", lambda es, query, index, preserve_order: [
+        {"_source": {"rollup": rollup}} for rollup in rollups])
+
+    def datatable(column, direction, start=0, length=10):
+        request = RequestFactory().get("/funder_recipients_datatables", {
+            "funder_id": '["GB-F-1", "GB-F-2"]', "start": start, "length": length, "draw": 1,
+            "order[0][column]": column, "order[0][dir]": direction, "search[value]": ""})
+        response = json.loads(funder_recipients_datatables(request).content)
+        return response["recordsTotal"], [(row["org_name"], row["count"]) for row in response["data"]]
+
+    # One row for each recipient, whichever of the funder's id_and_names its grants have
+    assert datatable(1, "desc") == (3, [("Charity", 3), ("Trust", 1), ("School", 0)])
+    assert datatable(0, "asc") == (3, [("Charity", 3), ("School", 0), ("Trust", 1)])
+    # Recipients without amounts go last, like elasticsearch's missing values
+    assert datatable(4, "asc") == (3, [("Charity", 3), ("Trust", 1), ("School", 0)])
+    assert datatable(2, "desc", start=1, length=1) == (3, [("Trust", 1)])
+
+
+def test_get_facet_results(monkeypatch):
+    requests = []
+
+    def get_multiple_results(json_queries, size=10, data_type="grant"):
+        requests.append(json_queries)
+        return [{"query": json_query} for json_query in json_queries]
+
+    monkeypatch.setattr(search_helpers, "get_multiple_results", get_multiple_results)
+    request = RequestFactory().get("/search?currency=GBP&recipientRegionName=Wales&awardDate=2018&amountAwarded=500")
+    json_query = create_json_query_from_parameters(request)
+    context = {"existing_currency": None, "current_currency": "GBP"}
+
+    facet_results = get_facet_results(context, json_query)
+
+    # All the facets with a filter in one request
+    assert len(requests) == 1
+    assert list(facet_results) == ["recipientRegionName", "currency", "amountAwardedFixed", "awardYear"]
+    # Each without its own filter
+    filters = facet_results["currency"]["query"]["query"]["bool"]["filter"]
+    assert filters[7]["bool"]["should"] == []
+    assert filters[5]["bool"]["should"] == [{"term": {"additional_data.recipientRegionName": "Wales"}}]
+    assert facet_results["awardYear"]["query"]["query"]["bool"]["filter"][4]["bool"]["should"] == []
+    assert facet_results["amountAwardedFixed"]["query"]["query"]["bool"]["filter"][2]["bool"]["should"] == []
+    # The query itself is unchanged
+    assert json_query == create_json_query_from_parameters(request)
+
+    assert get_facet_results(context, create_json_query_from_parameters(RequestFactory().get("/search"))) == {}
+
+
+def test_results_cache(settings, monkeypatch):
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    settings.RESULTS_CACHE_TIMEOUT = 60
+    generation = ["a"]
+    monkeypatch.setattr(search_helpers, "get_index_generation", lambda: generation[0])
+    searches = []
+
+    class FakeES(object):
+        def search(self, body, index, track_total_hits, size=None, from_=None):
+            searches.append(body)
+            return {"hits": {"total": {"value": len(searches)}}}
+
+        def msearch(self, body, index):
+            searches.extend(body[1::2])
+            return {"responses": [{"hits": {"total": {"value": len(searches)}}} for search in body[1::2]]}
+
+    monkeypatch.setattr(search_helpers, "get_es", FakeES)
+
+    def cache_count(result):
+        return REGISTRY.get_sample_value("results_cache_total", {"result": result}) or 0
+
+    hits, misses = cache_count("hit"), cache_count("miss")
+    query = {"query": {"bool": {"must": {"query_string": {"query": "gardens"}}, "filter": [{"bool": {"should": []}}]}}}
+    results = search_helpers.get_results(query)
+    # The same query once the empty filters are cleaned out
+    results["hits"]["total"]["value"] = "changed by the view"
+    assert search_helpers.get_results({"query": {"bool": {"must": {"query_string": {"query": "gardens"}}}}}) == \
+        {"hits": {"total": {"value": 1}}}
+    assert len(searches) == 1
+    assert (cache_count("hit") - hits, cache_count("miss") - misses) == (1, 1)
+
+    # A different page, a new index generation and other indexes aren't the same results
+    search_helpers.get_results(query, from_=10)
+    generation[0] = "b"
+    search_helpers.get_results(query)
+    search_helpers.get_results(query, index="other")
+    search_helpers.get_results(query, index="other")
+    assert len(searches) == 5
+
+    # Only the searches that aren't cached are made
+    search_helpers.get_results(query, size=0)
+    other_query = {"query": {"bool": {"must": {"query_string": {"query": "parks"}}}}}
+    responses = search_helpers.get_multiple_results([query, other_query], size=0)
+    assert len(searches) == 7
+    assert search_helpers.get_multiple_results([query, other_query], size=0) == responses
+    assert len(searches) == 7
+
+    # Searches that ask not to be cached, e.g. the importer's, and searches of
+    # indexes without a generation aren't cached
+    search_helpers.get_results(query, use_cache=False)
+    assert len(searches) == 8
+    generation[0] = ""
+    search_helpers.get_results(query)
+    search_helpers.get_results(query)
+    assert len(searches) == 10
+
+
+def test_replace_filters_and_cleaned():
+    request = RequestFactory().get("/search?currency=GBP&awardDate=2018&min_amount=10&recipientRegionName=Wales")
+    json_query = create_json_query_from_parameters(request)
+    original = copy.deepcopy(json_query)
+
+    new_json_query = search_helpers.replace_filters(json_query, {7: {"should": []}, 3: {"must": {"term": {"currency": "GBP"}}}})
+
+    assert json_query == original
+    new_filters = new_json_query["query"]["bool"]["filter"]
+    assert new_filters[7] == {"bool": {"should": []}}
+    assert new_filters[3]["bool"] == dict(original["query"]["bool"]["filter"][3]["bool"], must={"term": {"currency": "GBP"}})
+    # The unchanged parts are shared rather than copied
+    assert new_json_query["aggs"] is json_query["aggs"]
+    assert new_filters[5] is json_query["query"]["bool"]["filter"][5]
+
+    for query in [json_query, new_json_query, BASIC_QUERY, {"a": [[], [{}], 0, "", "b", {"c": {}}], "d": ""}]:
+        assert search_helpers.cleaned(query) == search_helpers.clean_for_es(copy.deepcopy(query))
+
+
+@pytest.mark.parametrize("view", [funders_search_view, recipients_search_view, views])
+def test_search_filters_by_name(view):
+    # Each terms facet's filter is the one named after it
+    for term_facet in view.TERM_FACETS:
+        assert view.BASIC_FILTER[term_facet.filter_index] is view.SEARCH_FILTERS[term_facet.param_name]
+
+    original = copy.deepcopy(view.BASIC_QUERY)
+    request = RequestFactory().get("/search?query=gardens&exclude_currency=true&currency=USD&currency=EUR")
+    json_query = view.create_json_query_from_parameters(request)
+
+    currency_filter = json_query["query"]["bool"]["filter"][view.FILTER_POSITIONS["currency"]]
+    assert currency_filter == {"bool": {"must_not": [{"term": {"currency": "USD"}}, {"term": {"currency": "EUR"}}]}}
+    assert json_query["query"]["bool"]["must"]["query_string"] == {"query": "gardens", "default_field": "*"}
+    # BASIC_QUERY is unchanged, whether or not it was copied
+    assert view.BASIC_QUERY == original
+
+
+@pytest.mark.parametrize("query_string", [
+    "",
+    "query=gardens+%26+parks&currency=GBP&recipientRegionName=Wales&recipientRegionName=North+East",
+    "exclude_currency=true&currency=USD&awardDate=2018&amountAwarded=500&min_amount=10&sort=amountAwarded+desc",
+    "recipientDistrictName=Bristol%2C+City+of&page=3&max_date=2020-01",
+    "query=" + FACET_PLACEHOLDER + "&currency=GBP",
+])
+def test_facet_url_builder_matches_create_parameters(query_string):
+    json_query = create_json_query_from_parameters(RequestFactory().get("/search?" + query_string))
+    json_query["query"]["bool"]["filter"][0]["bool"]["should"] = [
+        {"term": {"fundingOrganization.id_and_name": '["Funder A", "GB-A"]'}}
+    ]
+
+    for term_facet in TERM_FACETS:
+        facet_bool = json_query["query"]["bool"]["filter"][term_facet.filter_index]["bool"]
+        bool_condition = "must_not" if "must_not" in facet_bool else "should"
+        urls = FacetURLBuilder(json_query, term_facet.field_name, term_facet.param_name, term_facet.filter_index,
+                               bool_condition, create_parameters_from_json_query, term_facet.is_json)
+
+        values = ['["Funder B", "GB-B"]', '["Funder & Co", "GB-C"]'] if term_facet.is_json else ["A", "B & C", "\u00e9"]
+        for filters in [[], [{"term": {term_facet.field_name: value}} for value in values],
+                        [{"term": {term_facet.field_name: values[1]}}]]:
+            expected_query = json.loads(json.dumps(json_query))
+            expected_query["query"]["bool"]["filter"][term_facet.filter_index]["bool"][bool_condition] = filters
+            assert urls.parameters(filters) == create_parameters_from_json_query(expected_query)
+
+
+def test_get_pagination_matches_create_parameters():
+    json_query = create_json_query_from_parameters(RequestFactory().get("/search?query=gardens&currency=GBP"))
+    context = {"results": {"hits": {"total": {"value": 1000}}}, "query": json_query}
+    get_pagination(RequestFactory().get('/search'), context, 5, create_parameters_from_json_query)
+
+    for page in context["pages"]:
+        if "url" in page:
+            page_number = page["url"].rsplit("page=", 1)[1]
+            assert page["url"] == "/search?" + create_parameters_from_json_query(json_query, page=page_number)
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    # b is the least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "max_size": 2, "hits": 2, "misses": 1, "evictions": 1}
+
+
+def test_org_table(tmpdir):
+    writer = OrgTableWriter()
+    for i in range(100):
+        writer.add({"id": "GB-CHC-{}".format(i), "name": "Charity {}".format(i),
+                    "orgIDs": ["GB-CHC-{}".format(i), "GB-COH-{}".format(i)]}, "recipient")
+    writer.add({"id": "GB-CHC-1", "name": "Funder", "orgIDs": ["GB-CHC-1"]}, "funder")
+    # The first org with an id wins
+    writer.add({"id": "GB-CHC-1", "name": "Duplicate", "orgIDs": ["GB-CHC-1"]}, "funder")
+    assert writer.write(str(tmpdir.join("orgs.table"))) == 201
+
+    table = OrgTable(str(tmpdir.join("orgs.table")))
+    for i in range(100):
+        assert table.get("GB-COH-{}".format(i), "recipient")["name"] == "Charity {}".format(i)
+    assert table.get("GB-CHC-1", "funder")["name"] == "Funder"
+    assert table.get("GB-CHC-2", "funder") is None
+    assert table.get("GB-CHC-100", "recipient") is None
+    assert table.get("", "recipient") is None
+    assert table.is_current()
+
+    OrgTableWriter().write(str(tmpdir.join("empty.table")))
+    assert OrgTable(str(tmpdir.join("empty.table"))).get("GB-CHC-1", "funder") is None
+
+
+def test_get_org_from_org_table(settings, tmpdir, monkeypatch):
+    writer = OrgTableWriter()
+    writer.add({"id": "GB-CHC-1", "name": "Charity", "orgIDs": ["GB-CHC-1", "GB-COH-1"]}, "recipient")
+    writer.write(str(tmpdir.join("orgs.table")))
+    settings.ORG_TABLE_PATH = str(tmpdir.join("orgs.table"))
+    settings.INDEX_GENERATION_TTL = 60
+    monkeypatch.setattr(org_utils, "orgs_cache", {"funder": LRUCache(10), "recipient": LRUCache(10)})
+    monkeypatch.setattr(org_utils, "org_table_path", None)
+    monkeypatch.setattr(org_utils, "get_index_generation", lambda: "a")
+
+    assert get_org("GB-COH-1", "recipient")["name"] == "Charity"
+    assert get_org("GB-COH-1", "recipient")["name"] == "Charity"
+    assert org_utils.orgs_cache["recipient"].stats()["hits"] == 1
+
+    # A new table replaces the cached orgs, once it is checked for
+    writer = OrgTableWriter()
+    writer.add({"id": "GB-CHC-1", "name": "Renamed", "orgIDs": ["GB-CHC-1", "GB-COH-1"]}, "recipient")
+    writer.write(str(tmpdir.join("orgs.table")))
+    assert get_org("GB-COH-1", "recipient")["name"] == "Charity"
+    settings.INDEX_GENERATION_TTL = 0
+    assert get_org("GB-COH-1", "recipient")["name"] == "Renamed"
+
+
+def test_get_org_with_missing_org_table(settings, tmpdir, monkeypatch):
+    settings.ORG_TABLE_PATH = str(tmpdir.join("missing.table"))
+    settings.INDEX_GENERATION_TTL = 0
+    monkeypatch.setattr(org_utils, "orgs_cache", {"funder": LRUCache(10), "recipient": LRUCache(10)})
+    monkeypatch.setattr(org_utils, "org_table_path", None)
+    monkeypatch.setattr(org_utils, "get_index_generation", lambda: "a")
+    searches = []
+
+    def get_results(query, data_type, use_cache=True):
+        searches.append(query)
+        return {"hits": {"hits": [{"_source": {"id": "GB-CHC-1", "name": "Charity"}}]}}
+
+    monkeypatch.setattr(org_utils, "get_results", get_results)
+
+    for _ in range(3):
+        assert get_org("GB-CHC-1", "recipient")["name"] == "Charity"
+    # The cache isn't emptied by looking for the table
+    assert len(searches) == 1
+    assert org_utils.orgs_cache["recipient"].stats()["hits"] == 2
+
+
+def test_get_org_new_generation(settings, monkeypatch):
+    settings.ORG_TABLE_PATH = None
+    monkeypatch.setattr(org_utils, "orgs_cache", {"funder": LRUCache(10), "recipient": LRUCache(10)})
+    monkeypatch.setattr(org_utils, "id_and_names_cache", LRUCache(10))
+    monkeypatch.setattr(org_utils, "orgs_cache_generation", None)
+    generation = ["a"]
+    monkeypatch.setattr(org_utils, "get_index_generation", lambda: generation[0])
+    searches = []
+
+    def get_results(query, size=10, data_type="grant", use_cache=True):
+        searches.append(query)
+        org = {"id": "GB-CHC-1", "name": "Charity {}".format(generation[0]), "orgIDs": ["GB-CHC-1"]}
+        if "aggs" in query:
+            return {"aggregations": {"org_ids": {"buckets": [{"key": "GB-CHC-1", "first_org": {"hits": {"hits": [
+                {"_source": org}]}}}]}}}
+        return {"hits": {"hits": [{"_source": org}]}}
+
+    monkeypatch.setattr(org_utils, "get_results", get_results)
+
+    assert get_org("GB-CHC-1", "recipient")["name"] == "Charity a"
+    assert org_utils.get_orgs(["GB-CHC-1"], "recipient")["GB-CHC-1"]["name"] == "Charity a"
+    assert len(searches) == 1
+
+    # The orgs cached from the previous generation aren't used
+    generation[0] = "b"
+    assert get_org("GB-CHC-1", "recipient")["name"] == "Charity b"
+    assert len(searches) == 2
+    generation[0] = "c"
+    assert org_utils.get_orgs(["GB-CHC-1"], "recipient")["GB-CHC-1"]["name"] == "Charity c"
+    assert len(searches) == 3
+
+
+def test_get_index_generation(settings, monkeypatch):
+    requests = []
+
+    class FakeES(object):
+        def get(self, index, id, _source_includes):
+            requests.append(index)
+            if index == "old":
+                raise elasticsearch.exceptions.NotFoundError(404, "not_found")
+            return {"_source": {"generation": "generation-{}".format(len(requests))}}
+
+    monkeypatch.setattr(grantnav.index, "get_es", FakeES)
+    monkeypatch.setattr(grantnav.index, "index_generation", (None, None, 0))
+    monkeypatch.setenv("ES_INDEX", "threesixtygiving")
+    settings.INDEX_GENERATION_TTL = 60
+
+    assert grantnav.index.get_index_generation() == "generation-1"
+    assert grantnav.index.get_index_generation() == "generation-1"
+    assert requests == ["threesixtygiving"]
+
+    settings.INDEX_GENERATION_TTL = 0
+    assert grantnav.index.get_index_generation() == "generation-2"
+
+    monkeypatch.setenv("ES_INDEX", "old")
+    assert grantnav.index.get_index_generation() == ""
+
+
+def test_get_id_and_names(settings, tmpdir, monkeypatch):
+    writer = OrgTableWriter()
+    writer.add({"id": "GB-CHC-1", "name": "Charity", "publisherName": None, "ftcData": None,
+                "additionalData": {"alternative_names": []}, "orgIDs": ["GB-CHC-1", "GB-COH-1"]}, "recipient")
+    writer.write(str(tmpdir.join("orgs.table")))
+    settings.ORG_TABLE_PATH = str(tmpdir.join("orgs.table"))
+    monkeypatch.setattr(org_utils, "orgs_cache", {"funder": LRUCache(10), "recipient": LRUCache(10)})
+    monkeypatch.setattr(org_utils, "id_and_names_cache", LRUCache(10))
+    monkeypatch.setattr(org_utils, "org_table_path", None)
+    monkeypatch.setattr(org_utils, "orgs_cache_generation", None)
+    generation = ["a"]
+    monkeypatch.setattr(org_utils, "get_index_generation", lambda: generation[0])
+
+    queries = []
+    org_queries = []
+    es_org = {"id": "GB-ES-1", "name": "Searched", "publisherName": None, "ftcData": None,
+              "additionalData": {"alternative_names": []}, "orgIDs": ["GB-ES-1"]}
+
+    def get_results(query, size=10, data_type="grant"):
+        if data_type != "grant":
+            # get_orgs searching for the orgs that aren't in the org table
+            org_queries.append(query)
+            ids = query["query"]["bool"]["filter"][0]["terms"]["orgIDs"]
+            return {"aggregations": {"org_ids": {"buckets": [
+                {"key": "GB-ES-1", "first_org": {"hits": {"hits": [{"_source": es_org}]}}},
+            ] if "GB-ES-1" in ids else []}}}
+        queries.append(query)
+        return {"aggregations": {"org_ids": {"buckets": [
+            {"key": "GB-X-1", "id_and_names": {"buckets": [{"key": '["X", "GB-X-1"]'}]}},
+        ]}}}
+
+    monkeypatch.setattr(org_utils, "get_results", get_results)
+
+    charity = '["Charity", "GB-CHC-1"]'
+    searched = '["Searched", "GB-ES-1"]'
+    org_ids = ["GB-COH-1", "GB-X-1", "GB-CHC-1", "GB-ES-1", "GB-NONE"]
+    assert get_id_and_names(org_ids, "recipientOrganization") == [charity, '["X", "GB-X-1"]', searched]
+    # The orgs that aren't in the org table are found with one query, in the
+    # importer's order, and the org ids without an org are aggregated
+    assert len(org_queries) == 1
+    assert org_queries[0]["query"]["bool"]["filter"] == [{"terms": {"orgIDs": ["GB-X-1", "GB-ES-1", "GB-NONE"]}}]
+    assert org_queries[0]["aggs"]["org_ids"]["aggs"]["first_org"]["top_hits"]["sort"] == org_utils.ORG_ORDER_SORT
+    assert len(queries) == 1
+    assert queries[0]["query"]["bool"]["filter"] == [{"terms": {"recipientOrganization.id": ["GB-X-1", "GB-NONE"]}}]
+    # The orgs found are cached for get_org
+    assert get_org("GB-ES-1", "recipient") == es_org
+
+    assert get_id_and_names(org_ids, "recipientOrganization") == [charity, '["X", "GB-X-1"]', searched]
+    assert len(queries) == 1 and len(org_queries) == 1
+
+    # A new index generation empties the cache
+    generation[0] = "b"
+    assert get_id_and_names(["GB-X-1"], "recipientOrganization") == ['["X", "GB-X-1"]']
+    assert len(queries) == 2 and len(org_queries) == 2
+
+    assert get_id_and_names([], "recipientOrganization") == []
+
+
 def test_get_pagination_single_page():
     request = RequestFactory().get('/')
     context = {
@@ -4,81 +4,90 @@ import csv
 import datetime
 import json
 import re
+import sys
 import urllib
 from itertools import chain
 import dateutil.parser as date_parser
 from dateutil.relativedelta import relativedelta
 
-from django.http import Http404, JsonResponse
+from django.http import Http404, HttpRequest, JsonResponse
 from django.http import HttpResponse, StreamingHttpResponse
 from django.views.decorators.clickjacking import xframe_options_exempt
 from django.shortcuts import render, redirect
 from django.utils.http import urlencode
 from django.urls import reverse
-from django.core.cache import cache
 
 from elasticsearch.helpers import scan
 import elasticsearch.exceptions
 
 from grantnav import provenance, csv_layout, utils
 from grantnav.search import get_es
-from grantnav.index import get_index
+from grantnav.index import get_index, get_index_generation
 from grantnav.frontend.search_helpers import get_results, get_request_type_and_size, get_terms_facets, get_data_from_path
 import grantnav.frontend.search_helpers as helpers
 from grantnav.frontend.org_utils import new_ordered_names, new_org_ids, new_stats_by_currency, get_org, OrgNotFoundError
-from dataload.import_to_elasticsearch import AGE_BIN_LABELS
-
-
-BASIC_FILTER = [
-    {"bool": {"should": []}},  # Funding Orgs
-    {"bool": {"should": []}},  # Recipient Orgs
-    {"bool": {"should": [], "must": {}, "minimum_should_match": 1}},  # Amount Awarded Fixed
-    {"bool": {"should": {"range": {"amountAwarded": {}}}, "must": {}, "minimum_should_match": 1}},  # Amount Awarded
-    {"bool": {"should": []}},  # Award Year
-    {"bool": {"should": []}},  # additional_data.recipientRegionName
-    {"bool": {"should": []}},  # additional_data.recipientDistrictName
-    {"bool": {"should": []}},  # currency
-    {"bool": {"should": []}},  # additional_data.TSGFundingOrgType
-    {"bool": {"should": {"range": {"awardDate": {}}}, "must": {}, "minimum_should_match": 1}},   # Date range
-    {"bool": {"should": []}},  # Programme Title
-    {"bool": {"should": []}},  # additional_data.TSGRecipientType
-    {"bool": {"should": []}},  # simple_grant_type
+from dataload.import_to_elasticsearch import AGE_BIN_LABELS, SEARCH_SUMMARY_ID
+
+
+# The filters of BASIC_FILTER by name, the param_name of a terms facet's filter
+SEARCH_FILTERS = {
+    "fundingOrganization": {"bool": {"should": []}},
+    "recipientOrganization": {"bool": {"should": []}},
+    "amountAwardedFixed": {"bool": {"should": [], "must": {}, "minimum_should_match": 1}},
+    "amountAwarded": {"bool": {"should": {"range": {"amountAwarded": {}}}, "must": {}, "minimum_should_match": 1}},
+    "awardYear": {"bool": {"should": []}},
+    "recipientRegionName": {"bool": {"should": []}},
+    "recipientDistrictName": {"bool": {"should": []}},
+    "currency": {"bool": {"should": []}},
+    "fundingOrganizationTSGType": {"bool": {"should": []}},
+    "awardDate": {"bool": {"should": {"range": {"awardDate": {}}}, "must": {}, "minimum_should_match": 1}},
+    "grantProgramme": {"bool": {"should": []}},
+    "recipientTSGType": {"bool": {"should": []}},
+    "simple_grant_type": {"bool": {"should": []}},
     # Used for Aggregates API
-    {"bool": {"should": []}},  # additional_data.recipientOrgInfos.organisationTypePrimary
-    {"bool": {"should": []}},  # additional_data.GNRecipientOrgInfo0.ageWhenAwarded
+    "recipientOrganizationType": {"bool": {"should": []}},
+    "orgAgeWhenAwarded": {"bool": {"should": []}},
     # End used for Aggregates
-
-    {"bool": {"should": []}},  # additional_data.GNRecipientOrgRegionName
-    {"bool": {"should": []}},  # additional_data.GNRecipientOrgDistrictName
-    {"bool": {"should": []}},  # additional_data.GNBeneficiaryRegionName
-    {"bool": {"should": []}},  # additional_data.GNBeneficiaryDistrictName
+    "recipientOrgRegionName": {"bool": {"should": []}},
+    "recipientOrgDistrictName": {"bool": {"should": []}},
+    "beneficiaryRegionName": {"bool": {"should": []}},
+    "beneficiaryDistrictName": {"bool": {"should": []}},
     # County
-    {"bool": {"should": []}},  # additional_data.GNBeneficiaryCountyName
-    {"bool": {"should": []}},  # additional_data.GNRecipientCountyName
-    {"bool": {"should": []}},  # additional_data.GNBestCountyName
-]
+    "beneficiaryCountyName": {"bool": {"should": []}},
+    "recipientOrgCountyName": {"bool": {"should": []}},
+    "bestCountyName": {"bool": {"should": []}},
+}
+
+BASIC_FILTER = list(SEARCH_FILTERS.values())
+FILTER_POSITIONS = helpers.filter_positions(SEARCH_FILTERS)
+
+# Positions in BASIC_FILTER of the filters that aren't terms facets
+AMOUNT_FIXED_FILTER = FILTER_POSITIONS["amountAwardedFixed"]
+AMOUNT_RANGE_FILTER = FILTER_POSITIONS["amountAwarded"]
+AWARD_YEAR_FILTER = FILTER_POSITIONS["awardYear"]
+DATE_RANGE_FILTER = FILTER_POSITIONS["awardDate"]
 
 TermFacet = collections.namedtuple('TermFacet', 'field_name param_name filter_index display_name is_json facet_size')
 
 TERM_FACETS = [
-    TermFacet("fundingOrganization.id_and_name", "fundingOrganization", 0, "Funders", True, 1),  # facet size 1 so template knows if there are results.
-    TermFacet("recipientOrganization.id_and_name", "recipientOrganization", 1, "Recipients", True, 1),
-    TermFacet("grantProgramme.title_keyword", "grantProgramme", 10, "Programme Titles", False, 1),
-    TermFacet("additional_data.recipientRegionName", "recipientRegionName", 5, "Regions", False, 5000),
-    TermFacet("additional_data.recipientDistrictName", "recipientDistrictName", 6, "Districts", False, 5000),
-    TermFacet("additional_data.TSGFundingOrgType", "fundingOrganizationTSGType", 8, "Organisation Type", False, 5000),
-    TermFacet("currency", "currency", 7, "Currency", False, 5000),
-    TermFacet("additional_data.TSGRecipientType", "recipientTSGType", 11, "Recipient Type", False, 5000),
-    TermFacet("simple_grant_type", "simple_grant_type", 12, "Regrant Type", False, 5000),
-    TermFacet("additional_data.recipientOrgInfos.organisationTypePrimary", "recipientOrganizationType", 13, "Recipient Organisation Type", False, 5000),
-    TermFacet("additional_data.GNRecipientOrgInfo0.ageWhenAwarded", "orgAgeWhenAwarded", 14, "Age of Recipient Org", False, 5000),
-    TermFacet("additional_data.GNRecipientOrgRegionName", "recipientOrgRegionName", 15, "Recipient Organisation Country and Region", False, 5000),
-    TermFacet("additional_data.GNRecipientOrgDistrictName", "recipientOrgDistrictName", 16, "Recipient Organisation District", False, 5000),
-    TermFacet("additional_data.GNBeneficiaryRegionName", "beneficiaryRegionName", 17, "Beneficiary Region and Country", False, 5000),
-    TermFacet("additional_data.GNBeneficiaryDistrictName", "beneficiaryDistrictName", 18, "Beneficiary District", False, 5000),
-    TermFacet("additional_data.GNBeneficiaryCountyName", "beneficiaryCountyName", 19, "Beneficiary County", False, 5000),
-    TermFacet("additional_data.GNRecipientOrgCountyName", "recipientOrgCountyName", 20, "Recipient County", False, 5000),
-    TermFacet("additional_data.GNBestCountyName", "bestCountyName", 21, "Best County", False, 5000),
+    TermFacet("fundingOrganization.id_and_name", "fundingOrganization", FILTER_POSITIONS["fundingOrganization"], "Funders", True, 1),  # facet size 1 so template knows if there are results.
+    TermFacet("recipientOrganization.id_and_name", "recipientOrganization", FILTER_POSITIONS["recipientOrganization"], "Recipients", True, 1),
+    TermFacet("grantProgramme.title_keyword", "grantProgramme", FILTER_POSITIONS["grantProgramme"], "Programme Titles", False, 1),
+    TermFacet("additional_data.recipientRegionName", "recipientRegionName", FILTER_POSITIONS["recipientRegionName"], "Regions", False, 5000),
+    TermFacet("additional_data.recipientDistrictName", "recipientDistrictName", FILTER_POSITIONS["recipientDistrictName"], "Districts", False, 5000),
+    TermFacet("additional_data.TSGFundingOrgType", "fundingOrganizationTSGType", FILTER_POSITIONS["fundingOrganizationTSGType"], "Organisation Type", False, 5000),
+    TermFacet("currency", "currency", FILTER_POSITIONS["currency"], "Currency", False, 5000),
+    TermFacet("additional_data.TSGRecipientType", "recipientTSGType", FILTER_POSITIONS["recipientTSGType"], "Recipient Type", False, 5000),
+    TermFacet("simple_grant_type", "simple_grant_type", FILTER_POSITIONS["simple_grant_type"], "Regrant Type", False, 5000),
+    TermFacet("additional_data.recipientOrgInfos.organisationTypePrimary", "recipientOrganizationType", FILTER_POSITIONS["recipientOrganizationType"], "Recipient Organisation Type", False, 5000),
+    TermFacet("additional_data.GNRecipientOrgInfo0.ageWhenAwarded", "orgAgeWhenAwarded", FILTER_POSITIONS["orgAgeWhenAwarded"], "Age of Recipient Org", False, 5000),
+    TermFacet("additional_data.GNRecipientOrgRegionName", "recipientOrgRegionName", FILTER_POSITIONS["recipientOrgRegionName"], "Recipient Organisation Country and Region", False, 5000),
+    TermFacet("additional_data.GNRecipientOrgDistrictName", "recipientOrgDistrictName", FILTER_POSITIONS["recipientOrgDistrictName"], "Recipient Organisation District", False, 5000),
+    TermFacet("additional_data.GNBeneficiaryRegionName", "beneficiaryRegionName", FILTER_POSITIONS["beneficiaryRegionName"], "Beneficiary Region and Country", False, 5000),
+    TermFacet("additional_data.GNBeneficiaryDistrictName", "beneficiaryDistrictName", FILTER_POSITIONS["beneficiaryDistrictName"], "Beneficiary District", False, 5000),
+    TermFacet("additional_data.GNBeneficiaryCountyName", "beneficiaryCountyName", FILTER_POSITIONS["beneficiaryCountyName"], "Beneficiary County", False, 5000),
+    TermFacet("additional_data.GNRecipientOrgCountyName", "recipientOrgCountyName", FILTER_POSITIONS["recipientOrgCountyName"], "Recipient County", False, 5000),
+    TermFacet("additional_data.GNBestCountyName", "bestCountyName", FILTER_POSITIONS["bestCountyName"], "Best County", False, 5000),
 ]
 
 SIZE = 20
@@ -245,43 +254,48 @@ def create_latest_charity_income_aggregate(json_query):
     json_query["aggs"]["latestCharityIncomeFixed"] = {"range": {"field": "additional_data.GNRecipientOrgInfo0.latestIncome", "ranges": CHARITY_INCOME_FIXED_AMOUNT_RANGES}}
 
 
-def get_amount_facet_fixed(request, context, original_json_query):
-    json_query = copy.deepcopy(original_json_query)
-    json_query["aggs"]["amountAwardedFixed"] = {"range": {"field": "amountAwarded", "ranges": FIXED_AMOUNT_RANGES}}
-    try:
-        current_filter = json_query["query"]["bool"]["filter"][2]["bool"]["should"]
-    except KeyError:
-        json_query["query"]["bool"]["filter"] = copy.deepcopy(BASIC_FILTER)
-        current_filter = json_query["query"]["bool"]["filter"][2]["bool"]["should"]
+def get_amount_facet_query(context, original_json_query):
+    """ The query for the amount facet's counts, without the amount filter, and
+    the current amount filter. The query is only needed if there is a filter """
+    current_filter = original_json_query["query"]["bool"]["filter"][AMOUNT_FIXED_FILTER]["bool"]["should"]
 
-    main_results = context["results"]
-
-    json_query["query"]["bool"]["filter"][2]["bool"]["should"] = []
+    clauses = {"should": [], "minimum_should_match": 0}
 
     existing_currency, current_currency = context['existing_currency'], context['current_currency']
 
     if current_currency and not existing_currency:
-        json_query["query"]["bool"]["filter"][2]["bool"]["must"] = {"term": {"currency": current_currency}}
+        clauses["must"] = {"term": {"currency": current_currency}}
+
+    json_query = helpers.replace_filter(original_json_query, AMOUNT_FIXED_FILTER, **clauses)
+    json_query["aggs"] = dict(json_query["aggs"], amountAwardedFixed={"range": {"field": "amountAwarded", "ranges": FIXED_AMOUNT_RANGES}})
 
-    json_query["query"]["bool"]["filter"][2]["bool"]["minimum_should_match"] = 0
+    return json_query, current_filter
+
+
+def get_amount_facet_fixed(request, context, original_json_query, results=None):
+    """ Add the amount facet to the context. results are the already fetched
+    results of the get_amount_facet_query query, if there are any """
+    json_query, current_filter = get_amount_facet_query(context, original_json_query)
+
+    main_results = context["results"]
+
+    existing_currency, current_currency = context['existing_currency'], context['current_currency']
 
     if current_filter:
-        results = get_results(json_query)
+        if results is None:
+            results = get_results(json_query)
     else:
         results = main_results
 
-    input_range = json_query["query"]["bool"]["filter"][3]["bool"]["should"]["range"]["amountAwarded"]
-    new_filter = copy.deepcopy(current_filter)
-    if new_filter or input_range:
-        new_json_query = copy.deepcopy(original_json_query)
-        new_json_query["query"]["bool"]["filter"][2]["bool"]["should"] = []
-        new_json_query["query"]["bool"]["filter"][2]["bool"]["must"] = {}
-        new_json_query["query"]["bool"]["filter"][3]["bool"]["should"]["range"]["amountAwarded"] = {}
-        new_json_query["query"]["bool"]["filter"][3]["bool"]["must"] = {}
+    input_range = json_query["query"]["bool"]["filter"][AMOUNT_RANGE_FILTER]["bool"]["should"]["range"]["amountAwarded"]
+    if current_filter or input_range:
+        new_json_query = helpers.replace_filters(original_json_query, {
+            AMOUNT_FIXED_FILTER: {"should": [], "must": {}},
+            AMOUNT_RANGE_FILTER: {"should": {"range": {"amountAwarded": {}}}, "must": {}},
+        })
         results["aggregations"]["amountAwardedFixed"]["clear_url"] = request.path + '?' + create_parameters_from_json_query(new_json_query)
 
     for bucket in results["aggregations"]["amountAwardedFixed"]['buckets']:
-        new_json_query = copy.deepcopy(original_json_query)
         new_filter = []
         new_range = {"gte": bucket["from"]}
         to_ = bucket.get("to")
@@ -295,11 +309,12 @@ def get_amount_facet_fixed(request, context, original_json_query):
         if not bucket.get("selected"):
             new_filter.append({"range": {"amountAwarded": new_range}})
 
-        new_json_query["query"]["bool"]["filter"][2]["bool"]["should"] = new_filter
+        clauses = {"should": new_filter}
         if not new_filter:
-            new_json_query["query"]["bool"]["filter"][2]["bool"]["must"] = {}
+            clauses["must"] = {}
         elif not existing_currency and current_currency:
-            new_json_query["query"]["bool"]["filter"][2]["bool"]["must"] = {"term": {"currency": current_currency}}
+            clauses["must"] = {"term": {"currency": current_currency}}
+        new_json_query = helpers.replace_filter(original_json_query, AMOUNT_FIXED_FILTER, **clauses)
 
         bucket["url"] = request.path + '?' + create_parameters_from_json_query(new_json_query)
 
@@ -313,7 +328,6 @@ def get_amount_facet_fixed(request, context, original_json_query):
             context["selected_facets"]["Amounts"].append({"url": bucket["url"], "display_value": display_value})
 
     if input_range:
-        new_json_query = copy.deepcopy(original_json_query)
         lte, gte = input_range.get('lte'), input_range.get('gte')
         if not gte:
             gte = 0
@@ -322,8 +336,8 @@ def get_amount_facet_fixed(request, context, original_json_query):
             display_value = str(display_value) + " - " + "{}{:,}".format(utils.currency_prefix(current_currency), int(lte))
         else:
             display_value = str(display_value) + "+"
-        new_json_query["query"]["bool"]["filter"][3]["bool"]["should"]["range"]["amountAwarded"] = {}
-        new_json_query["query"]["bool"]["filter"][3]["bool"]["must"] = {}
+        new_json_query = helpers.replace_filter(original_json_query, AMOUNT_RANGE_FILTER,
+                                                should={"range": {"amountAwarded": {}}}, must={})
 
         context["selected_facets"]["Amounts"].append({"url": request.path + '?' + create_parameters_from_json_query(new_json_query), "display_value": display_value})
 
@@ -335,20 +349,28 @@ def create_date_aggregate(json_query):
     json_query["aggs"]["awardYear"] = {"date_histogram": {"field": "awardDate", "format": "yyyy", "interval": "year", "order": {"_key": "desc"}}}
 
 
-def get_date_facets(request, context, json_query):
-    json_query = copy.deepcopy(json_query)
+def get_date_facet_query(json_query):
+    """ The query get_date_facets makes for the year facet's counts, json_query
+    without the year filter, or None if there is no year filter """
+    if not json_query["query"]["bool"]["filter"][AWARD_YEAR_FILTER]["bool"]["should"]:
+        return None
+
+    json_query = helpers.replace_filter(json_query, AWARD_YEAR_FILTER, should=[])
+    json_query["aggs"] = dict(json_query["aggs"])
+    create_date_aggregate(json_query)
+    return json_query
+
 
+def get_date_facets(request, context, json_query, results=None):
+    """ Add the year and award date facets to the context. results are the
+    already fetched results of the get_date_facet_query query, if any """
     # Year filter
-    try:
-        current_filter = json_query["query"]["bool"]["filter"][4]["bool"]["should"]
-    except KeyError:
-        json_query["query"]["bool"]["filter"] = copy.deepcopy(BASIC_FILTER)
-        current_filter = json_query["query"]["bool"]["filter"][4]["bool"]["should"]
+    current_filter = json_query["query"]["bool"]["filter"][AWARD_YEAR_FILTER]["bool"]["should"]
     main_results = context["results"]
     if current_filter:
-        json_query["query"]["bool"]["filter"][4]["bool"]["should"] = []
-        create_date_aggregate(json_query)
-        results = get_results(json_query)
+        if results is None:
+            results = get_results(get_date_facet_query(json_query))
+        json_query = helpers.replace_filter(json_query, AWARD_YEAR_FILTER, should=[])
 
         # Look for current filters applied, and add them to selected_facets
         # This must be done independently of checking the years buckets available (the next step).
@@ -361,8 +383,7 @@ def get_date_facets(request, context, json_query):
             try:
                 year = filter['range']['awardDate']['gte'].split("|")[0]
                 filter_values = [f for f in current_filter if f['range']['awardDate']['gte'].split("|")[0] != year]
-                new_json_query = copy.deepcopy(json_query)
-                new_json_query["query"]["bool"]["filter"][4]["bool"]["should"] = filter_values
+                new_json_query = helpers.replace_filter(json_query, AWARD_YEAR_FILTER, should=filter_values)
                 url = request.path + '?' + create_parameters_from_json_query(new_json_query)
                 context["selected_facets"]["Award Year"].append({"url": url, "display_value": year})
             except KeyError:
@@ -389,28 +410,26 @@ def get_date_facets(request, context, json_query):
             filter_values.append(range)
 
         new_filter = [{"range": {"awardDate": value}} for value in filter_values]
-        json_query["query"]["bool"]["filter"][4]["bool"]["should"] = new_filter
-        bucket["url"] = request.path + '?' + create_parameters_from_json_query(json_query)
+        new_json_query = helpers.replace_filter(json_query, AWARD_YEAR_FILTER, should=new_filter)
+        bucket["url"] = request.path + '?' + create_parameters_from_json_query(new_json_query)
 
     # Get Custom Filter
     try:
-        input_range = json_query["query"]["bool"]["filter"][9]["bool"]["should"]["range"]["awardDate"]
+        input_range = json_query["query"]["bool"]["filter"][DATE_RANGE_FILTER]["bool"]["should"]["range"]["awardDate"]
     except IndexError:
         # old json_query do not have the new filter
         input_range = []
 
     # If either Year or Custom filter, add clear_url
     if current_filter or input_range:
-        json_query["query"]["bool"]["filter"][4]["bool"]["should"] = []
-        json_query["query"]["bool"]["filter"][9]["bool"]["should"]["range"]["awardDate"] = {}
-        results['aggregations']["awardYear"]['clear_url'] = request.path + '?' + create_parameters_from_json_query(json_query)
+        clear_url = request.path + '?' + create_parameters_from_json_query(helpers.replace_filters(json_query, {
+            AWARD_YEAR_FILTER: {"should": []},
+            DATE_RANGE_FILTER: {"should": {"range": {"awardDate": {}}}},
+        }))
+        results['aggregations']["awardYear"]['clear_url'] = clear_url
 
     # If custom filter, add to selected_facets
     if input_range:
-        new_json_query = copy.deepcopy(json_query)
-        new_json_query["query"]["bool"]["filter"][4]["bool"]["should"] = []
-        new_json_query["query"]["bool"]["filter"][9]["bool"]["should"]["range"]["awardDate"] = {}
-
         lt, gte = input_range.get('lt'), input_range.get('gte')
         display_value = ''
         if gte:
@@ -418,20 +437,20 @@ def get_date_facets(request, context, json_query):
         if lt:
             display_value += f'To: {utils.date_to_yearmonth(lt, max=True)}'
 
-        context["selected_facets"]["Award Date"].append({"url": request.path + '?' + create_parameters_from_json_query(new_json_query), "display_value": display_value})
+        context["selected_facets"]["Award Date"].append({"url": clear_url, "display_value": display_value})
 
     # We may have changed year buckets available or clear URL - put our changes back in the main results for the user
     main_results['aggregations']["awardYearOriginal"] = main_results['aggregations']["awardYear"]
     main_results['aggregations']["awardYear"] = results['aggregations']["awardYear"]
 
 
-def totals_query():
+def totals_query(index=None):
     query = {"query": {"match_all": {}}}
 
     counts = {
-        'grants': get_results(query)['hits']['total'],
-        'funders': get_results(query, data_type='funder')['hits']['total'],
-        'recipient_orgs': get_results(query, data_type='recipient')['hits']['total'],
+        'grants': get_results(query, index=index)['hits']['total'],
+        'funders': get_results(query, data_type='funder', index=index)['hits']['total'],
+        'recipient_orgs': get_results(query, data_type='recipient', index=index)['hits']['total'],
         'recipient_indi': get_results(
             {
                 "size": 0,  # Don't return the docs just the agg
@@ -442,14 +461,15 @@ def totals_query():
                         }
                     }
                 }
-            }
+            },
+            index=index
         )["aggregations"]["recipient_indi"]["value"]
     }
     return counts
 
 
 def home(request):
-    results = totals_query()
+    results = get_search_summary("totals") or totals_query()
 
     context = {}
     context['results'] = results
@@ -492,7 +512,7 @@ def amount_facet_from_parameters(request, json_query):
                     new_range["lt"] = to_
                 new_filter.append({"range": {"amountAwarded": new_range}})
 
-    json_query["query"]["bool"]["filter"][2]["bool"]["should"] = new_filter
+    json_query["query"]["bool"]["filter"][AMOUNT_FIXED_FILTER]["bool"]["should"] = new_filter
 
 
 def date_facet_from_parameters(request, json_query):
@@ -507,7 +527,7 @@ def date_facet_from_parameters(request, json_query):
             }
         )
 
-    json_query["query"]["bool"]["filter"][4]["bool"]["should"] = new_filter
+    json_query["query"]["bool"]["filter"][AWARD_YEAR_FILTER]["bool"]["should"] = new_filter
 
 
 def create_json_query_from_parameters(request):
@@ -529,7 +549,7 @@ def create_json_query_from_parameters(request):
     max_amount = request.GET.get('max_amount')
     if max_amount:
         amount_filter['lte'] = max_amount
-    json_query["query"]["bool"]["filter"][3]["bool"]["should"]["range"]["amountAwarded"] = amount_filter
+    json_query["query"]["bool"]["filter"][AMOUNT_RANGE_FILTER]["bool"]["should"]["range"]["amountAwarded"] = amount_filter
 
     date_filter = {}
     recency_period = request.GET.get('recency_period')
@@ -545,11 +565,11 @@ def create_json_query_from_parameters(request):
     if max_date:
         date_filter['lt'] = max_date
 
-    json_query["query"]["bool"]["filter"][9]["bool"]["should"]["range"]["awardDate"] = date_filter
+    json_query["query"]["bool"]["filter"][DATE_RANGE_FILTER]["bool"]["should"]["range"]["awardDate"] = date_filter
 
     for term_facet in TERM_FACETS:
-        helpers.term_facet_from_parameters(request, json_query, term_facet.field_name, term_facet.param_name,
-                                           term_facet.filter_index, term_facet.display_name, term_facet.is_json)
+        json_query = helpers.term_facet_from_parameters(request, json_query, term_facet.field_name, term_facet.param_name,
+                                                        term_facet.filter_index, term_facet.display_name, term_facet.is_json)
 
     amount_facet_from_parameters(request, json_query)
     date_facet_from_parameters(request, json_query)
@@ -559,14 +579,14 @@ def create_json_query_from_parameters(request):
 
 def amount_parameters_from_json_query(parameters, json_query):
     values = []
-    for filter in json_query["query"]["bool"]["filter"][2]["bool"]["should"]:
+    for filter in json_query["query"]["bool"]["filter"][AMOUNT_FIXED_FILTER]["bool"]["should"]:
         values.append(int(filter['range']['amountAwarded']['gte']))
     parameters['amountAwarded'] = values
 
 
 def date_parameters_from_json_query(parameters, json_query):
     values = []
-    for filter in json_query["query"]["bool"]["filter"][4]["bool"]["should"]:
+    for filter in json_query["query"]["bool"]["filter"][AWARD_YEAR_FILTER]["bool"]["should"]:
         values.append(filter['range']['awardDate']['gte'][:-4])  # remove the ||/y from the end
     parameters['awardDate'] = values
 
@@ -590,19 +610,19 @@ def create_parameters_from_json_query(json_query, **extra_parameters):
     sort_key = list(json_query["sort"].keys())[0]
     parameters['sort'] = [sort_key + ' ' + json_query['sort'][sort_key]['order']]
 
-    min_amount = json_query["query"]["bool"]["filter"][3]["bool"]["should"]["range"]["amountAwarded"].get('gte')
+    min_amount = json_query["query"]["bool"]["filter"][AMOUNT_RANGE_FILTER]["bool"]["should"]["range"]["amountAwarded"].get('gte')
     if min_amount:
         parameters['min_amount'] = [str(min_amount)]
-    max_amount = json_query["query"]["bool"]["filter"][3]["bool"]["should"]["range"]["amountAwarded"].get('lte')
+    max_amount = json_query["query"]["bool"]["filter"][AMOUNT_RANGE_FILTER]["bool"]["should"]["range"]["amountAwarded"].get('lte')
     if max_amount:
         parameters['max_amount'] = [str(max_amount)]
 
     # Date range filter was only added recently and old URL's will not have it in the JSON. So check it is there first:
     if len(json_query["query"]["bool"]["filter"]) >= 10:
-        min_date = json_query["query"]["bool"]["filter"][9]["bool"]["should"]["range"]["awardDate"].get('gte')
+        min_date = json_query["query"]["bool"]["filter"][DATE_RANGE_FILTER]["bool"]["should"]["range"]["awardDate"].get('gte')
         if min_date:
             parameters['min_date'] = [utils.date_to_yearmonth(min_date)]
-        max_date = json_query["query"]["bool"]["filter"][9]["bool"]["should"]["range"]["awardDate"].get('lt')
+        max_date = json_query["query"]["bool"]["filter"][DATE_RANGE_FILTER]["bool"]["should"]["range"]["awardDate"].get('lt')
         if max_date:
             parameters['max_date'] = [utils.date_to_yearmonth(max_date, True)]
 
@@ -693,6 +713,68 @@ def redirect_request_to_include_all_org_ids(request):
         return request.path + '?' + request_get_copy.urlencode()
 
 
+def add_search_aggregates(json_query):
+    create_amount_aggregate(json_query)
+    create_date_aggregate(json_query)
+    # These aggs are currently only used for display and are not filterable in GN frontend
+    create_latest_charity_income_aggregate(json_query)
+
+    json_query['aggs'].update(SEARCH_SUMMARY_AGGREGATES)
+
+
+def empty_search_query():
+    """ The json_query, with its aggregates, that search fetches when there are no parameters """
+    json_query = create_json_query_from_parameters(HttpRequest())
+    add_search_aggregates(json_query)
+    return json_query
+
+
+def search_summary(index=None):
+    """ The results of the empty search and the home page totals, which the
+    importer stores in the index, see get_search_summary """
+    json_query = empty_search_query()
+    return {
+        "query": json_query,
+        "results": get_results(json_query, SIZE, 0, index=index),
+        "totals": totals_query(index),
+    }
+
+
+def get_search_summary(key, json_query=None):
+    """ An item of the search summary stored in the index, or None if there
+    isn't one. The stored results are only returned for the json_query they
+    were made with, so that a changed query isn't answered with old results """
+    try:
+        summary = get_es().get(index=get_index(), id=SEARCH_SUMMARY_ID,
+                               _source_includes=["searchSummary.query", "searchSummary." + key])
+    except elasticsearch.exceptions.NotFoundError:
+        return None
+
+    summary = summary["_source"]["searchSummary"]
+    if json_query is not None and summary["query"] != json_query:
+        return None
+    return summary.get(key)
+
+
+def get_facet_results(context, json_query):
+    """ Each facet that has a filter gets its counts from a query without its
+    own filter. Fetch the results of all these queries in one request, keyed
+    by the facet's aggregation name. """
+    queries = {}
+    for term_facet in TERM_FACETS:
+        queries[term_facet.param_name] = helpers.get_terms_facet_query(json_query, term_facet.filter_index)
+
+    amount_query, current_amount_filter = get_amount_facet_query(context, json_query)
+    if current_amount_filter:
+        queries["amountAwardedFixed"] = amount_query
+
+    queries["awardYear"] = get_date_facet_query(json_query)
+
+    queries = {name: query for name, query in queries.items() if query is not None}
+    # Only the aggregations are used
+    return dict(zip(queries, helpers.get_multiple_results(list(queries.values()), size=0)))
+
+
 def search(request, template_name="search.html"):
     [result_format, results_size] = get_request_type_and_size(request)
 
@@ -723,20 +805,7 @@ def search(request, template_name="search.html"):
             # There were originally 8 filters with the old urls ES now expects all so append
             # the new ones
             if len(filter_) == 8:
-                filter_.append({"bool": {"should": []}})  # additional_data.TSGFundingOrgType
-                filter_.append({"bool": {"should": {"range": {"awardDate": {}}}, "must": {}, "minimum_should_match": 1}})   # Date range
-                filter_.append({"bool": {"should": []}})  # Programme Title
-                filter_.append({"bool": {"should": []}})  # additional_data.TSGRecipientType
-                filter_.append({"bool": {"should": []}})  # simple_grant_type
-                filter_.append({"bool": {"should": []}})  # additional_data.recipientOrgInfos.primaryOrganisationType
-                filter_.append({"bool": {"should": []}})  # additional_data.GNRecipientOrgInfo0.ageWhenAwarded
-                filter_.append({"bool": {"should": []}})  # additional_data.GNRecipientOrgRegionName
-                filter_.append({"bool": {"should": []}})  # additional_data.GNRecipientOrgDistrictName
-                filter_.append({"bool": {"should": []}})  # additional_data.GNBeneficiaryRegionName
-                filter_.append({"bool": {"should": []}})  # additional_data.GNBeneficiaryDistrictName
-                filter_.append({"bool": {"should": []}})  # additional_data.GNBeneficiaryCountyName
-                filter_.append({"bool": {"should": []}})  # additional_data.GNRecipientCountyName
-                filter_.append({"bool": {"should": []}})  # additional_data.GNBestCountyName
+                filter_.extend(copy.deepcopy(BASIC_FILTER[8:]))
             json_query['aggs'] = {}
             for term_facet in TERM_FACETS:
                 json_query['aggs'][term_facet.param_name] = {"terms": {"field": term_facet.field_name,
@@ -816,27 +885,17 @@ def search(request, template_name="search.html"):
             context['text_query'] = ''
 
         try:
-            create_amount_aggregate(json_query)
-            create_date_aggregate(json_query)
-            # These aggs are currently only used for display and are not filterable in GN frontend
-            create_latest_charity_income_aggregate(json_query)
-
-            json_query['aggs'].update(SEARCH_SUMMARY_AGGREGATES)
+            add_search_aggregates(json_query)
             # Actually fetch the results from elasticsearch
             results = None
 
-            if try_cache:
-                results = cache.get("empty-query-cache")
-                if results:
-                    print("Cache hit")
+            if try_cache and result_format == "html":
+                # The results for the empty query are computed by the importer
+                results = get_search_summary("results", json_query)
 
             if not results:
                 results = get_results(json_query, results_size, (page - 1) * SIZE)
 
-                # This needs further logic to control cache set
-                # if try_cache:
-                #    cache.set("empty-query-cache", results)
-
             for key in SEARCH_SUMMARY_AGGREGATES:
                 json_query["aggs"].pop(key)
 
@@ -864,8 +923,8 @@ def search(request, template_name="search.html"):
 
         current_currency = None
         existing_currency = None
-        if json_query["query"]["bool"]["filter"][2]["bool"]["must"]:
-            existing_currency = json_query["query"]["bool"]["filter"][2]["bool"]["must"]["term"]["currency"]
+        if json_query["query"]["bool"]["filter"][AMOUNT_FIXED_FILTER]["bool"]["must"]:
+            existing_currency = json_query["query"]["bool"]["filter"][AMOUNT_FIXED_FILTER]["bool"]["must"]["term"]["currency"]
             current_currency = existing_currency
         currency_facets = context["results"]['aggregations']['currency']['buckets']
         if not current_currency and currency_facets:
@@ -887,8 +946,8 @@ def search(request, template_name="search.html"):
                     new_filter['lte'] = int(max_amount)
                 except ValueError:
                     pass
-            json_query["query"]["bool"]["filter"][3]["bool"]["should"]["range"]["amountAwarded"] = new_filter
-            json_query["query"]["bool"]["filter"][3]["bool"]["must"] = {"term": {"currency": current_currency}}
+            json_query = helpers.replace_filter(json_query, AMOUNT_RANGE_FILTER, should={"range": {"amountAwarded": new_filter}},
+                                                must={"term": {"currency": current_currency}})
             return redirect(request.path + '?' + create_parameters_from_json_query(json_query))
 
         min_date = utils.yearmonth_to_date(request.GET.get('new_min_date', ''))
@@ -905,18 +964,21 @@ def search(request, template_name="search.html"):
                     new_filter['lt'] = max_date
                 except ValueError:
                     pass
-            json_query["query"]["bool"]["filter"][9]["bool"]["should"]["range"]["awardDate"] = new_filter
+            json_query = helpers.replace_filter(json_query, DATE_RANGE_FILTER, should={"range": {"awardDate": new_filter}})
             return redirect(request.path + '?' + create_parameters_from_json_query(json_query))
 
         context['selected_facets'] = collections.defaultdict(list)
         helpers.get_clear_all(request, context, json_query, BASIC_FILTER, create_parameters_from_json_query)
 
+        facet_results = get_facet_results(context, json_query)
+
         for term_facet in TERM_FACETS:
             get_terms_facets(request, context, json_query, term_facet.field_name, term_facet.param_name,
-                             term_facet.filter_index, term_facet.display_name, BASIC_FILTER, create_parameters_from_json_query, term_facet.is_json)
+                             term_facet.filter_index, term_facet.display_name, BASIC_FILTER, create_parameters_from_json_query, term_facet.is_json,
+                             results=facet_results.get(term_facet.param_name))
 
-        get_amount_facet_fixed(request, context, json_query)
-        get_date_facets(request, context, json_query)
+        get_amount_facet_fixed(request, context, json_query, facet_results.get("amountAwardedFixed"))
+        get_date_facets(request, context, json_query, facet_results.get("awardYear"))
 
         helpers.get_pagination(request, context, page, create_parameters_from_json_query)
 
@@ -956,9 +1018,7 @@ def filter_search_ajax(request, parent_field=None, child_field=None):
     json_query['aggs'] = {}
     json_query['aggs'][parent_field] = {"terms": {"field": f'{parent_field}.{child_field}', "size": size_limit}}
 
-    new_json_query = copy.deepcopy(json_query)
-
-    new_must = [new_json_query["query"]["bool"]["must"]]
+    new_must = [json_query["query"]["bool"]["must"]]
 
     # the users search from select2
     filter_search = request.GET.get("filter_search")
@@ -975,7 +1035,8 @@ def filter_search_ajax(request, parent_field=None, child_field=None):
                 {"query": and_terms, "default_field": f"{parent_field}.{child_field}", "analyze_wildcard": True}}
         )
 
-    new_json_query["query"]["bool"]["must"] = new_must
+    query_bool = dict(json_query["query"]["bool"], must=new_must)
+    new_json_query = dict(json_query, query=dict(json_query["query"], bool=query_bool))
 
     results = get_results(new_json_query, 0)
 
@@ -987,14 +1048,14 @@ def filter_search_ajax(request, parent_field=None, child_field=None):
     # bool_index is the index # of the facet in BASIC_FILTER
     is_json = True
     if parent_field == 'fundingOrganization':
-        bool_index, display_name = 0, 'Funders'
+        bool_index, display_name = FILTER_POSITIONS['fundingOrganization'], 'Funders'
     elif parent_field == 'recipientOrganization':
-        bool_index, display_name = 1, 'Recipients'
+        bool_index, display_name = FILTER_POSITIONS['recipientOrganization'], 'Recipients'
     elif parent_field == 'grantProgramme':
-        bool_index, display_name = 10, 'Grant Programme Titles'
+        bool_index, display_name = FILTER_POSITIONS['grantProgramme'], 'Grant Programme Titles'
         is_json = False
     elif parent_field == 'additional_data':
-        bool_index, display_name = 6, 'District'
+        bool_index, display_name = FILTER_POSITIONS['recipientDistrictName'], 'District'
         is_json = False
 
     get_terms_facets(request, context, new_json_query, f'{parent_field}.{child_field}', parent_field, bool_index, display_name,
@@ -1125,6 +1186,9 @@ def get_funder_info(funder_org_ids):
 
 
 def get_recipient_funders(recipient_org_ids):
+    if has_rollups():
+        rollups, _ = get_rollups([{"terms": {"rollup.recipientOrgIds": recipient_org_ids}}])
+        return get_recipient_funders_from_rollups(rollups)
 
     # Dynamically limit the required size to the total number of possible funders
     max_funders = get_results({"query": {"match_all": {}}}, data_type='funder')['hits']['total']["value"]
@@ -1171,6 +1235,40 @@ def get_recipient_funders(recipient_org_ids):
     return results_by_currency
 
 
+def get_recipient_funders_from_rollups(rollups):
+    """ get_recipient_funders from the importer's rollup documents, ordered
+    the same way as the terms aggregations """
+    # currency -> funder id_and_name -> stats
+    stats_by_currency = collections.defaultdict(dict)
+    for rollup in rollups:
+        funders = stats_by_currency[rollup["currency"]]
+        stats = funders.get(rollup["funderIdAndName"])
+        if stats:
+            # Several of the recipient's org ids can have the same funder
+            merge_rollup_stats(stats, rollup)
+        else:
+            funders[rollup["funderIdAndName"]] = rollup_stats(rollup)
+
+    def by_count(item):
+        key, count = item
+        return -count, key
+
+    currency_counts = {currency: sum(stats["count"] for stats in funders.values())
+                       for currency, funders in stats_by_currency.items()}
+    results_by_currency = {}
+    for currency, _ in sorted(currency_counts.items(), key=by_count):
+        funders = stats_by_currency[currency]
+        funder_list = []
+        for id_and_name, _ in sorted(((key, stats["count"]) for key, stats in funders.items()), key=by_count):
+            name, org_id = json.loads(id_and_name)
+            funder = {"name": name, "org_id": org_id}
+            funder.update(funders[id_and_name])
+            funder_list.append(funder)
+        results_by_currency[currency] = funder_list
+
+    return results_by_currency
+
+
 def org(request, org_id):
 
     org_query = {
@@ -1262,6 +1360,102 @@ def org(request, org_id):
     return render(request, "org.html", context=context)
 
 
+ROLLUP_STATS = ["count", "min", "max", "avg", "sum"]
+
+# Rollups further down than this are fetched with scan rather than from/size
+ROLLUP_MAX_RESULT_WINDOW = 10000
+
+# (index, generation, whether it has rollups), see has_rollups
+rollups_generation = (None, None, False)
+
+
+def rollup_sort(term_field, order_field, order_dir):
+    """ The rollup sort for a datatables order field e.g. "recipient_stats.sum" """
+    if order_field == "_term":
+        field = term_field
+    else:
+        field = order_field.split(".")[-1]
+    return [{"rollup." + field: order_dir}, {"rollup." + term_field: "asc"}]
+
+
+def rollup_stats(rollup):
+    """ The stats of a rollup, like a stats aggregation """
+    return {stat: rollup[stat] for stat in ROLLUP_STATS}
+
+
+def merge_rollup_stats(stats, rollup):
+    """ Add a rollup's stats to stats, e.g. the stats of another rollup for the
+    same org. min/max/avg are None, like a stats aggregation's, for no
+    amounts. """
+    stats["count"] += rollup["count"]
+    stats["sum"] += rollup["sum"]
+    for stat, pick in [("min", min), ("max", max)]:
+        values = [value for value in (stats[stat], rollup[stat]) if value is not None]
+        stats[stat] = pick(values) if values else None
+    stats["avg"] = stats["sum"] / stats["count"] if stats["count"] else None
+
+
+def merged_recipient_stats(rollups, order_field, order_dir):
+    """ The (recipient id_and_name, stats) of rollups, merging the rollups of
+    the same recipient from different funder id_and_names, ordered like
+    rollup_sort """
+    stats_by_recipient = {}
+    for rollup in rollups:
+        stats = stats_by_recipient.get(rollup["recipientIdAndName"])
+        if stats:
+            merge_rollup_stats(stats, rollup)
+        else:
+            stats_by_recipient[rollup["recipientIdAndName"]] = rollup_stats(rollup)
+
+    buckets = sorted(stats_by_recipient.items())
+    if order_field == "_term":
+        return buckets[::-1] if order_dir == "desc" else buckets
+    # Stats that are None go last either way, as elasticsearch sorts them
+    field = order_field.split(".")[-1]
+    missing = [bucket for bucket in buckets if bucket[1][field] is None]
+    buckets = sorted((bucket for bucket in buckets if bucket[1][field] is not None),
+                     key=lambda bucket: bucket[1][field], reverse=order_dir == "desc")
+    return buckets + missing
+
+
+def rollup_funders(filters):
+    """ The number of funder id_and_names (up to 2) with rollups that match """
+    query = {"query": {"bool": {"filter": list(filters)}},
+             "aggs": {"funders": {"terms": {"field": "rollup.funderIdAndName", "size": 2}}}}
+    return len(get_results(query, 0, data_type="rollup")["aggregations"]["funders"]["buckets"])
+
+
+def has_rollups():
+    """ Whether the index has the importer's rollup documents. Indexes loaded
+    before rollups don't. Checked once per index generation. """
+    global rollups_generation
+    index, generation = get_index(), get_index_generation()
+    cached_index, cached_generation, rollups = rollups_generation
+    if (cached_index, cached_generation) != (index, generation):
+        rollups = get_results({"query": {"match_all": {}}}, 0, data_type="rollup")["hits"]["total"]["value"] > 0
+        rollups_generation = (index, generation, rollups)
+    return rollups
+
+
+def get_rollups(filters, must=None, sort=None, start=0, length=ROLLUP_MAX_RESULT_WINDOW):
+    """ The funder -> recipient rollup documents made by the importer (see
+    build_rollups) that match, and the total number that match. Check
+    has_rollups first. """
+    query = {"query": {"bool": {"filter": list(filters), "must": must or {}}}, "sort": sort or []}
+
+    if start + length <= ROLLUP_MAX_RESULT_WINDOW:
+        results = get_results(query, length, start, data_type="rollup")
+        hits = results["hits"]["hits"]
+        total = results["hits"]["total"]["value"]
+    else:
+        query["query"]["bool"]["filter"].append({"term": {"dataType": "rollup"}})
+        hits = list(scan(get_es(), helpers.clean_for_es(query), index=get_index(), preserve_order=True))
+        total = len(hits)
+        hits = hits[start:start + length]
+
+    return [hit["_source"]["rollup"] for hit in hits], total
+
+
 def funder_recipients_datatables(request):
     # Make 100k the default max length. Overrideable by setting ?length= parameter
     MAX_DEFAULT_FUNDER_RECIPIENTS_LENGTH = 500000
@@ -1300,37 +1494,59 @@ def funder_recipients_datatables(request):
     if not currency:
         currency = 'GBP'
 
-    query = {"query": {
-             "bool": {
-                 "filter":
-                     [filter, {"term": {"currency": currency}}],
-                 "must":
-                     {"match": {"recipientOrganization.name": {"query": search_value, "operator": "and"}}},
+    if funder_id and has_rollups():
+        filters = [{"terms": {"rollup.fundingOrgIds": funder_id}}, {"term": {"rollup.currency": currency}}]
+        # Rollups are searched by the recipient's canonical name
+        must = {"match": {"rollup.recipientName": {"query": search_value, "operator": "and"}}} if search_value else {}
+        if rollup_funders(filters) > 1:
+            # The funder's grants have several id_and_names, e.g. grants from
+            # org ids without an org, so a recipient can have a rollup from
+            # each of them. These are merged before sorting and paging.
+            rollups, _ = get_rollups(filters, must, start=0, length=sys.maxsize)
+            buckets = merged_recipient_stats(rollups, order_field, order_dir)
+            records_total = len(buckets)
+            buckets = buckets[start:start + length]
+        else:
+            rollups, records_total = get_rollups(filters, must, rollup_sort("recipientIdAndName", order_field, order_dir),
+                                                 start, length)
+            buckets = [(rollup["recipientIdAndName"], rollup_stats(rollup)) for rollup in rollups]
+    else:
+        query = {"query": {
+                 "bool": {
+                     "filter":
+                         [filter, {"term": {"currency": currency}}],
+                     "must":
+                         {"match": {"recipientOrganization.name": {"query": search_value, "operator": "and"}}},
+                     },
                  },
-             },
-             "aggs": {
-                 "recipient_count": {"cardinality": {"field": "recipientOrganization.id", "precision_threshold": 40000}},
-                 "recipient_stats":
-                     {"terms": {"field": "recipientOrganization.id_and_name", "size": start + length, "shard_size": (start + length) * 10,
-                                "order": {order_field: order_dir}},
-                      "aggs": {"recipient_stats": {"stats": {"field": "amountAwarded"}}}}
+                 "aggs": {
+                     "recipient_count": {"cardinality": {"field": "recipientOrganization.id", "precision_threshold": 40000}},
+                     "recipient_stats":
+                         {"terms": {"field": "recipientOrganization.id_and_name", "size": start + length, "shard_size": (start + length) * 10,
+                                    "order": {order_field: order_dir}},
+                          "aggs": {"recipient_stats": {"stats": {"field": "amountAwarded"}}}}
+            }
         }
-    }
-    if not search_value:
-        query["query"]["bool"].pop("must")
+        if not search_value:
+            query["query"]["bool"].pop("must")
+
+        results = get_results(query, 1)
+        buckets = [(result["key"], result["recipient_stats"]) for result in results["aggregations"]["recipient_stats"]["buckets"][-length:]]
+        records_total = results["aggregations"]["recipient_count"]["value"]
 
-    results = get_results(query, 1)
     result_list = []
 
-    for result in results["aggregations"]["recipient_stats"]["buckets"][-length:]:
-        stats = result["recipient_stats"]
+    for id_and_name, stats in buckets:
         for key in list(stats):
             if key != 'count':
-                if result_format == "ajax":
+                if stats[key] is None:
+                    # A recipient whose grants have no amounts
+                    stats[key] = ""
+                elif result_format == "ajax":
                     stats[key] = "{}{:,.0f}".format(utils.currency_prefix(currency), int(stats[key]))
                 else:
                     stats[key] = "{:.0f}".format(int(stats[key]))
-        org_name, org_id = json.loads(result["key"])
+        org_name, org_id = json.loads(id_and_name)
         stats["org_name"] = org_name
         stats["org_id"] = org_id
         result_list.append(stats)
@@ -1339,8 +1555,8 @@ def funder_recipients_datatables(request):
         return JsonResponse(
             {'data': result_list,
              'draw': request.GET['draw'],
-             'recordsTotal': results["aggregations"]["recipient_count"]["value"],
-             'recordsFiltered': results["aggregations"]["recipient_count"]["value"]}
+             'recordsTotal': records_total,
+             'recordsFiltered': records_total}
         )
     elif result_format == "csv":
         return orgs_csv_paged(result_list, "recipient")
@@ -1576,7 +1792,23 @@ def district(request, district):
 def get_funders_for_datasets(datasets):
     es = get_es()
 
+    # The importer stores the top funders of each file in a dataset document,
+    # so this is one query for all the datasets
+    filenames = [dataset['identifier'] + '.json' for dataset in datasets]
+    query = {"query": {"bool": {"filter": [
+        {"term": {"dataType": "dataset"}},
+        {"terms": {"filename": filenames}},
+    ]}}}
+    results = es.search(body=query, index=get_index(), size=len(filenames), _source=["filename", "datasetStats"])
+    dataset_stats = {hit['_source']['filename']: hit['_source']['datasetStats'] for hit in results['hits']['hits']}
+
     for dataset in datasets:
+        stats = dataset_stats.get(dataset['identifier'] + '.json')
+        if stats:
+            dataset['funders'] = [json.loads(id_and_name) for id_and_name in stats['funders']]
+            continue
+
+        # Indexes loaded before the dataset documents were added
         query = {"query": {"bool": {
             "filter": [{"term": {"filename": dataset['identifier'] + '.json'}}]}},
             "aggs": {
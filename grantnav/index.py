@@ -1,4 +1,17 @@
 import os
+import time
+
+import elasticsearch.exceptions
+from django.conf import settings
+
+from grantnav.search import get_es
+
+# The importer stores a new generation in this document at the end of every
+# import, so that anything cached from the index can tell it has changed
+INDEX_GENERATION_ID = "index-generation"
+
+# (index, generation, time.monotonic() it was read), see get_index_generation
+index_generation = (None, None, 0)
 
 
 def get_index():
@@ -11,3 +24,30 @@ def get_index():
             return str(es_indexfp.read()).strip()
     else:
         return str(es_index)
+
+
+def forget_index_generation():
+    """ Read the generation from the index on the next get_index_generation,
+    e.g. after storing a new one """
+    global index_generation
+    index_generation = (None, None, 0)
+
+
+def get_index_generation():
+    """ The generation of the index's contents. It changes after each import
+    and when the ES_INDEX alias is switched to a new index. It is read from the
+    index at most every INDEX_GENERATION_TTL seconds. Indexes loaded before
+    generations were stored have the generation "". """
+    global index_generation
+    index = get_index()
+    cached_index, generation, read_at = index_generation
+    if cached_index == index and time.monotonic() - read_at < settings.INDEX_GENERATION_TTL:
+        return generation
+
+    try:
+        generation = get_es().get(index=index, id=INDEX_GENERATION_ID,
+                                  _source_includes=["generation"])["_source"]["generation"]
+    except elasticsearch.exceptions.NotFoundError:
+        generation = ""
+    index_generation = (index, generation, time.monotonic())
+    return generation
@@ -9,6 +9,7 @@ from prometheus_client.exposition import generate_latest
 from grantnav.index import get_index
 
 from grantnav.frontend.views import totals_query
+from grantnav.frontend.org_utils import orgs_cache
 
 NUM_ERRORS_LOGGED = Gauge(
     "total_import_errors_logged", "Total number of errors logged by last import"
@@ -18,6 +19,10 @@ TOTAL_GRANTS = Gauge(
     "total_grants", "Total number of grants in the system"
 )
 
+ORG_CACHE = Gauge(
+    "org_cache", "Size, hits, misses and evictions of this process's org cache", ["org_type", "stat"]
+)
+
 
 class ServiceMetrics(View):
     def _num_errors_log(self):
@@ -45,9 +50,15 @@ class ServiceMetrics(View):
 
         TOTAL_GRANTS.set(results['grants']['value'])
 
+    def _org_cache(self):
+        for org_type, cache in orgs_cache.items():
+            for stat, value in cache.stats().items():
+                ORG_CACHE.labels(org_type, stat).set(value)
+
     def get(self, *args, **kwargs):
         # Update gauges
         self._num_errors_log()
         self._total_grants()
+        self._org_cache()
         # Generate latest uses default of the global registry
         return HttpResponse(generate_latest(), content_type="text/plain")
@@ -33,6 +33,10 @@ env = environ.Env(  # set default values and casting
     GRANT_SCHEMA=(str, 'https://raw.githubusercontent.com/ThreeSixtyGiving/standard/master/schema/360-giving-schema.json'),
     DB_NAME=(str, os.path.join(BASE_DIR, 'db.sqlite3')),
     PROVENANCE_JSON=(str, None),
+    ORG_TABLE_PATH=(str, None),
+    ORG_CACHE_SIZE=(int, 300000),
+    INDEX_GENERATION_TTL=(int, 10),
+    RESULTS_CACHE_TIMEOUT=(int, 3600),
     ELASTICSEARCH_HOST=(str, 'localhost'),
     INSIGHTS_BASE_URL=(str, "https://grantvis.threesixtygiving.org")
 )
@@ -69,6 +73,21 @@ FLATTENED_DOWNLOAD_LIMIT = 10000
 
 PROVENANCE_JSON = env('PROVENANCE_JSON')
 
+# Org table written by the importer's --org-table, for looking up orgs without
+# searching elasticsearch. See grantnav/frontend/org_table.py
+ORG_TABLE_PATH = env('ORG_TABLE_PATH')
+
+# Number of orgs of each type cached by each process
+ORG_CACHE_SIZE = env('ORG_CACHE_SIZE')
+
+# Seconds between checks for a new index generation (see grantnav/index.py) or
+# a new org table
+INDEX_GENERATION_TTL = env('INDEX_GENERATION_TTL')
+
+# Seconds that search results are cached for, 0 to not cache them. See
+# get_results in grantnav/frontend/search_helpers.py
+RESULTS_CACHE_TIMEOUT = env('RESULTS_CACHE_TIMEOUT')
+
 # Application definition
 
 INSTALLED_APPS = (